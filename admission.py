@@ -0,0 +1,182 @@
+"""Admission control and priority scheduling for request handlers.
+
+At most ``slots`` requests hold a slot at once. Bulk jobs may use at most
+``class_slots["bulk"]`` of them, so they never take every slot. The rest
+wait in one queue ordered by class (interactive, then api, then bulk) and
+arrival. A request is shed with 503 and Retry-After when:
+
+* the queue is full and nobody queued has a lower priority to push out
+  (a displaced waiter gets the 503 instead);
+* its expected wait already exceeds the class's ``max_wait``;
+* it is still queued when ``max_wait`` runs out.
+
+The expected wait is the number of requests queued ahead times the
+class's average slot hold time, divided by the slots it can use. With
+``client_limit`` set, a client with that many requests running or queued
+gets 429 until one ends.
+"""
+import itertools
+import math
+import threading
+import time
+from collections import Counter
+
+from providers import LATENCY_BUCKETS, LatencyHistogram
+
+CLASSES = ("interactive", "api", "bulk")  # highest priority first
+MAX_WAIT = {"interactive": 2.0, "api": 5.0, "bulk": 10.0}
+WAIT_BUCKETS = (0.001, 0.005) + LATENCY_BUCKETS
+OUTCOMES = ("admitted", "queued", "queue_full", "displaced", "deadline", "timeout", "client_limit")
+
+
+class Rejected(Exception):
+    """A request that was not admitted, with the HTTP status and Retry-After to send"""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("priority", "client", "order", "granted", "rejected", "released", "queued_at", "started_at")
+
+    def __init__(self, priority, client, order):
+        self.priority = priority
+        self.client = client
+        self.order = order
+        self.granted = False
+        self.rejected = None
+        self.released = False
+        self.queued_at = time.monotonic()
+        self.started_at = None
+
+    def sort_key(self):
+        return CLASSES.index(self.priority), self.order
+
+
+class Admission:
+    """Bounded slots with a priority queue in front of them"""
+
+    def __init__(self, slots=16, queue_size=64, max_wait=None, class_slots=None, client_limit=0,
+                 smoothing=0.2):
+        self.slots = slots
+        self.queue_size = queue_size
+        self.max_wait = dict(MAX_WAIT, **(max_wait or {}))
+        self.class_slots = {priority: slots for priority in CLASSES}
+        self.class_slots.update(class_slots or {})
+        self.client_limit = client_limit
+        self.smoothing = smoothing
+        self._cond = threading.Condition()
+        self._orders = itertools.count()
+        self._queue = []  # waiting tickets, highest priority first
+        self._running = dict.fromkeys(CLASSES, 0)
+        self._clients = Counter()
+        self._hold = dict.fromkeys(CLASSES)  # average seconds a slot is held
+        self._counts = {priority: dict.fromkeys(OUTCOMES, 0) for priority in CLASSES}
+        self._waits = {priority: LatencyHistogram(WAIT_BUCKETS) for priority in CLASSES}
+
+    def _grant(self):
+        """Hand free slots to the first queued tickets allowed to run"""
+        for ticket in list(self._queue):
+            if sum(self._running.values()) >= self.slots:
+                break
+            if self._running[ticket.priority] >= self.class_slots[ticket.priority]:
+                continue
+            self._queue.remove(ticket)
+            self._running[ticket.priority] += 1
+            ticket.granted = True
+        self._cond.notify_all()
+
+    def _expected_wait(self, ticket):
+        hold = self._hold[ticket.priority]
+        if hold is None:
+            return 0.0
+        ahead = self._queue.index(ticket)
+        return (ahead + 1) * hold / min(self.slots, self.class_slots[ticket.priority])
+
+    def _reject(self, ticket, reason, status=503, retry_after=1):
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+        if ticket.client is not None:
+            self._clients[ticket.client] -= 1
+            if not self._clients[ticket.client]:
+                del self._clients[ticket.client]
+        self._counts[ticket.priority][reason] += 1
+        return Rejected(reason, status, max(1, math.ceil(retry_after)))
+
+    def acquire(self, priority, client=None):
+        """Wait for a slot; returns a ticket for release() or raises Rejected"""
+        with self._cond:
+            if client is not None and self.client_limit and self._clients[client] >= self.client_limit:
+                self._counts[priority]["client_limit"] += 1
+                raise Rejected("client_limit", 429, 1)
+            ticket = Ticket(priority, client, next(self._orders))
+            if client is not None:
+                self._clients[client] += 1
+            self._queue.append(ticket)
+            self._queue.sort(key=Ticket.sort_key)
+            self._grant()
+
+            if not ticket.granted:
+                self._counts[priority]["queued"] += 1
+                if len(self._queue) > self.queue_size:
+                    last = self._queue[-1]
+                    if last is ticket:
+                        raise self._reject(ticket, "queue_full", retry_after=self.max_wait[priority])
+                    self._queue.remove(last)
+                    last.rejected = "displaced"
+                    self._cond.notify_all()
+                expected = self._expected_wait(ticket)
+                if expected > self.max_wait[priority]:
+                    raise self._reject(ticket, "deadline", retry_after=expected)
+
+                deadline = ticket.queued_at + self.max_wait[priority]
+                while not ticket.granted:
+                    if ticket.rejected is not None:
+                        raise self._reject(ticket, ticket.rejected, retry_after=self.max_wait[priority])
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject(ticket, "timeout", retry_after=self._expected_wait(ticket))
+                    self._cond.wait(remaining)
+
+            self._counts[priority]["admitted"] += 1
+        ticket.started_at = time.monotonic()
+        self._waits[priority].observe(ticket.started_at - ticket.queued_at)
+        return ticket
+
+    def release(self, ticket):
+        """Free the ticket's slot; releasing it again does nothing"""
+        held = time.monotonic() - ticket.started_at
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._running[ticket.priority] -= 1
+            if ticket.client is not None:
+                self._clients[ticket.client] -= 1
+                if not self._clients[ticket.client]:
+                    del self._clients[ticket.client]
+            previous = self._hold[ticket.priority]
+            self._hold[ticket.priority] = held if previous is None else (
+                previous + self.smoothing * (held - previous)
+            )
+            self._grant()
+
+    def wait_histograms(self):
+        return dict(self._waits)
+
+    def stats(self):
+        with self._cond:
+            queued = Counter(ticket.priority for ticket in self._queue)
+            return {
+                priority: dict(
+                    self._counts[priority],
+                    running=self._running[priority],
+                    waiting=queued[priority],
+                    avg_hold_seconds=round(self._hold[priority] or 0.0, 4),
+                    p95_wait_seconds=self._waits[priority].percentile(95),
+                )
+                for priority in CLASSES
+            }
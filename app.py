@@ -1,53 +1,333 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 import requests
+import json
 import logging
 import time
 from functools import wraps
 from dotenv import load_dotenv
 import os
 import ipaddress
+import threading
+import atexit
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
 
 load_dotenv(dotenv_path=".env")
-print("DEBUG ENV KEY:", os.getenv("OPENWEATHER_API_KEY"))
+
+# Local modules read their settings from the environment at import time
+import admission
+import batch
+import classify
+import clientip
+import cluster
+import geohash
+import geoip
+import hotkeys
+import http_client
+import metrics
+import providers
+import ratelimit
+import rdns
+from prefixcache import PrefixCache
+from cache import (
+    CachedFailure, SingleFlight, TTLCache, create_cache, entry_state, entry_value, make_entry
+)
 
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-_cache = {}
+# CACHE_BACKEND picks where cache_result stores results: "memory" (per
+# process), "sqlite" (a file shared by local workers) or "redis" (any
+# Redis-protocol server). The latter two survive restarts.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+try:
+    _cache = create_cache(
+        CACHE_BACKEND,
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 10000)),
+        max_bytes=int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        path=os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3"),
+        url=os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+        prefix=os.getenv("CACHE_REDIS_PREFIX", "ipinfo:"),
+        compact=os.getenv("CACHE_COMPACT", "1") == "1",
+    )
+except Exception as e:
+    logger.error(f"Could not start {CACHE_BACKEND} cache backend, using memory: {e}")
+    _cache = TTLCache(
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 10000)),
+        max_bytes=int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        compact=os.getenv("CACHE_COMPACT", "1") == "1",
+    )
 _cache_timeout = 300  
 
-def cache_result(timeout=300):
-    """Decorator to cache function results"""
+# Concurrent misses for the same key share a single upstream call
+_flights = SingleFlight()
+
+# Stale entries are served at once and refreshed on these threads
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CACHE_REFRESH_WORKERS", 4)),
+    thread_name_prefix="cache-refresh",
+)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_revalidation = {"stale_served": 0, "refreshes": 0, "refresh_errors": 0, "negative_hits": 0}
+
+# By default an entry may be served stale for up to CACHE_STALE_FACTOR
+# times its fresh TTL, and failed calls are remembered for CACHE_NEGATIVE_TTL.
+CACHE_STALE_FACTOR = float(os.getenv("CACHE_STALE_FACTOR", 4))
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", 30))
+
+# Every cache_result call is counted in a bounded sketch of hot keys. With
+# CACHE_WARMER=1 a background thread refreshes the hottest entries shortly
+# before they go stale, leaving CACHE_WARM_RESERVE rate-limit tokens per
+# provider for live traffic.
+CACHE_WARMER = os.getenv("CACHE_WARMER", "0") == "1"
+CACHE_WARM_INTERVAL = float(os.getenv("CACHE_WARM_INTERVAL", 15))
+CACHE_WARM_LEAD = float(os.getenv("CACHE_WARM_LEAD", 30))
+CACHE_WARM_MIN_HITS = int(os.getenv("CACHE_WARM_MIN_HITS", 3))
+CACHE_WARM_RESERVE = float(os.getenv("CACHE_WARM_RESERVE", 2))
+_hot_keys = hotkeys.HotKeys(capacity=int(os.getenv("CACHE_HOT_KEYS", 200)))
+_hot_ips = hotkeys.HotKeys(capacity=int(os.getenv("CACHE_HOT_KEYS", 200)))
+_cached_functions = {}
+_warmed = {}  # cache key -> when the entry it replaced would have gone stale
+_warming = {"warmed": 0, "prevented_misses": 0, "skipped_budget": 0, "errors": 0, "prewarmed": 0}
+_warming_lock = threading.Lock()
+
+# Cluster mode: list every instance's base URL in CLUSTER_NODES (the same
+# list on each node) and this instance's own URL in CLUSTER_SELF. Each cache
+# key is then fetched upstream by the CLUSTER_REPLICAS nodes that own it on a
+# consistent-hash ring; see cluster.py. CLUSTER_SECRET is required: it must
+# match on every node and guards the internal endpoint.
+CLUSTER_NODES = [node for node in os.getenv("CLUSTER_NODES", "").split(",") if node.strip()]
+CLUSTER_SELF = os.getenv("CLUSTER_SELF")
+CLUSTER_REPLICAS = int(os.getenv("CLUSTER_REPLICAS", 2))
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", 64))
+CLUSTER_TIMEOUT = float(os.getenv("CLUSTER_TIMEOUT", 12))
+CLUSTER_SECRET = os.getenv("CLUSTER_SECRET")
+_cluster = None
+if CLUSTER_NODES and CLUSTER_SELF and not CLUSTER_SECRET:
+    logger.error("Cluster mode disabled: CLUSTER_SECRET is not set")
+elif CLUSTER_NODES and CLUSTER_SELF:
+    _cluster = cluster.Cluster(
+        CLUSTER_SELF, CLUSTER_NODES, replicas=CLUSTER_REPLICAS, vnodes=CLUSTER_VNODES,
+        timeout=CLUSTER_TIMEOUT, secret=CLUSTER_SECRET,
+    )
+
+
+def make_cache_key(name, args=(), kwargs=None):
+    return f"{name}_{str(tuple(args))}_{str(kwargs or {})}"
+
+
+def _count_revalidation(counter):
+    with _refreshing_lock:
+        _revalidation[counter] += 1
+
+
+def _count_warming(counter, count=1):
+    with _warming_lock:
+        _warming[counter] += count
+
+
+def _warmed_hit(cache_key, fresh):
+    """Settle a key refreshed by the warmer on its next read"""
+    with _warming_lock:
+        stale_at = _warmed.pop(cache_key, None)
+        if stale_at is not None and fresh and time.time() >= stale_at:
+            _warming["prevented_misses"] += 1
+
+
+def cache_result(timeout=300, hard_timeout=None, negative_timeout=None, providers=(), clustered=True):
+    """Decorator to cache function results
+
+    Results are fresh for ``timeout`` seconds. After that they are still
+    served, while a background refresh runs, until ``hard_timeout``
+    (CACHE_STALE_FACTOR x timeout by default). A None result or an exception
+    is cached for ``negative_timeout`` seconds; during that window None is
+    returned again, or CachedFailure raised, without calling upstream.
+
+    Each can be overridden per function with CACHE_TTL_<FUNCTION_NAME>,
+    CACHE_HARD_TTL_<FUNCTION_NAME> and CACHE_NEGATIVE_TTL_<FUNCTION_NAME>,
+    e.g. CACHE_TTL_GET_WHOIS_INFO=600.
+
+    ``providers`` names the rate-limited upstreams func calls; the cache
+    warmer only refreshes it while they have budget to spare. In cluster
+    mode misses are fetched by the node owning the key, unless
+    ``clustered`` is False (for results that differ per node).
+    """
     def decorator(func):
+        name = func.__name__.upper()
+        ttl = float(os.getenv(f"CACHE_TTL_{name}", timeout))
+        hard_ttl = float(os.getenv(
+            f"CACHE_HARD_TTL_{name}",
+            ttl * CACHE_STALE_FACTOR if hard_timeout is None else hard_timeout
+        ))
+        negative_ttl = float(os.getenv(
+            f"CACHE_NEGATIVE_TTL_{name}",
+            CACHE_NEGATIVE_TTL if negative_timeout is None else negative_timeout
+        ))
+
+        def store(cache_key, result, error=None):
+            negative = result is None or error is not None
+            try:
+                if negative:
+                    if negative_ttl > 0:
+                        _cache.set(cache_key, make_entry(result, negative_ttl, error), negative_ttl)
+                else:
+                    _cache.set(cache_key, make_entry(result, ttl), max(hard_ttl, ttl))
+            except Exception as e:
+                logger.warning(f"Cache write failed for {func.__name__}: {e}")
+
+        def load(cache_key, args, kwargs):
+            # A flight that just finished may have refreshed the cache
+            # between our read and becoming the leader.
+            try:
+                found, entry = _cache.get(cache_key, record=False)
+                if found and entry_state(entry) == "fresh":
+                    return entry_value(entry)
+            except CachedFailure:
+                raise
+            except Exception:
+                pass
+            return fetch(cache_key, args, kwargs)
+
+        def fetch(cache_key, args, kwargs):
+            try:
+                if _cluster is not None and clustered and not kwargs:
+                    result = _cluster.call(cache_key, func.__name__, args, lambda: func(*args))
+                else:
+                    result = func(*args, **kwargs)
+            except ratelimit.ProviderUnavailable:
+                raise  # nothing was asked upstream, so nothing to remember
+            except Exception as e:
+                store(cache_key, None, http_client.describe_error(e))
+                raise
+            store(cache_key, result)
+            return result
+
+        def refresh(cache_key, args, kwargs):
+            try:
+                _flights.do(cache_key, lambda: load(cache_key, args, kwargs), namespace=func.__name__)
+                _count_revalidation("refreshes")
+            except Exception as e:
+                _count_revalidation("refresh_errors")
+                logger.warning(f"Background refresh failed for {func.__name__}: {http_client.describe_error(e)}")
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(cache_key)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            cache_key = f"{func.__name__}_{str(args)}_{str(kwargs)}"
-            current_time = time.time()
-            
-            if cache_key in _cache:
-                cached_time, cached_result = _cache[cache_key]
-                if current_time - cached_time < timeout:
-                    logger.info(f"Returning cached result for {func.__name__}")
-                    return cached_result
-            
-            result = func(*args, **kwargs)
-            _cache[cache_key] = (current_time, result)
-            
-            keys_to_remove = []
-            for key, (cache_time, _) in _cache.items():
-                if current_time - cache_time > timeout:
-                    keys_to_remove.append(key)
-            
-            for key in keys_to_remove:
-                del _cache[key]
-            
-            return result
+            cache_key = make_cache_key(func.__name__, args, kwargs)
+            if not kwargs:
+                _hot_keys.record(cache_key, (func.__name__, args))
+
+            try:
+                found, entry = _cache.get(cache_key, namespace=func.__name__)
+            except Exception as e:
+                logger.warning(f"Cache read failed for {func.__name__}: {e}")
+                found = False
+            state = entry_state(entry) if found else None
+            if _warmed:
+                _warmed_hit(cache_key, state == "fresh")
+
+            if state == "fresh":
+                logger.info(f"Returning cached result for {func.__name__}")
+                if entry.get("error") is not None or entry["value"] is None:
+                    _count_revalidation("negative_hits")
+                return entry_value(entry)
+
+            if state == "stale":
+                with _refreshing_lock:
+                    start = cache_key not in _refreshing
+                    _refreshing.add(cache_key)
+                    _revalidation["stale_served"] += 1
+                if start:
+                    _refresh_executor.submit(refresh, cache_key, args, kwargs)
+                logger.info(f"Returning stale result for {func.__name__} while refreshing")
+                return entry_value(entry)
+
+            return _flights.do(cache_key, lambda: load(cache_key, args, kwargs), namespace=func.__name__)
+
+        def warm(*args):
+            """Fetch and store a new result now, even if the cached one is fresh"""
+            cache_key = make_cache_key(func.__name__, args, {})
+            return _flights.do(cache_key, lambda: fetch(cache_key, args, {}), namespace=func.__name__)
+
+        wrapper.warm = warm
+        wrapper.cache_providers = tuple(providers)
+        wrapper.clustered = clustered
+        _cached_functions[func.__name__] = wrapper
+        wrapper.cache_ttl = ttl
+        wrapper.cache_hard_ttl = max(hard_ttl, ttl)
+        wrapper.cache_negative_ttl = negative_ttl
         return wrapper
     return decorator
 
 
+# PREFIX_CACHE=1 lets addresses in the same /24 (IPv4) or /48 (IPv6) share
+# geo and WHOIS results; see prefixcache.py for the accuracy safeguards.
+PREFIX_CACHE = os.getenv("PREFIX_CACHE", "0") == "1"
+_prefix_caches = {}
+
+
+def prefix_cache(name):
+    """The PrefixCache for a function name, or None when the tier is off"""
+    if not PREFIX_CACHE:
+        return None
+    cache = _prefix_caches.get(name)
+    if cache is None:
+        cache = _prefix_caches.setdefault(name, PrefixCache(
+            v4_prefix=int(os.getenv("PREFIX_CACHE_V4", 24)),
+            v6_prefix=int(os.getenv("PREFIX_CACHE_V6", 48)),
+            ttl=float(os.getenv("PREFIX_CACHE_TTL", 3600)),
+            max_entries=int(os.getenv("PREFIX_CACHE_MAX_ENTRIES", 50000)),
+            verify_every=int(os.getenv("PREFIX_CACHE_VERIFY_EVERY", 100)),
+        ))
+    return cache
+
+
+def prefix_cached(func):
+    """Decorator answering func(ip) from results cached for the surrounding range
+
+    Results may carry the provider's announced block under "network".
+    """
+    @wraps(func)
+    def wrapper(ip):
+        cache = prefix_cache(func.__name__)
+        if cache is None:
+            return func(ip)
+        found, result = cache.get(ip)
+        if found:
+            logger.info(f"Returning prefix-cached result for {func.__name__}")
+            return result
+        result = func(ip)
+        if isinstance(result, dict):
+            cache.put(ip, result, result.get("network"))
+        return result
+    return wrapper
+
+
+# RDNS=1 adds the address's PTR record as "hostname". Queries go to
+# RDNS_NAMESERVER (default: the system resolver) from a background event
+# loop, so they overlap the geo and WHOIS stages instead of adding to them.
+RDNS = os.getenv("RDNS", "0") == "1"
+_resolver = rdns.Resolver(
+    nameserver=os.getenv("RDNS_NAMESERVER"),
+    timeout=float(os.getenv("RDNS_TIMEOUT", 1.0)),
+    concurrency=int(os.getenv("RDNS_CONCURRENCY", 64)),
+    negative_ttl=float(os.getenv("RDNS_NEGATIVE_TTL", 300)),
+    max_ttl=float(os.getenv("RDNS_MAX_TTL", 86400)),
+    max_entries=int(os.getenv("RDNS_CACHE_SIZE", 10000)),
+)
+
+
+def wants_hostname(ip):
+    """True when a PTR lookup should be made for ip"""
+    return RDNS and not is_offline() and clientip.is_public(ip)
+
+
 def validate_ip_address(ip):
     """Validate if the provided string is a valid IP address"""
     try:
@@ -57,28 +337,65 @@ def validate_ip_address(ip):
         return False
 
 
-@cache_result(timeout=300)
+# Upstream endpoints, shared by the sync app and the async server (asgi.py)
+WHOIS_URL = "https://ipwhois.app/json/{ip}"
+IPAPI_URL = "https://ipapi.co/{ip}/json/"
+IP_API_URL = "http://ip-api.com/json/{ip}?fields={fields}"
+IP_API_BATCH_URL = "http://ip-api.com/batch?fields={fields}"
+IPINFO_URL = "https://ipinfo.io/{ip}/json"
+WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather?lat={lat:.4f}&lon={lon:.4f}&appid={key}&units=metric"
+IPIFY_V4_URL = "https://api.ipify.org?format=json"
+IPIFY_V6_URL = "https://api64.ipify.org?format=json"
+
+
+def parse_whois(data):
+    if data.get("success", True):
+        return {
+            "owner": data.get("org", "Unknown"),
+            "isp": data.get("isp", "Unknown"),
+            "asn": data.get("asn", "Unknown"),
+            "asn_org": data.get("asn_org", "Unknown"),
+            "type": data.get("type", "Unknown")
+        }
+    return None
+
+
+def parse_ipapi(data):
+    if 'error' not in data:
+        return {
+            "city": data.get("city"),
+            "region": data.get("region"),
+            "country_name": data.get("country_name"),
+            "org": data.get("org"),
+            "isp": data.get("org"),
+            "asn": data.get("asn"),
+            "latitude": data.get("latitude"),
+            "longitude": data.get("longitude"),
+            "timezone": data.get("timezone"),
+            "postal": data.get("postal"),
+            "connection_type": data.get("connection_type"),
+            "threat_level": data.get("threat_level"),
+            "network": data.get("network")
+        }
+    return None
+
+
+@prefix_cached
+@cache_result(timeout=300, providers=("ipwhois",))
 def get_whois_info(ip):
     """Get WHOIS information for an IP address with rate limiting"""
     try:
         logger.info(f"Fetching WHOIS data for {ip}")
-        whois_url = f"https://ipwhois.app/json/{ip}"
-        response = requests.get(whois_url, timeout=8)
+        response = http_client.get("ipwhois", WHOIS_URL.format(ip=ip))
         
         if response.status_code == 200:
-            data = response.json()
-            if data.get("success", True):
-                return {
-                    "owner": data.get("org", "Unknown"),
-                    "isp": data.get("isp", "Unknown"),
-                    "asn": data.get("asn", "Unknown"),
-                    "asn_org": data.get("asn_org", "Unknown"),
-                    "type": data.get("type", "Unknown")
-                }
+            return parse_whois(response.json())
         elif response.status_code == 429:
             logger.warning("WHOIS API rate limit exceeded")
             return None
         
+    except ratelimit.ProviderUnavailable:
+        raise  # rejected locally: nothing to remember in the cache
     except requests.exceptions.Timeout:
         logger.warning("WHOIS lookup timed out")
     except Exception as e:
@@ -87,31 +404,16 @@ def get_whois_info(ip):
     return None
 
 
-@cache_result(timeout=300)
+@prefix_cached
+@cache_result(timeout=300, providers=("ipapi",))
 def get_enhanced_ip_info(ip):
     """Get enhanced IP information including ISP details with rate limiting"""
     try:
         logger.info(f"Fetching enhanced IP data for {ip}")
-        url = f"https://ipapi.co/{ip}/json/"
-        response = requests.get(url, timeout=10)
+        response = http_client.get("ipapi", IPAPI_URL.format(ip=ip))
         
         if response.status_code == 200:
-            data = response.json()
-            if 'error' not in data:
-                return {
-                    "city": data.get("city"),
-                    "region": data.get("region"),
-                    "country_name": data.get("country_name"),
-                    "org": data.get("org"),
-                    "isp": data.get("org"),
-                    "asn": data.get("asn"),
-                    "latitude": data.get("latitude"),
-                    "longitude": data.get("longitude"),
-                    "timezone": data.get("timezone"),
-                    "postal": data.get("postal"),
-                    "connection_type": data.get("connection_type"),
-                    "threat_level": data.get("threat_level")
-                }
+            return parse_ipapi(response.json())
         elif response.status_code == 429:
             logger.warning("Primary API rate limit exceeded")
             raise Exception("Rate limit exceeded")
@@ -128,26 +430,13 @@ def get_enhanced_ip_info(ip):
 
 def sanitize_sensitive_data(data):
     """Sanitize sensitive information before displaying"""
-    private_indicators = [
-        'internal', 'private', 'corp', 'intranet', 'lan', 'vpn',
-        'employee', 'staff', 'admin', 'secure'
-    ]
-    
-    if data.get('org'):
-        org_lower = data['org'].lower()
-        for indicator in private_indicators:
-            if indicator in org_lower:
-                data['org'] = "Private Network"
-                break
+    if classify.is_private_org(data.get('org')):
+        data['org'] = "Private Network"
     
-    if data.get('owner'):
-        owner_lower = data['owner'].lower()
-        for indicator in private_indicators:
-            if indicator in owner_lower:
-                data['owner'] = "Private Network"
-                break
+    if classify.is_private_org(data.get('owner')):
+        data['owner'] = "Private Network"
     
-    if data.get('org') and any(word in data['org'].lower() for word in ['government', 'military', 'defense']):
+    if classify.is_restricted_org(data.get('org')):
         if data.get('latitude') and data.get('longitude'):
             data['latitude'] = round(float(data['latitude']), 1)
             data['longitude'] = round(float(data['longitude']), 1)
@@ -185,43 +474,66 @@ def add_privacy_notice(result):
     return result
 
 
+def get_local_time(timezone):
+    """Return the current time in the given timezone, or "Unknown"."""
+    try:
+        from datetime import datetime
+        import pytz
+        tz = pytz.timezone(timezone)
+        return datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
+    except:
+        return "Unknown"
+
+
+def unknown_weather():
+    return {
+        "temperature": None,
+        "feels_like": None,
+        "humidity": None,
+        "condition": "Unknown"
+    }
+
+
+# Weather is cached per geohash cell so nearby IPs share one OpenWeather
+# call; precision 5 is a cell of roughly 5 x 5 km.
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", 5))
+
+
+@cache_result(timeout=600, providers=("openweather",))
+def get_cell_weather(cell):
+    """Fetch current weather for the centre of a geohash cell"""
+    lat, lon = geohash.decode(cell)
+    weather_url = WEATHER_URL.format(lat=lat, lon=lon, key=os.getenv("OPENWEATHER_API_KEY"))
+    return parse_weather(http_client.get("openweather", weather_url).json())
+
+
+def parse_weather(weather):
+    if "main" not in weather:
+        raise Exception(f"Unexpected weather response: {weather.get('message', 'no data')}")
+
+    return {
+        "temperature": weather["main"]["temp"],
+        "feels_like": weather["main"]["feels_like"],
+        "humidity": weather["main"]["humidity"],
+        "condition": weather["weather"][0]["description"],
+    }
+
+
 def get_weather_and_time(lat, lon, timezone):
     """Fetch local weather and local time for the given coordinates."""
     try:
-        local_time = "Unknown"
-        try:
-            from datetime import datetime
-            import pytz
-            tz = pytz.timezone(timezone)
-            local_time = datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            pass
+        local_time = get_local_time(timezone)
 
         WEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
         if not WEATHER_API_KEY:
             raise Exception("Missing OpenWeather API key")
 
-        weather_url = (
-            f"https://api.openweathermap.org/data/2.5/weather?"
-            f"lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
-        )
-
-        weather = requests.get(weather_url, timeout=5).json()
-
-        if "main" in weather:
-            weather_info = {
-                "temperature": weather["main"]["temp"],
-                "feels_like": weather["main"]["feels_like"],
-                "humidity": weather["main"]["humidity"],
-                "condition": weather["weather"][0]["description"],
-            }
-        else:
-            weather_info = {
-                "temperature": None,
-                "feels_like": None,
-                "humidity": None,
-                "condition": "Unknown"
-            }
+        try:
+            cell = geohash.encode(float(lat), float(lon), WEATHER_GEOHASH_PRECISION)
+            weather_info = get_cell_weather(cell)
+        except Exception as e:
+            logger.warning(f"Weather lookup failed: {http_client.describe_error(e)}")
+            weather_info = unknown_weather()
 
         return {
             "local_time": local_time,
@@ -232,157 +544,388 @@ def get_weather_and_time(lat, lon, timezone):
         logger.warning(f"Weather/Time Lookup Failed: {e}")
         return {
             "local_time": "Unknown",
-            "weather": {
-                "temperature": None,
-                "feels_like": None,
-                "humidity": None,
-                "condition": "Unknown"
-            }
+            "weather": unknown_weather()
         }
 
 
-def lookup_ip_info(ip_address):
-    """Lookup information for a specific IP address"""
-    try:
-        if not validate_ip_address(ip_address):
-            return {"error": "Invalid IP address format"}
-        
-        result = {
-            "ipv4": ip_address,
-            "ipv6": "N/A",
-            "city": "Unknown",
-            "region": "Unknown",
-            "country": "Unknown",
-            "org": "Unknown",
-            "isp": "Unknown",
-            "asn": "Unknown",
-            "latitude": None,
-            "longitude": None,
-            "timezone": "Unknown",
-            "postal": "Unknown",
-            "connection_type": "Unknown",
-            "owner": "Unknown",
-            "asn_org": "Unknown",
-            "ip_type": "Unknown"
+IP_API_FIELDS = "status,message,country,countryCode,region,regionName,city,zip,lat,lon,timezone,isp,org,as,asname,query"
+
+
+def parse_ip_api(fallback_data):
+    if fallback_data.get("status") == "success":
+        return {
+            "city": fallback_data.get("city"),
+            "region": fallback_data.get("regionName"),
+            "country_name": fallback_data.get("country"),
+            "org": fallback_data.get("org"),
+            "isp": fallback_data.get("isp"),
+            "asn": fallback_data.get("as"),
+            "asn_org": fallback_data.get("asname"),
+            "latitude": fallback_data.get("lat"),
+            "longitude": fallback_data.get("lon"),
+            "timezone": fallback_data.get("timezone"),
+            "postal": fallback_data.get("zip")
         }
+    return None
 
-        geo_data = None
-        apis_tried = 0
-        max_apis = 3  
-        
-        # Primary API
-        if apis_tried < max_apis:
-            try:
-                apis_tried += 1
-                geo_data = get_enhanced_ip_info(ip_address)
-                if not geo_data:
-                    raise Exception("Primary API returned no data")
-            except:
-                geo_data = None
 
-        # Fallback API
-        if not geo_data and apis_tried < max_apis:
-            try:
-                apis_tried += 1
-                fallback_url = f"http://ip-api.com/json/{ip_address}?fields=status,message,country,countryCode,region,regionName,city,zip,lat,lon,timezone,isp,org,as,asname,query"
-                fallback_response = requests.get(fallback_url, timeout=10)
-                fallback_data = fallback_response.json()
-                
-                if fallback_data.get("status") == "success":
-                    geo_data = {
-                        "city": fallback_data.get("city"),
-                        "region": fallback_data.get("regionName"),
-                        "country_name": fallback_data.get("country"),
-                        "org": fallback_data.get("org"),
-                        "isp": fallback_data.get("isp"),
-                        "asn": fallback_data.get("as"),
-                        "asn_org": fallback_data.get("asname"),
-                        "latitude": fallback_data.get("lat"),
-                        "longitude": fallback_data.get("lon"),
-                        "timezone": fallback_data.get("timezone"),
-                        "postal": fallback_data.get("zip")
-                    }
-            except:
-                geo_data = None
+def get_ip_api_info(ip):
+    """Get geolocation data from the ip-api.com fallback"""
+    fallback_url = IP_API_URL.format(ip=ip, fields=IP_API_FIELDS)
+    return parse_ip_api(http_client.get("ip-api", fallback_url).json())
 
-        # Final Fallback API
-        if not geo_data and apis_tried < max_apis:
-            try:
-                apis_tried += 1
-                ipinfo_url = f"https://ipinfo.io/{ip_address}/json"
-                ipinfo_data = requests.get(ipinfo_url, timeout=10).json()
-                
-                loc_parts = ipinfo_data.get("loc", "").split(",")
-                lat = float(loc_parts[0]) if len(loc_parts) > 0 else None
-                lon = float(loc_parts[1]) if len(loc_parts) > 1 else None
-
-                geo_data = {
-                    "city": ipinfo_data.get("city"),
-                    "region": ipinfo_data.get("region"),
-                    "country_name": ipinfo_data.get("country"),
-                    "org": ipinfo_data.get("org"),
-                    "isp": ipinfo_data.get("org"),
-                    "latitude": lat,
-                    "longitude": lon,
-                    "timezone": ipinfo_data.get("timezone"),
-                    "postal": ipinfo_data.get("postal")
-                }
-            except:
-                geo_data = None
 
-        # Geo merge
+def get_ip_api_batch(ips):
+    """Get geolocation data for up to 100 IPs in one ip-api.com batch call"""
+    if is_offline():
+        return {}
+
+    if classify.np is not None:
+        # Private, reserved and bogon addresses have nothing to look up
+        ips = [ip for ip, routable in zip(ips, classify.routable_mask(ips)) if routable]
+
+    valid_ips = [
+        ip for ip in ips
+        if validate_ip_address(ip) and lookup_local_geo(ip) is None
+    ]
+    if not valid_ips:
+        return {}
+
+    batch_url = IP_API_BATCH_URL.format(fields=IP_API_FIELDS)
+    response = http_client.post("ip-api", batch_url, json=valid_ips[:100])
+    if response.status_code != 200:
+        logger.warning(f"ip-api.com batch request failed with {response.status_code}")
+        return {}
+
+    results = {}
+    for item in response.json():
+        geo_data = parse_ip_api(item)
         if geo_data:
-            result.update({
-                "city": geo_data.get("city", "Unknown"),
-                "region": geo_data.get("region", "Unknown"),
-                "country": geo_data.get("country_name", "Unknown"),
-                "org": geo_data.get("org", "Unknown"),
-                "isp": geo_data.get("isp", geo_data.get("org", "Unknown")),
-                "asn": geo_data.get("asn", "Unknown"),
-                "latitude": float(geo_data.get("latitude", 0)) if geo_data.get("latitude") else None,
-                "longitude": float(geo_data.get("longitude", 0)) if geo_data.get("longitude") else None,
-                "timezone": geo_data.get("timezone", "Unknown"),
-                "postal": geo_data.get("postal", "Unknown"),
-                "connection_type": geo_data.get("connection_type", "Unknown")
-            })
-            
+            results[item.get("query")] = geo_data
+    return results
+
+
+def get_ipinfo_info(ip):
+    """Get geolocation data from the ipinfo.io fallback"""
+    return parse_ipinfo(http_client.get("ipinfo", IPINFO_URL.format(ip=ip)).json())
+
+
+def parse_ipinfo(ipinfo_data):
+    loc_parts = ipinfo_data.get("loc", "").split(",")
+    lat = float(loc_parts[0]) if len(loc_parts) > 0 else None
+    lon = float(loc_parts[1]) if len(loc_parts) > 1 else None
+
+    return {
+        "city": ipinfo_data.get("city"),
+        "region": ipinfo_data.get("region"),
+        "country_name": ipinfo_data.get("country"),
+        "org": ipinfo_data.get("org"),
+        "isp": ipinfo_data.get("org"),
+        "latitude": lat,
+        "longitude": lon,
+        "timezone": ipinfo_data.get("timezone"),
+        "postal": ipinfo_data.get("postal")
+    }
+
+
+# Geo providers in fallback order
+GEO_PROVIDERS = [
+    ("ipapi", get_enhanced_ip_info),
+    ("ip-api", get_ip_api_info),
+    ("ipinfo", get_ipinfo_info),
+]
+
+
+# How the geo providers are combined: "sequential" (fallback chain),
+# "hedged" (start the next provider once the current one is slower than
+# its usual latency) or "race" (query all, first answer wins). Hedged and
+# race call more providers per lookup, so they are opt-in.
+GEO_STRATEGY = os.getenv("GEO_STRATEGY", "sequential")
+
+
+# Optional local GeoIP dataset (.csv, compiled .idx or .mmdb). With
+# GEOIP_MODE=first it answers ahead of the remote providers and they are
+# only used on a miss; with GEOIP_MODE=offline no remote calls are made.
+GEOIP_DB = os.getenv("GEOIP_DB")
+GEOIP_MODE = os.getenv("GEOIP_MODE", "first")
+_geoip_db = None
+if GEOIP_DB:
+    try:
+        _geoip_db = geoip.open_database(GEOIP_DB)
+        logger.info(f"Loaded local GeoIP database {GEOIP_DB}")
+    except Exception as e:
+        logger.error(f"Could not load GeoIP database {GEOIP_DB}: {e}")
+
+
+def is_offline():
+    return _geoip_db is not None and GEOIP_MODE == "offline"
+
+
+def lookup_local_geo(ip_address):
+    """Return geo data from the local GeoIP database, if one is loaded"""
+    if _geoip_db is None:
+        return None
+    try:
+        return _geoip_db.lookup(ip_address)
+    except Exception as e:
+        logger.warning(f"Local GeoIP lookup failed: {e}")
+        return None
+
+
+def cached_geo_providers(ip_address):
+    """Names of the GEO_PROVIDERS that can answer ip_address from a cache"""
+    names = []
+    for name, func in GEO_PROVIDERS:
+        if func.__name__ not in _cached_functions:
+            continue
+        cache = prefix_cache(func.__name__)
+        if cache is not None and cache.contains(ip_address):
+            names.append(name)
+            continue
+        try:
+            found, entry = _cache.get(make_cache_key(func.__name__, (ip_address,)), record=False)
+        except Exception:
+            found = False
+        if found and entry_state(entry) is not None:
+            names.append(name)
+    return names
+
+
+def fetch_geo_data(ip_address):
+    """Resolve geo data from GEO_PROVIDERS using GEO_STRATEGY"""
+    # Providers that are throttled or tripped are moved to the back, unless
+    # their answer is cached and asking them costs no upstream call
+    return providers.run_strategy(
+        ratelimit.schedule(GEO_PROVIDERS, cached_geo_providers(ip_address)),
+        ip_address, strategy=GEO_STRATEGY
+    )
+
+
+# "concurrent" overlaps geo and WHOIS on a thread pool and enforces
+# LOOKUP_DEADLINE; "sequential" keeps the original one-after-another flow.
+LOOKUP_MODE = os.getenv("LOOKUP_MODE", "concurrent")
+LOOKUP_DEADLINE = float(os.getenv("LOOKUP_DEADLINE", 12))
+_lookup_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LOOKUP_WORKERS", 16)),
+    thread_name_prefix="lookup",
+)
+# Batch lookups run their stages on a smaller pool of their own, so a big
+# upload queues behind itself instead of in front of interactive lookups.
+_bulk_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BULK_LOOKUP_WORKERS", 4)),
+    thread_name_prefix="bulk-lookup",
+)
+
+
+def new_result(ip_address):
+    """Return the default lookup result for an IP"""
+    return {
+        "ipv4": ip_address,
+        "ipv6": "N/A",
+        "city": "Unknown",
+        "region": "Unknown",
+        "country": "Unknown",
+        "org": "Unknown",
+        "isp": "Unknown",
+        "asn": "Unknown",
+        "latitude": None,
+        "longitude": None,
+        "timezone": "Unknown",
+        "postal": "Unknown",
+        "connection_type": "Unknown",
+        "owner": "Unknown",
+        "asn_org": "Unknown",
+        "ip_type": "Unknown"
+    }
+
+
+def merge_geo_data(result, geo_data):
+    result.update({
+        "city": geo_data.get("city", "Unknown"),
+        "region": geo_data.get("region", "Unknown"),
+        "country": geo_data.get("country_name", "Unknown"),
+        "org": geo_data.get("org", "Unknown"),
+        "isp": geo_data.get("isp", geo_data.get("org", "Unknown")),
+        "asn": geo_data.get("asn", "Unknown"),
+        "latitude": float(geo_data.get("latitude", 0)) if geo_data.get("latitude") else None,
+        "longitude": float(geo_data.get("longitude", 0)) if geo_data.get("longitude") else None,
+        "timezone": geo_data.get("timezone", "Unknown"),
+        "postal": geo_data.get("postal", "Unknown"),
+        "connection_type": geo_data.get("connection_type", "Unknown")
+    })
+    return result
+
+
+def local_whois_data(result, geo_data):
+    """WHOIS-shaped data taken from a local GeoIP record"""
+    return {
+        "owner": geo_data.get("owner", result["org"]),
+        "asn_org": geo_data.get("asn_org", "Unknown"),
+        "type": geo_data.get("ip_type", "Unknown")
+    }
+
+
+def merge_whois_data(result, whois_data):
+    if whois_data:
+        result.update({
+            "owner": whois_data.get("owner", result.get("org", "Unknown")),
+            "asn_org": whois_data.get("asn_org", "Unknown"),
+            "ip_type": whois_data.get("type", "Unknown")
+        })
+    return result
+
+
+def mask_postal(result):
+    if result.get('postal') and result['postal'] != 'Unknown':
+        result['postal'] = result['postal'][:3] + 'XXX'
+    return result
+
+
+def _await_stage(future, deadline_at, stage, timed_out):
+    """Wait for a lookup stage until the request deadline, None on failure"""
+    try:
+        return future.result(timeout=max(deadline_at - time.monotonic(), 0))
+    except FutureTimeout:
+        logger.warning(f"Lookup stage {stage} missed the request deadline")
+        timed_out.append(stage)
+    except Exception as e:
+        logger.warning(f"Lookup stage {stage} failed: {http_client.describe_error(e)}")
+    return None
+
+
+def _snapshot(result):
+    """Copy of a partial result, sanitized the same way as the final one"""
+    return mask_postal(add_privacy_notice(sanitize_sensitive_data(dict(result))))
+
+
+def iter_lookup_stages(ip_address, deadline=None, geo_data=None, snapshots=True, executor=None):
+    """Yield (stage, result) as each stage of a lookup completes
+
+    Stages are "geo", "whois", "weather" and finally "done" with the same
+    result lookup_ip_info returns; the earlier ones are sanitized snapshots
+    of the result so far. With ``snapshots=False`` the earlier stages yield
+    None, so callers that only want the final result skip building copies.
+    Concurrent stages run on ``executor`` (the shared lookup pool by default).
+    An invalid address yields only "done" with an error.
+    """
+    with metrics.timer("validation"):
+        valid = validate_ip_address(ip_address)
+    if not valid:
+        yield "done", {"error": "Invalid IP address format"}
+        return
+
+    _hot_ips.record(ip_address)
+    result = new_result(ip_address)
+
+    concurrent = LOOKUP_MODE == "concurrent"
+    executor = executor or _lookup_executor
+    deadline_at = time.monotonic() + (LOOKUP_DEADLINE if deadline is None else deadline)
+    timed_out = []
+
+    offline = is_offline()
+
+    # WHOIS does not depend on geo, so start it right away
+    whois_future = None
+    if concurrent and not offline:
+        whois_future = executor.submit(get_whois_info, ip_address)
+
+    hostname_future = _resolver.submit(ip_address) if wants_hostname(ip_address) else None
+
+    with metrics.timer("geo"):
+        if geo_data is None:
+            geo_data = lookup_local_geo(ip_address)
+
+        if geo_data is None and not offline:
+            if concurrent:
+                geo_data = _await_stage(
+                    executor.submit(fetch_geo_data, ip_address),
+                    deadline_at, "geo", timed_out
+                )
+            else:
+                geo_data = fetch_geo_data(ip_address)
+
+    # Geo merge
+    if geo_data:
+        merge_geo_data(result, geo_data)
+        yield "geo", _snapshot(result) if snapshots else None
+
+        with metrics.timer("whois"):
             try:
-                whois_data = get_whois_info(ip_address)
-                if whois_data:
-                    result.update({
-                        "owner": whois_data.get("owner", result.get("org", "Unknown")),
-                        "asn_org": whois_data.get("asn_org", "Unknown"),
-                        "ip_type": whois_data.get("type", "Unknown")
-                    })
+                if offline:
+                    whois_data = local_whois_data(result, geo_data)
+                elif whois_future is not None:
+                    whois_data = _await_stage(whois_future, deadline_at, "whois", timed_out)
+                else:
+                    whois_data = get_whois_info(ip_address)
+                merge_whois_data(result, whois_data)
             except:
                 pass
 
+    if RDNS:
+        with metrics.timer("hostname"):
+            hostname = None
+            if hostname_future is not None:
+                hostname = _await_stage(hostname_future, deadline_at, "hostname", timed_out)
+            result["hostname"] = hostname or "Unknown"
+
+    with metrics.timer("sanitize"):
         result = sanitize_sensitive_data(result)
         result = add_privacy_notice(result)
-        print("DEBUG GEO:", result["latitude"], result["longitude"], result["timezone"])
-        print("DEBUG KEY:", os.getenv("OPENWEATHER_API_KEY"))
-
-        # ---- Add Local Time + Weather ----
-        if result.get("latitude") and result.get("longitude") and result.get("timezone"):
-            extra = get_weather_and_time(
-                result["latitude"],
-                result["longitude"],
-                result["timezone"]
-            )
+    yield "whois", mask_postal(dict(result)) if snapshots else None
+
+    # ---- Add Local Time + Weather ----
+    with metrics.timer("weather"):
+        if offline:
+            result["local_time"] = get_local_time(result["timezone"])
+            result["weather"] = unknown_weather()
+        elif result.get("latitude") and result.get("longitude") and result.get("timezone"):
+            if concurrent:
+                extra = _await_stage(
+                    executor.submit(
+                        get_weather_and_time,
+                        result["latitude"],
+                        result["longitude"],
+                        result["timezone"]
+                    ),
+                    deadline_at, "weather", timed_out
+                )
+                if extra is None:
+                    extra = {
+                        "local_time": get_local_time(result["timezone"]),
+                        "weather": unknown_weather()
+                    }
+            else:
+                extra = get_weather_and_time(
+                    result["latitude"],
+                    result["longitude"],
+                    result["timezone"]
+                )
             result.update(extra)
         else:
             result["local_time"] = "Unknown"
-            result["weather"] = {
-                "temperature": None,
-                "feels_like": None,
-                "humidity": None,
-                "condition": "Unknown"
-            }
+            result["weather"] = unknown_weather()
+
+    if timed_out:
+        result["partial"] = True
+        result["timed_out_stages"] = timed_out
+
+    result = mask_postal(result)
+    yield "weather", dict(result) if snapshots else None
+    yield "done", result
+
 
-        # Postal masking
-        if result.get('postal') and result['postal'] != 'Unknown':
-            result['postal'] = result['postal'][:3] + 'XXX'
+def lookup_ip_info(ip_address, deadline=None, geo_data=None, executor=None):
+    """Lookup information for a specific IP address
 
+    In concurrent mode the whole lookup is bounded by ``deadline`` seconds
+    (LOOKUP_DEADLINE by default). Stages that miss the budget are left at
+    their defaults and listed under ``timed_out_stages``. Passing
+    ``geo_data`` (e.g. from a batch prefetch) skips the geo providers.
+    """
+    try:
+        for stage, result in iter_lookup_stages(ip_address, deadline, geo_data, snapshots=False,
+                                                executor=executor):
+            pass
         return result
 
     except Exception as e:
@@ -390,32 +933,200 @@ def lookup_ip_info(ip_address):
         return {"error": f"An error occurred: {str(e)}"}
 
 
-def get_ip_info():
-    try:
-        cache_key = "current_ipv4"
-        current_time = time.time()
-        
-        if cache_key in _cache:
-            cached_time, ipv4 = _cache[cache_key]
-            if current_time - cached_time < 60:
-                logger.info("Using cached IPv4 address")
-            else:
-                ipv4 = requests.get("https://api.ipify.org?format=json", timeout=10).json().get("ip")
-                _cache[cache_key] = (current_time, ipv4)
-        else:
-            ipv4 = requests.get("https://api.ipify.org?format=json", timeout=10).json().get("ip")
-            _cache[cache_key] = (current_time, ipv4)
-        
-        ipv6 = "Not available"
+# ---- Cache warming ----
+
+# CACHE_WARM_SNAPSHOT saves the hot keys at exit and reloads them at start;
+# CACHE_WARM_LOG seeds them from an access log. Either way the top
+# CACHE_PREWARM_COUNT addresses are looked up in the background at startup.
+CACHE_WARM_SNAPSHOT = os.getenv("CACHE_WARM_SNAPSHOT")
+CACHE_WARM_LOG = os.getenv("CACHE_WARM_LOG")
+CACHE_PREWARM_COUNT = int(os.getenv("CACHE_PREWARM_COUNT", 100))
+PREWARM_PROVIDERS = ("ipapi", "ipwhois")
+
+
+def _spare_budget(providers):
+    return all(ratelimit.has_budget(p, reserve=CACHE_WARM_RESERVE) for p in providers)
+
+
+def warm_hot_keys(now=None):
+    """Refresh hot cache entries that go stale within CACHE_WARM_LEAD seconds
+
+    Hot keys that are already stale or gone are refreshed too, so their
+    next read is a fresh hit. Returns the number of entries refreshed.
+    """
+    if is_offline():
+        return 0
+    now = time.time() if now is None else now
+    with _warming_lock:
+        for cache_key, stale_at in list(_warmed.items()):
+            if now - stale_at > 3600:
+                del _warmed[cache_key]  # never read again
+
+    refreshed = 0
+    for cache_key, count, (name, args) in _hot_keys.top():
+        if count < CACHE_WARM_MIN_HITS:
+            break
+        wrapper = _cached_functions.get(name)
+        if wrapper is None:
+            continue
+        if _cluster is not None and wrapper.clustered and not _cluster.is_local(cache_key):
+            continue  # its owner keeps it warm
         try:
-            data = requests.get("https://api64.ipify.org?format=json", timeout=5).json()
-            fetched_ipv6 = data.get("ip", "")
-            if fetched_ipv6 and fetched_ipv6 != ipv4 and ":" in fetched_ipv6:
-                ipv6 = fetched_ipv6
-        except:
-            pass
+            found, entry = _cache.get(cache_key, record=False)
+        except Exception:
+            continue
+        stale_at = now
+        if found and entry_state(entry) is not None:
+            if entry.get("error") is not None or entry["value"] is None:
+                continue  # a remembered failure; let it expire
+            if entry["fresh_until"] - now > CACHE_WARM_LEAD:
+                continue
+            stale_at = entry["fresh_until"]
+        if not _spare_budget(wrapper.cache_providers):
+            _count_warming("skipped_budget")
+            continue
+        try:
+            wrapper.warm(*args)
+        except Exception as e:
+            _count_warming("errors")
+            logger.warning(f"Warming {name} failed: {http_client.describe_error(e)}")
+            continue
+        with _warming_lock:
+            _warmed[cache_key] = stale_at
+            _warming["warmed"] += 1
+        refreshed += 1
+    return refreshed
+
+
+def prewarm(ips, budget_wait=30):
+    """Look up ips to fill the caches, pausing while providers lack budget
+
+    Gives up after waiting ``budget_wait`` seconds for budget on one IP.
+    Returns the number of addresses looked up.
+    """
+    done = 0
+    for ip in ips:
+        waited = 0
+        while not _spare_budget(PREWARM_PROVIDERS):
+            if waited >= budget_wait:
+                logger.warning(f"Pre-warming stopped after {done} IPs: no provider budget")
+                return done
+            time.sleep(1)
+            waited += 1
+        lookup_ip_info(ip)
+        _count_warming("prewarmed")
+        done += 1
+    return done
+
+
+def save_hot_keys(path=None):
+    path = path or CACHE_WARM_SNAPSHOT
+    data = {"keys": _hot_keys.snapshot(), "ips": _hot_ips.snapshot()}
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_hot_keys(path=None):
+    """Seed the hot keys from a snapshot; returns its addresses, hottest first"""
+    with open(path or CACHE_WARM_SNAPSHOT) as f:
+        data = json.load(f)
+    _hot_keys.load(data.get("keys", []))
+    _hot_ips.load(data.get("ips", []))
+    return [item["key"] for item in data.get("ips", [])]
+
+
+def hot_ips_from_log(path, limit=None):
+    """Count the addresses in an access log; returns the busiest, hottest first"""
+    counts = Counter()
+    with open(path, "rb") as f:
+        for line in f:
+            ip = clientip.find_ip(line)
+            if ip is not None:
+                counts[ip] += 1
+    for ip, count in counts.most_common(_hot_ips.capacity):
+        _hot_ips.record(ip, count=count)
+    return [ip for ip, _ in counts.most_common(limit)]
+
+
+def start_warmer():
+    """Pre-warm at startup, then refresh hot keys every CACHE_WARM_INTERVAL"""
+    def run():
+        ips = []
+        try:
+            if CACHE_WARM_SNAPSHOT and os.path.exists(CACHE_WARM_SNAPSHOT):
+                ips += load_hot_keys()
+            if CACHE_WARM_LOG:
+                ips += hot_ips_from_log(CACHE_WARM_LOG, CACHE_PREWARM_COUNT)
+            public = [ip for ip in dict.fromkeys(ips) if clientip.is_public(ip)]
+            prewarm(public[:CACHE_PREWARM_COUNT])
+        except Exception as e:
+            logger.warning(f"Cache pre-warming failed: {e}")
+
+        while True:
+            time.sleep(CACHE_WARM_INTERVAL)
+            try:
+                warm_hot_keys()
+            except Exception as e:
+                logger.warning(f"Cache warming failed: {e}")
+
+    if CACHE_WARM_SNAPSHOT:
+        atexit.register(save_hot_keys)
+    thread = threading.Thread(target=run, name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
+
+
+@cache_result(timeout=60, providers=("ipify",), clustered=False)
+def get_public_ipv4():
+    """Fetch the server's public IPv4 address from ipify"""
+    return http_client.get("ipify", IPIFY_V4_URL).json().get("ip")
+
+
+@cache_result(timeout=60, providers=("ipify",), clustered=False)
+def get_public_ipv6():
+    """Fetch the server's public address from the dual-stack ipify endpoint"""
+    return http_client.get("ipify", IPIFY_V6_URL, timeout=5).json().get("ip", "")
+
 
-        result = lookup_ip_info(ipv4)
+# IP_SOURCE=request shows the visitor's own address (taken from the request,
+# see clientip.py) without any outbound call. Requests from private or
+# loopback addresses, e.g. local development, fall back to asking ipify for
+# the server's public address, as IP_SOURCE=server always does.
+IP_SOURCE = os.getenv("IP_SOURCE", "request")
+
+
+def request_client_ip():
+    """Address of the visitor of the current Flask request"""
+    return clientip.client_ip(
+        request.remote_addr,
+        forwarded=", ".join(request.headers.getlist("Forwarded")),
+        x_forwarded_for=", ".join(request.headers.getlist("X-Forwarded-For")),
+    )
+
+
+def resolve_display_ip(client_address=None):
+    """Return (address to look up, IPv6 to display) for the index page"""
+    if IP_SOURCE == "request" and client_address and clientip.is_public(client_address):
+        return client_address, client_address if ":" in client_address else "Not available"
+
+    ipv4 = get_public_ipv4()
+
+    ipv6 = "Not available"
+    try:
+        fetched_ipv6 = get_public_ipv6()
+        if fetched_ipv6 and fetched_ipv6 != ipv4 and ":" in fetched_ipv6:
+            ipv6 = fetched_ipv6
+    except:
+        pass
+    return ipv4, ipv6
+
+
+def get_ip_info(client_address=None):
+    try:
+        ip_address, ipv6 = resolve_display_ip(client_address)
+
+        result = lookup_ip_info(ip_address)
         result['ipv6'] = ipv6
         
         return result
@@ -425,15 +1136,144 @@ def get_ip_info():
         return {"error": f"An error occurred: {str(e)}"}
 
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_ip_info_events(client_address=None):
+    """Server-Sent Events for the index page, one per completed stage"""
+    try:
+        ip_address, ipv6 = resolve_display_ip(client_address)
+        yield sse_event("ip", {"ipv4": ip_address, "ipv6": ipv6})
+
+        for stage, result in iter_lookup_stages(ip_address):
+            if "error" not in result:
+                result['ipv6'] = ipv6
+            yield sse_event(stage, result)
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        yield sse_event("done", {"error": f"An error occurred: {str(e)}"})
+
+
+# INDEX_MODE=stream serves the page shell at once and fills it in from
+# /api/ip-info/stream; "render" waits for the whole lookup server-side.
+INDEX_MODE = os.getenv("INDEX_MODE", "stream")
+
+
+# Admission control: at most ADMISSION_SLOTS lookups run at once, so slow
+# upstreams cannot tie up every worker thread. Waiting requests are served
+# interactive page loads first, then API lookups, then bulk jobs (which may
+# hold at most ADMISSION_BULK_SLOTS slots). A request that cannot start
+# within ADMISSION_MAX_WAIT_<CLASS> seconds gets 503 with Retry-After. With
+# ADMISSION_CLIENT_LIMIT set, a client with that many requests in progress
+# gets 429; clients are told apart by request_client_ip(), so behind a proxy
+# this needs TRUSTED_PROXIES, or every visitor shares the proxy's address.
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+ADMISSION_SLOTS = int(os.getenv("ADMISSION_SLOTS", 16))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", 64))
+ADMISSION_BULK_SLOTS = int(os.getenv("ADMISSION_BULK_SLOTS", max(1, ADMISSION_SLOTS // 4)))
+ADMISSION_CLIENT_LIMIT = int(os.getenv("ADMISSION_CLIENT_LIMIT", 0))
+ADMISSION_CLASSES = {
+    "index": "interactive",
+    "api_ip_info": "interactive",
+    "api_ip_info_stream": "interactive",
+    "api_lookup": "api",
+    "api_lookup_batch": "bulk",
+}
+_admission = admission.Admission(
+    slots=ADMISSION_SLOTS,
+    queue_size=ADMISSION_QUEUE,
+    max_wait={
+        priority: float(os.getenv(f"ADMISSION_MAX_WAIT_{priority.upper()}", seconds))
+        for priority, seconds in admission.MAX_WAIT.items()
+    },
+    class_slots={"bulk": ADMISSION_BULK_SLOTS},
+    client_limit=ADMISSION_CLIENT_LIMIT,
+)
+
+
+@app.before_request
+def admit_request():
+    priority = ADMISSION_CLASSES.get(request.endpoint) if ADMISSION else None
+    if priority is None:
+        return None
+    try:
+        g.admission_ticket = _admission.acquire(priority, request_client_ip())
+    except admission.Rejected as e:
+        logger.warning(f"Shed {priority} request to {request.path}: {e.reason}")
+        response = jsonify({"error": "Server busy, please retry shortly"})
+        response.status_code = e.status
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    return None
+
+
+@app.after_request
+def release_admission_when_sent(response):
+    ticket = g.pop("admission_ticket", None)
+    if ticket is None:
+        return response
+    if not response.is_streamed:
+        _admission.release(ticket)
+        return response
+
+    # A streamed body is still being produced, so keep the slot until it
+    # is exhausted or the server closes it (e.g. the client went away)
+    body = response.response
+
+    def release_when_done():
+        try:
+            yield from body
+        finally:
+            _admission.release(ticket)
+
+    response.response = release_when_done()
+    response.call_on_close(lambda: _admission.release(ticket))
+    return response
+
+
+@app.teardown_request
+def release_admission(exc=None):
+    ticket = g.pop("admission_ticket", None)  # the request failed before a response
+    if ticket is not None:
+        _admission.release(ticket)
+
+
 @app.route("/")
 def index():
-    ip_info = get_ip_info()
-    return render_template("index.html", ip_info=ip_info)
+    if INDEX_MODE == "stream":
+        client_address = request_client_ip()
+        known = IP_SOURCE == "request" and clientip.is_public(client_address)
+        shell = {"loading": True, "ipv4": client_address if known else None}
+        if RDNS:
+            shell["hostname"] = None
+        with metrics.timer("render"):
+            return render_template("index.html", ip_info=shell)
+
+    ip_info = get_ip_info(request_client_ip())
+    with metrics.timer("render"):
+        return render_template("index.html", ip_info=ip_info)
+
+
+@app.route("/api/ip-info/stream")
+def api_ip_info_stream():
+    events = iter_ip_info_events(request_client_ip())
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/ip-info")
 def api_ip_info():
-    return jsonify(get_ip_info())
+    return jsonify(get_ip_info(request_client_ip()))
+
+
+# SERVER_TIMING=1 adds a Server-Timing header with per-stage durations to
+# /api/lookup responses (visible in the browser's network panel).
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
 
 
 @app.route("/api/lookup", methods=['POST'])
@@ -444,36 +1284,247 @@ def api_lookup():
     if not ip_address:
         return jsonify({"error": "IP address is required"}), 400
 
-    # Step 1: Lookup basic IP info
+    # lookup_ip_info already adds local time and weather
+    token = metrics.start_request() if SERVER_TIMING else None
     result = lookup_ip_info(ip_address)
+    with metrics.timer("render"):
+        response = jsonify(result)
+    if token is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(metrics.finish_request(token))
+    return response
 
-    # If lookup error happen → return early
-    if "error" in result:
-        return jsonify(result)
-
-    # Step 2: Weather + Time (only if lat + lon)
-    lat = result.get("latitude")
-    lon = result.get("longitude")
-    tz  = result.get("timezone")
 
-    if lat and lon and tz:
-        weather_time = get_weather_and_time(lat, lon, tz)
+@app.route("/api/lookup/batch", methods=['POST'])
+def api_lookup_batch():
+    """Look up many IPs, streaming one NDJSON line per IP as it completes.
 
-        result["local_time"] = weather_time.get("local_time", "Unknown")
-        result["timezone"] = weather_time.get("timezone", tz)
-        result["weather"] = weather_time.get("weather", None)
+    Accepts a JSON body {"ips": [...]}, a multipart upload in the "file"
+    field, or a plain-text body, with one IP per line for the latter two.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        lines = data.get('ips')
+        if not isinstance(lines, list):
+            return jsonify({"error": "A list of IP addresses is required"}), 400
+        lines = [str(ip) for ip in lines]
+    elif 'file' in request.files:
+        lines = request.files['file'].stream
     else:
-        result["local_time"] = "Unknown"
-        result["weather"] = None
+        lines = request.stream
+
+    def prefetch(ips):
+        # Resolve the chunk's PTR records together; lookups join these
+        # in-flight queries instead of starting their own
+        public = [ip for ip in ips if wants_hostname(ip)]
+        if public:
+            _resolver.submit_many(public)
+        return get_ip_api_batch(ips)
+
+    def generate():
+        ips = batch.iter_unique_ips(lines)
+        try:
+            for ip, result in batch.stream_lookups(
+                ips,
+                lambda ip, geo_data: lookup_ip_info(ip, geo_data=geo_data, executor=_bulk_executor),
+                prefetch=prefetch,
+            ):
+                yield json.dumps(dict(result, ip=ip)) + "\n"
+        except batch.BatchTooLarge as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
-    return jsonify(result)
 
 @app.route("/api/clear-cache", methods=['POST'])
 def clear_cache():
     global _cache
     _cache.clear()
+    for cache in list(_prefix_caches.values()):
+        cache.clear()
+    _resolver.clear()
     return jsonify({"status": "success", "message": "Cache cleared successfully"})
 
 
+# Argument checks for calls forwarded by other nodes. Functions without one
+# are not served over the internal endpoint.
+CLUSTER_ARG_CHECKS = {
+    "get_whois_info": validate_ip_address,
+    "get_enhanced_ip_info": validate_ip_address,
+    "get_cell_weather": geohash.is_valid,
+}
+
+
+def valid_cluster_call(name, args):
+    """Whether name(*args) is a call another node may ask this one to run"""
+    check = CLUSTER_ARG_CHECKS.get(name)
+    return (
+        check is not None and isinstance(args, list) and len(args) == 1
+        and isinstance(args[0], str) and check(args[0])
+    )
+
+
+@app.route(cluster.PATH, methods=['POST'])
+def internal_cache():
+    """Answer a cached call forwarded by another cluster node"""
+    if _cluster is None:
+        return jsonify({"error": "Not found"}), 404
+    if not _cluster.authorized(request.headers.get(cluster.TOKEN_HEADER)):
+        return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    func = _cached_functions.get(data.get("function"))
+    if func is None or not func.clustered:
+        return jsonify({"error": "Unknown cached function"}), 400
+    if not valid_cluster_call(data["function"], data.get("args")):
+        return jsonify({"error": "Invalid arguments"}), 400
+    with _cluster.serving():
+        return jsonify(cluster.reply(func, tuple(data["args"])))
+
+
+@app.route("/api/cache-stats")
+def cache_stats():
+    stats = _cache.stats()
+    stats["coalescing"] = _flights.stats()
+    stats["prefix"] = {name: cache.stats() for name, cache in list(_prefix_caches.items())}
+    stats["rdns"] = _resolver.stats()
+    if _cluster is not None:
+        stats["cluster"] = _cluster.stats()
+    with _warming_lock:
+        stats["warming"] = dict(_warming, enabled=CACHE_WARMER, pending=len(_warmed))
+    stats["hot_keys"] = [
+        {"key": key, "count": count} for key, count, _ in _hot_keys.top(10)
+    ]
+    with _refreshing_lock:
+        stats["revalidation"] = dict(_revalidation, refreshing=len(_refreshing))
+    return jsonify(stats)
+
+
+@app.route("/api/connection-stats")
+def connection_stats():
+    return jsonify(http_client.connection_stats())
+
+
+@app.route("/api/admission-stats")
+def admission_stats():
+    return jsonify(dict(_admission.stats(), enabled=ADMISSION))
+
+
+@app.route("/api/provider-stats")
+def provider_stats():
+    return jsonify({
+        "latency": providers.latency_stats(),
+        "limits": ratelimit.stats()
+    })
+
+
+
+def metrics_text():
+    """All counters and histograms in the Prometheus text format"""
+    cache = _cache.stats()
+    limits = ratelimit.stats()
+    flights = _flights.stats()
+    rdns_stats = _resolver.stats()
+    with _warming_lock:
+        warming = dict(_warming)
+    with _refreshing_lock:
+        revalidation = dict(_revalidation)
+
+    families = [
+        metrics.histogram_family(
+            "ipinfo_stage_duration_seconds", "Time spent in each lookup stage.",
+            "stage", metrics.stage_histograms()
+        ),
+        metrics.histogram_family(
+            "ipinfo_provider_latency_seconds", "Latency of successful upstream calls.",
+            "provider", dict(providers._histograms)
+        ),
+        metrics.family(
+            "ipinfo_provider_calls_total", "counter", "Upstream calls by outcome.",
+            [
+                ({"provider": name, "outcome": outcome}, stats[outcome])
+                for name, stats in sorted(limits.items())
+                for outcome in ("ok", "throttled", "timeout", "error", "rejected", "cancelled")
+            ]
+        ),
+        metrics.family(
+            "ipinfo_provider_breaker_open", "gauge", "1 while a provider's circuit breaker is not closed.",
+            [({"provider": name}, int(stats["breaker"] != "closed")) for name, stats in sorted(limits.items())]
+        ),
+        metrics.family(
+            "ipinfo_cache_requests_total", "counter", "Cache lookups per cached function.",
+            [
+                ({"function": name, "result": result}, stats[key])
+                for name, stats in sorted(cache["functions"].items())
+                for result, key in (("hit", "hits"), ("miss", "misses"))
+            ]
+        ),
+        metrics.family(
+            "ipinfo_cache_hit_ratio", "gauge", "Hit ratio of the result cache.",
+            [({"backend": cache["backend"]}, cache["hit_ratio"])]
+        ),
+        metrics.family(
+            "ipinfo_cache_events_total", "counter", "Cache evictions, expirations and revalidation events.",
+            [({"event": "eviction"}, cache["evictions"]), ({"event": "expiration"}, cache["expirations"])]
+            + [({"event": name}, value) for name, value in sorted(revalidation.items())]
+            + [({"event": "coalesced"}, flights["coalesced"])]
+        ),
+        metrics.family(
+            "ipinfo_rdns_lookups_total", "counter", "Reverse DNS lookups by outcome.",
+            [
+                ({"outcome": outcome}, rdns_stats[outcome])
+                for outcome in ("hits", "negative_hits", "found", "not_found", "timeouts", "errors", "coalesced")
+            ]
+        ),
+        metrics.family(
+            "ipinfo_cache_warming_total", "counter",
+            "Cache warmer refreshes, pre-warmed lookups, skips and misses prevented.",
+            [({"event": event}, value) for event, value in sorted(warming.items())]
+        ),
+    ]
+    if ADMISSION:
+        queues = _admission.stats()
+        families += [
+            metrics.family(
+                "ipinfo_admission_queue_depth", "gauge", "Requests waiting for a slot, by priority class.",
+                [({"class": priority}, stats["waiting"]) for priority, stats in queues.items()]
+            ),
+            metrics.family(
+                "ipinfo_admission_running", "gauge", "Requests holding a slot, by priority class.",
+                [({"class": priority}, stats["running"]) for priority, stats in queues.items()]
+            ),
+            metrics.family(
+                "ipinfo_admission_requests_total", "counter",
+                "Requests admitted, queued or shed (by reason), by priority class.",
+                [
+                    ({"class": priority, "outcome": outcome}, stats[outcome])
+                    for priority, stats in queues.items() for outcome in admission.OUTCOMES
+                ]
+            ),
+            metrics.histogram_family(
+                "ipinfo_admission_wait_seconds", "Time requests waited for a slot.",
+                "class", _admission.wait_histograms()
+            ),
+        ]
+    if _cluster is not None:
+        cluster_stats = _cluster.stats()
+        families.append(metrics.family(
+            "ipinfo_cluster_calls_total", "counter",
+            "Cache misses fetched locally, forwarded to the owning node, or served for a peer.",
+            [
+                ({"outcome": outcome}, cluster_stats[outcome])
+                for outcome in ("local", "forwarded", "replica", "fallback", "peer_errors", "served")
+            ]
+        ))
+    return metrics.render(families)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
+
+if CACHE_WARMER:
+    start_warmer()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,587 @@
+"""Async (ASGI) serving mode for the lookup API.
+
+Run with an ASGI server, e.g. ``uvicorn asgi:app --port 5000``. Needs the
+optional ``httpx`` package for non-blocking upstream calls. Lookups here are
+coroutines rather than threads, so one process can hold thousands of them
+in flight. Results are cached through the same backend as the Flask app
+(``app._cache``) with identical keys. ``python app.py`` remains the
+synchronous entry point.
+"""
+import asyncio
+import functools
+import json
+import logging
+import mimetypes
+import os
+
+from flask import render_template
+
+import app as core
+import clientip
+import cluster
+import geohash
+import http_client
+import metrics
+import providers
+import ratelimit
+from cache import TTLCache, entry_state, entry_value, make_entry
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+
+_flights = {}
+
+
+async def _cache_call(method, *args, **kwargs):
+    """Run a call that reads or writes the shared cache without blocking the loop
+
+    The in-memory cache answers at once; sqlite and redis do I/O, so their
+    calls run on the default thread pool.
+    """
+    if isinstance(core._cache, TTLCache):
+        return method(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+
+async def _store(policy, key, value, error=None):
+    """Write an entry with the same soft/hard/negative TTLs as app.cache_result"""
+    try:
+        if value is None or error is not None:
+            if policy.cache_negative_ttl > 0:
+                entry = make_entry(value, policy.cache_negative_ttl, error)
+                await _cache_call(core._cache.set, key, entry, policy.cache_negative_ttl)
+        else:
+            entry = make_entry(value, policy.cache_ttl)
+            await _cache_call(core._cache.set, key, entry, policy.cache_hard_ttl)
+    except Exception as e:
+        logger.warning(f"Cache write failed for {policy.__name__}: {e}")
+
+
+async def _fetch_and_store(policy, key, fetch):
+    try:
+        value = await fetch()
+    except Exception as e:
+        if not isinstance(e, ratelimit.ProviderUnavailable):
+            await _store(policy, key, None, http_client.describe_error(e))
+        raise
+    await _store(policy, key, value)
+    return value
+
+
+def _flight_done(key, flight):
+    if _flights.get(key) is flight:
+        del _flights[key]
+    if not flight.cancelled():
+        flight.exception()  # mark as retrieved when nobody else waits
+
+
+async def _load(policy, key, fetch):
+    """Run fetch once per key however many callers ask concurrently
+
+    The fetch runs as its own task that every caller awaits through a
+    shield. A caller that is cancelled (a hedge loser or an expired stage
+    deadline) stops waiting, but the fetch carries on for the others and
+    still fills the cache.
+    """
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = asyncio.ensure_future(_fetch_and_store(policy, key, fetch))
+        flight.add_done_callback(lambda done: _flight_done(key, done))
+    return await asyncio.shield(flight)
+
+
+async def _revalidate(policy, key, fetch):
+    try:
+        await _load(policy, key, fetch)
+        core._count_revalidation("refreshes")
+    except Exception as e:
+        core._count_revalidation("refresh_errors")
+        logger.warning(f"Background refresh failed for {policy.__name__}: {http_client.describe_error(e)}")
+
+
+async def cached(policy, args, fetch):
+    """Serve policy(*args) from the shared cache, coalescing concurrent misses
+
+    ``policy`` is the matching cache_result-decorated function in app, whose
+    name and TTLs are reused so both serving modes share entries.
+    """
+    name = policy.__name__
+    key = core.make_cache_key(name, args)
+    core._hot_keys.record(key, (name, args))
+    try:
+        found, entry = await _cache_call(core._cache.get, key, namespace=name)
+    except Exception as e:
+        logger.warning(f"Cache read failed for {name}: {e}")
+        found = False
+    state = entry_state(entry) if found else None
+    if core._warmed:
+        core._warmed_hit(key, state == "fresh")
+    if core._cluster is not None and policy.clustered:
+        local = fetch
+        fetch = lambda: core._cluster.call_async(key, name, args, local)
+
+    if state == "fresh":
+        if entry.get("error") is not None or entry["value"] is None:
+            core._count_revalidation("negative_hits")
+        return entry_value(entry)
+
+    if state == "stale":
+        core._count_revalidation("stale_served")
+        if key not in _flights:
+            asyncio.ensure_future(_revalidate(policy, key, fetch))
+        return entry_value(entry)
+
+    return await _load(policy, key, fetch)
+
+
+async def prefix_cached(policy, ip, fetch):
+    """Async version of app.prefix_cached in front of cached()"""
+    cache = core.prefix_cache(policy.__name__)
+    if cache is not None:
+        found, result = cache.get(ip)
+        if found:
+            return result
+    result = await cached(policy, (ip,), fetch)
+    if cache is not None and isinstance(result, dict):
+        cache.put(ip, result, result.get("network"))
+    return result
+
+
+async def _get(provider, url, **kwargs):
+    return await http_client.request_async("GET", provider, url, **kwargs)
+
+
+# ---- Providers ----
+
+async def get_whois_info(ip):
+    async def fetch():
+        try:
+            response = await _get("ipwhois", core.WHOIS_URL.format(ip=ip))
+            if response.status_code == 200:
+                return core.parse_whois(response.json())
+            if response.status_code == 429:
+                logger.warning("WHOIS API rate limit exceeded")
+        except ratelimit.ProviderUnavailable:
+            raise  # rejected locally: nothing to remember in the cache
+        except Exception as e:
+            logger.warning(f"WHOIS lookup failed: {e}")
+        return None
+    return await prefix_cached(core.get_whois_info, ip, fetch)
+
+
+async def get_enhanced_ip_info(ip):
+    async def fetch():
+        response = await _get("ipapi", core.IPAPI_URL.format(ip=ip))
+        if response.status_code == 429:
+            raise Exception("Rate limit exceeded")
+        if response.status_code == 200:
+            return core.parse_ipapi(response.json())
+        return None
+    return await prefix_cached(core.get_enhanced_ip_info, ip, fetch)
+
+
+async def get_ip_api_info(ip):
+    response = await _get("ip-api", core.IP_API_URL.format(ip=ip, fields=core.IP_API_FIELDS))
+    return core.parse_ip_api(response.json())
+
+
+async def get_ipinfo_info(ip):
+    response = await _get("ipinfo", core.IPINFO_URL.format(ip=ip))
+    return core.parse_ipinfo(response.json())
+
+
+GEO_PROVIDERS = [
+    ("ipapi", get_enhanced_ip_info),
+    ("ip-api", get_ip_api_info),
+    ("ipinfo", get_ipinfo_info),
+]
+
+
+async def fetch_geo_data(ip_address):
+    cached = await _cache_call(core.cached_geo_providers, ip_address)
+    return await providers.run_strategy_async(
+        ratelimit.schedule(GEO_PROVIDERS, cached), ip_address, strategy=core.GEO_STRATEGY
+    )
+
+
+async def get_cell_weather(cell):
+    async def fetch():
+        lat, lon = geohash.decode(cell)
+        url = core.WEATHER_URL.format(lat=lat, lon=lon, key=os.getenv("OPENWEATHER_API_KEY"))
+        return core.parse_weather((await _get("openweather", url)).json())
+    return await cached(core.get_cell_weather, (cell,), fetch)
+
+
+async def get_weather_and_time(lat, lon, timezone):
+    if not os.getenv("OPENWEATHER_API_KEY"):
+        logger.warning("Weather/Time Lookup Failed: Missing OpenWeather API key")
+        return {"local_time": "Unknown", "weather": core.unknown_weather()}
+
+    try:
+        cell = geohash.encode(float(lat), float(lon), core.WEATHER_GEOHASH_PRECISION)
+        weather_info = await get_cell_weather(cell)
+    except Exception as e:
+        logger.warning(f"Weather lookup failed: {http_client.describe_error(e)}")
+        weather_info = core.unknown_weather()
+    return {"local_time": core.get_local_time(timezone), "weather": weather_info}
+
+
+async def get_public_ipv4():
+    async def fetch():
+        return (await _get("ipify", core.IPIFY_V4_URL)).json().get("ip")
+    return await cached(core.get_public_ipv4, (), fetch)
+
+
+async def get_public_ipv6():
+    async def fetch():
+        return (await _get("ipify", core.IPIFY_V6_URL, timeout=5)).json().get("ip", "")
+    return await cached(core.get_public_ipv6, (), fetch)
+
+
+# Cached calls other cluster nodes may forward here, by app function name
+CLUSTER_FUNCTIONS = {func.__name__: func for func in (get_whois_info, get_enhanced_ip_info, get_cell_weather)}
+
+
+# ---- Lookup pipeline ----
+
+async def _await_stage(awaitable, deadline_at, stage, timed_out):
+    """The stage's result, or None once it fails, is cancelled or misses the deadline"""
+    task = asyncio.ensure_future(awaitable)
+    remaining = deadline_at - asyncio.get_running_loop().time()
+    try:
+        # Unlike wait_for, wait() reports a cancelled stage as done instead
+        # of raising CancelledError into this request
+        done, _ = await asyncio.wait({task}, timeout=max(remaining, 0))
+    except asyncio.CancelledError:
+        task.cancel()  # this request itself was cancelled
+        raise
+    if not done:
+        task.cancel()
+        logger.warning(f"Lookup stage {stage} missed the request deadline")
+        timed_out.append(stage)
+    elif task.cancelled():
+        logger.warning(f"Lookup stage {stage} was cancelled")
+        timed_out.append(stage)
+    elif task.exception() is not None:
+        logger.warning(f"Lookup stage {stage} failed: {http_client.describe_error(task.exception())}")
+    else:
+        return task.result()
+    return None
+
+
+async def iter_lookup_stages(ip_address, deadline=None, snapshots=True):
+    """Async version of app.iter_lookup_stages with the same stages"""
+    with metrics.timer("validation"):
+        valid = core.validate_ip_address(ip_address)
+    if not valid:
+        yield "done", {"error": "Invalid IP address format"}
+        return
+
+    core._hot_ips.record(ip_address)
+    result = core.new_result(ip_address)
+    budget = core.LOOKUP_DEADLINE if deadline is None else deadline
+    deadline_at = asyncio.get_running_loop().time() + budget
+    timed_out = []
+    offline = core.is_offline()
+
+    whois_task = None
+    if not offline:
+        whois_task = asyncio.ensure_future(get_whois_info(ip_address))
+    hostname_task = None
+    if core.wants_hostname(ip_address):
+        hostname_task = asyncio.ensure_future(core._resolver.resolve(ip_address))
+
+    try:
+        with metrics.timer("geo"):
+            geo_data = core.lookup_local_geo(ip_address)
+            if geo_data is None and not offline:
+                geo_data = await _await_stage(fetch_geo_data(ip_address), deadline_at, "geo", timed_out)
+
+        if geo_data:
+            core.merge_geo_data(result, geo_data)
+            yield "geo", core._snapshot(result) if snapshots else None
+            with metrics.timer("whois"):
+                if offline:
+                    whois_data = core.local_whois_data(result, geo_data)
+                else:
+                    whois_data = await _await_stage(whois_task, deadline_at, "whois", timed_out)
+                core.merge_whois_data(result, whois_data)
+
+        if core.RDNS:
+            with metrics.timer("hostname"):
+                hostname = None
+                if hostname_task is not None:
+                    hostname = await _await_stage(hostname_task, deadline_at, "hostname", timed_out)
+                result["hostname"] = hostname or "Unknown"
+    finally:
+        for task in (whois_task, hostname_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+    with metrics.timer("sanitize"):
+        result = core.sanitize_sensitive_data(result)
+        result = core.add_privacy_notice(result)
+    yield "whois", core.mask_postal(dict(result)) if snapshots else None
+
+    with metrics.timer("weather"):
+        if offline:
+            result["local_time"] = core.get_local_time(result["timezone"])
+            result["weather"] = core.unknown_weather()
+        elif result.get("latitude") and result.get("longitude") and result.get("timezone"):
+            extra = await _await_stage(
+                get_weather_and_time(result["latitude"], result["longitude"], result["timezone"]),
+                deadline_at, "weather", timed_out
+            )
+            if extra is None:
+                extra = {
+                    "local_time": core.get_local_time(result["timezone"]),
+                    "weather": core.unknown_weather()
+                }
+            result.update(extra)
+        else:
+            result["local_time"] = "Unknown"
+            result["weather"] = core.unknown_weather()
+
+    if timed_out:
+        result["partial"] = True
+        result["timed_out_stages"] = timed_out
+
+    result = core.mask_postal(result)
+    yield "weather", dict(result) if snapshots else None
+    yield "done", result
+
+
+async def lookup_ip_info(ip_address, deadline=None):
+    """Async version of app.lookup_ip_info with the same result shape"""
+    try:
+        async for stage, result in iter_lookup_stages(ip_address, deadline, snapshots=False):
+            pass
+        return result
+
+    except Exception as e:
+        logger.error(f"Error looking up IP {ip_address}: {e}")
+        return {"error": f"An error occurred: {str(e)}"}
+
+
+async def resolve_display_ip(client_address=None):
+    """Async version of app.resolve_display_ip"""
+    if core.IP_SOURCE == "request" and client_address and clientip.is_public(client_address):
+        return client_address, client_address if ":" in client_address else "Not available"
+
+    ipv4, ipv6 = await asyncio.gather(get_public_ipv4(), get_public_ipv6(), return_exceptions=True)
+    if isinstance(ipv4, Exception):
+        raise ipv4
+    if isinstance(ipv6, Exception) or not ipv6 or ipv6 == ipv4 or ":" not in ipv6:
+        ipv6 = "Not available"
+    return ipv4, ipv6
+
+
+async def get_ip_info(client_address=None):
+    try:
+        ip_address, ipv6 = await resolve_display_ip(client_address)
+
+        result = await lookup_ip_info(ip_address)
+        result['ipv6'] = ipv6
+        return result
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return {"error": f"An error occurred: {str(e)}"}
+
+
+async def iter_ip_info_events(client_address=None):
+    """Async version of app.iter_ip_info_events"""
+    try:
+        ip_address, ipv6 = await resolve_display_ip(client_address)
+        yield core.sse_event("ip", {"ipv4": ip_address, "ipv6": ipv6})
+
+        async for stage, result in iter_lookup_stages(ip_address):
+            if "error" not in result:
+                result['ipv6'] = ipv6
+            yield core.sse_event(stage, result)
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        yield core.sse_event("done", {"error": f"An error occurred: {str(e)}"})
+
+
+# ---- ASGI plumbing ----
+
+def _header(scope, name):
+    """All values of a request header joined with commas"""
+    values = [v.decode("latin-1") for k, v in scope.get("headers", []) if k.lower() == name]
+    return ", ".join(values)
+
+
+def request_client_ip(scope):
+    client = scope.get("client")
+    return clientip.client_ip(
+        client[0] if client else None,
+        forwarded=_header(scope, b"forwarded"),
+        x_forwarded_for=_header(scope, b"x-forwarded-for"),
+    )
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send(send, status, body, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_stream(send, chunks, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", content_type.encode()), *headers],
+    })
+    async for chunk in chunks:
+        await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _send_json(send, data, status=200, headers=()):
+    await _send(send, status, json.dumps(data).encode(), "application/json", headers)
+
+
+def render_index(ip_info):
+    with core.app.test_request_context("/"):
+        return render_template("index.html", ip_info=ip_info)
+
+
+async def _serve_static(send, path):
+    static_root = os.path.realpath(core.app.static_folder)
+    file_path = os.path.realpath(os.path.join(static_root, path[len("/static/"):]))
+    if not file_path.startswith(static_root + os.sep) or not os.path.isfile(file_path):
+        return await _send_json(send, {"error": "Not found"}, 404)
+
+    with open(file_path, "rb") as f:
+        body = f.read()
+    content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    await _send(send, 200, body, content_type, [(b"cache-control", b"public, max-age=3600")])
+
+
+async def internal_cache(scope, receive, send):
+    """Answer a cached call forwarded by another cluster node"""
+    if core._cluster is None:
+        return await _send_json(send, {"error": "Not found"}, 404)
+    if not core._cluster.authorized(_header(scope, cluster.TOKEN_HEADER.lower().encode())):
+        return await _send_json(send, {"error": "Forbidden"}, 403)
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        return await _send_json(send, {"error": "Invalid JSON body"}, 400)
+    func = CLUSTER_FUNCTIONS.get(data.get("function")) if isinstance(data, dict) else None
+    if func is None:
+        return await _send_json(send, {"error": "Unknown cached function"}, 400)
+    if not core.valid_cluster_call(data["function"], data.get("args")):
+        return await _send_json(send, {"error": "Invalid arguments"}, 400)
+    with core._cluster.serving():
+        body = await cluster.reply_async(func, tuple(data["args"]))
+    return await _send_json(send, body)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await http_client.close_async_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+ROUTES = {
+    "/": {"GET"},
+    "/api/ip-info": {"GET"},
+    "/api/ip-info/stream": {"GET"},
+    "/api/lookup": {"POST"},
+    "/api/clear-cache": {"POST"},
+    "/metrics": {"GET"},
+    cluster.PATH: {"POST"},
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+
+    if path.startswith("/static/") and method in ("GET", "HEAD"):
+        return await _serve_static(send, path)
+    if path not in ROUTES:
+        return await _send_json(send, {"error": "Not found"}, 404)
+    if method not in ROUTES[path]:
+        return await _send_json(send, {"error": "Method not allowed"}, 405)
+
+    if path == "/":
+        client_address = request_client_ip(scope)
+        if core.INDEX_MODE == "stream":
+            known = core.IP_SOURCE == "request" and clientip.is_public(client_address)
+            shell = {"loading": True, "ipv4": client_address if known else None}
+            if core.RDNS:
+                shell["hostname"] = None
+            html = render_index(shell)
+        else:
+            html = render_index(await get_ip_info(client_address))
+        return await _send(send, 200, html.encode(), "text/html; charset=utf-8")
+
+    if path == "/api/ip-info/stream":
+        return await _send_stream(
+            send, iter_ip_info_events(request_client_ip(scope)), "text/event-stream",
+            [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+        )
+
+    if path == "/api/ip-info":
+        return await _send_json(send, await get_ip_info(request_client_ip(scope)))
+
+    if path == "/metrics":
+        return await _send(send, 200, core.metrics_text().encode(), "text/plain; version=0.0.4")
+
+    if path == "/api/clear-cache":
+        await _cache_call(core._cache.clear)
+        for cache in list(core._prefix_caches.values()):
+            cache.clear()
+        core._resolver.clear()
+        return await _send_json(send, {"status": "success", "message": "Cache cleared successfully"})
+
+    if path == cluster.PATH:
+        return await internal_cache(scope, receive, send)
+
+    # /api/lookup
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        return await _send_json(send, {"error": "Invalid JSON body"}, 400)
+    ip_address = str(data.get('ip', '')).strip() if isinstance(data, dict) else ''
+    if not ip_address:
+        return await _send_json(send, {"error": "IP address is required"}, 400)
+    token = metrics.start_request() if core.SERVER_TIMING else None
+    result = await lookup_ip_info(ip_address)
+    headers = []
+    if token is not None:
+        headers.append((b"server-timing", metrics.server_timing(metrics.finish_request(token)).encode()))
+    await _send_json(send, result, headers=headers)
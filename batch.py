@@ -0,0 +1,84 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_IPS = int(os.getenv("BATCH_MAX_IPS", 100000))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 100))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_WORKERS", 32)),
+    thread_name_prefix="batch",
+)
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def iter_unique_ips(lines, max_ips=None):
+    """Yield stripped, de-duplicated IPs from an iterable of lines
+
+    Blank lines and ``#`` comments are skipped. Raises BatchTooLarge once
+    more than max_ips unique addresses have been read.
+    """
+    max_ips = BATCH_MAX_IPS if max_ips is None else max_ips
+    seen = set()
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        ip = line.strip()
+        if not ip or ip.startswith("#") or ip in seen:
+            continue
+        if len(seen) >= max_ips:
+            raise BatchTooLarge(f"Batch exceeds {max_ips} unique IPs")
+        seen.add(ip)
+        yield ip
+
+
+def stream_lookups(ips, lookup, prefetch=None, concurrency=None, chunk_size=None):
+    """Look up IPs with bounded concurrency, yielding (ip, result) as they finish
+
+    ``ips`` is consumed one chunk at a time. For each chunk ``prefetch`` (if
+    given) is called once with the list of IPs and may return a dict of
+    ip -> geo data, which is passed to ``lookup(ip, geo_data)``. At most
+    ``concurrency`` lookups are in flight, so memory stays flat regardless
+    of batch size.
+    """
+    concurrency = concurrency or BATCH_CONCURRENCY
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    ips = iter(ips)
+    queue = deque()
+    running = {}
+
+    while True:
+        if not queue:
+            chunk = list(islice(ips, chunk_size))
+            if chunk:
+                prefetched = {}
+                if prefetch is not None:
+                    try:
+                        prefetched = prefetch(chunk) or {}
+                    except Exception as e:
+                        logger.warning(f"Batch prefetch failed: {e}")
+                queue.extend((ip, prefetched.get(ip)) for ip in chunk)
+
+        while queue and len(running) < concurrency:
+            ip, geo_data = queue.popleft()
+            running[_executor.submit(lookup, ip, geo_data)] = ip
+
+        if not running:
+            return
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            ip = running.pop(future)
+            try:
+                yield ip, future.result()
+            except Exception as e:
+                logger.error(f"Batch lookup of {ip} failed: {e}")
+                yield ip, {"error": f"An error occurred: {str(e)}"}
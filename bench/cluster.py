@@ -0,0 +1,176 @@
+"""Run several app instances as a local cluster against mock providers.
+
+    python -m bench.cluster --nodes 3 --requests 300 --unique-ips 50
+    python -m bench.cluster --nodes 3 --no-cluster     # per-instance baseline
+
+The mock providers run in this process. Each node runs in its own process
+(``python -m bench.cluster --serve PORT ...``). Every lookup goes to a
+random node, and the report shows how often each provider was called. In
+cluster mode an IP costs one upstream call however many nodes see it.
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.mock_providers import MockProviderServer
+from bench.run import ip_pool, point_app_at, prepare_environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port, providers_url):
+    """Node process entry point: serve the app on port until killed"""
+    prepare_environment()
+    import app
+    from werkzeug.serving import make_server
+
+    point_app_at(app, types.SimpleNamespace(base_url=lambda provider: f"{providers_url}/{provider}"))
+    make_server("127.0.0.1", port, app.app, threaded=True).serve_forever()
+
+
+class LocalCluster:
+    """``count`` app processes on local ports, optionally forming a cluster
+
+    Use as a context manager. ``urls`` lists the nodes' base URLs and
+    ``stop(i)`` kills one node, e.g. to exercise replica fallback.
+    """
+
+    def __init__(self, count, providers_url, clustered=True, env=None, verbose=False):
+        self.ports = [free_port() for _ in range(count)]
+        self.urls = [f"http://127.0.0.1:{port}" for port in self.ports]
+        self.providers_url = providers_url
+        self.clustered = clustered
+        self.env = env or {}
+        self.verbose = verbose
+        self.secret = secrets.token_hex(16)
+        self.processes = []
+
+    def start(self, timeout=20):
+        for port, url in zip(self.ports, self.urls):
+            env = dict(os.environ, **self.env)
+            if self.clustered:
+                env.update(CLUSTER_NODES=",".join(self.urls), CLUSTER_SELF=url, CLUSTER_SECRET=self.secret)
+            output = None if self.verbose else subprocess.DEVNULL
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "bench.cluster", "--serve", str(port), "--providers", self.providers_url],
+                cwd=ROOT, env=env, stdout=output, stderr=output,
+            ))
+        deadline = time.monotonic() + timeout
+        for url in self.urls:
+            while True:
+                try:
+                    requests.get(url + "/api/cache-stats", timeout=1).raise_for_status()
+                    break
+                except requests.RequestException:
+                    if time.monotonic() > deadline:
+                        self.close()
+                        raise RuntimeError(f"Node {url} did not start")
+                    time.sleep(0.1)
+        return self
+
+    def stop(self, index):
+        self.processes[index].kill()
+        self.processes[index].wait()
+
+    def close(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self, index):
+        return requests.get(self.urls[index] + "/api/cache-stats", timeout=5).json()
+
+
+def drive(urls, ips, count, concurrency=16, seed=1):
+    """POST count lookups of random ips to random nodes; returns the error count"""
+    rng = random.Random(seed)
+    calls = [(rng.choice(urls), rng.choice(ips)) for _ in range(count)]
+    session = requests.Session()
+
+    def send(call):
+        url, ip = call
+        try:
+            response = session.post(url + "/api/lookup", json={"ip": ip}, timeout=30)
+            return response.status_code != 200 or "error" in response.json()
+        except (requests.RequestException, ValueError):
+            return True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(executor.map(send, calls))
+
+
+def run(nodes=3, requests_count=300, unique_ips=50, clustered=True, concurrency=16, seed=1, verbose=False):
+    """Run one cluster benchmark and return its report as a dict"""
+    ips = ip_pool(unique_ips, seed)
+    with MockProviderServer(seed=seed) as server:
+        with LocalCluster(nodes, server.url, clustered, verbose=verbose) as local:
+            started = time.perf_counter()
+            errors = drive(local.urls, ips, requests_count, concurrency, seed)
+            elapsed = time.perf_counter() - started
+            node_stats = [local.stats(i).get("cluster") for i in range(nodes)]
+        upstream = server.counts()
+
+    return {
+        "nodes": nodes,
+        "clustered": clustered,
+        "requests": requests_count,
+        "errors": errors,
+        "unique_ips": unique_ips,
+        "throughput_rps": round(requests_count / elapsed, 2) if elapsed else 0.0,
+        "upstream": upstream,
+        "calls_per_ip": {
+            provider: round(counts["ok"] / unique_ips, 2)
+            for provider, counts in upstream.items() if provider in ("ipapi", "ipwhois")
+        },
+        "cluster": node_stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local multi-process cluster against mock providers")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--unique-ips", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-cluster", action="store_true", help="run independent instances instead")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the nodes' logs")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--providers", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, args.providers)
+        return 0
+
+    report = run(args.nodes, args.requests, args.unique_ips, not args.no_cluster,
+                 args.concurrency, args.seed, args.verbose)
+    print(json.dumps(report, indent=2))
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
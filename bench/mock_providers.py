@@ -0,0 +1,214 @@
+"""Local stand-ins for the upstream APIs used by the app.
+
+One threaded HTTP server answers for every provider under a path prefix
+(``/ipapi/...``, ``/ip-api/...``, ...). Each provider has its own latency,
+jitter, error rate and 429 rate, and counts the calls it receives.
+Responses are deterministic for a given IP so caches behave as they would
+against the real services.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PROVIDERS = ("ipapi", "ip-api", "ipinfo", "ipwhois", "openweather", "ipify")
+
+CITIES = (
+    ("Mountain View", "California", "United States", "US", 37.386, -122.0838, "America/Los_Angeles", "94035"),
+    ("Manila", "Metro Manila", "Philippines", "PH", 14.5995, 120.9842, "Asia/Manila", "1000"),
+    ("Frankfurt", "Hesse", "Germany", "DE", 50.1109, 8.6821, "Europe/Berlin", "60311"),
+    ("Sydney", "New South Wales", "Australia", "AU", -33.8688, 151.2093, "Australia/Sydney", "2000"),
+)
+
+
+class ProviderProfile:
+    """Simulated behaviour of one upstream"""
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _record_for(ip):
+    digest = hashlib.sha256(ip.encode()).digest()
+    city = CITIES[digest[0] % len(CITIES)]
+    asn = 64500 + digest[1] % 20
+    return {
+        "city": city[0], "region": city[1], "country_name": city[2], "country_code": city[3],
+        "latitude": city[4], "longitude": city[5], "timezone": city[6], "postal": city[7],
+        "asn": f"AS{asn}", "org": f"Example Net {asn}",
+    }
+
+
+def _ipapi(ip, query):
+    r = _record_for(ip)
+    return {
+        "ip": ip, "city": r["city"], "region": r["region"], "country_name": r["country_name"],
+        "org": r["org"], "asn": r["asn"], "latitude": r["latitude"], "longitude": r["longitude"],
+        "timezone": r["timezone"], "postal": r["postal"], "network": ip.rsplit(".", 1)[0] + ".0/24" if "." in ip else None,
+    }
+
+
+def _ip_api(ip, query):
+    r = _record_for(ip)
+    return {
+        "status": "success", "query": ip, "city": r["city"], "regionName": r["region"],
+        "country": r["country_name"], "org": r["org"], "isp": r["org"], "as": r["asn"],
+        "asname": r["org"].upper(), "lat": r["latitude"], "lon": r["longitude"],
+        "timezone": r["timezone"], "zip": r["postal"],
+    }
+
+
+def _ipinfo(ip, query):
+    r = _record_for(ip)
+    return {
+        "ip": ip, "city": r["city"], "region": r["region"], "country": r["country_code"],
+        "loc": f"{r['latitude']},{r['longitude']}", "org": f"{r['asn']} {r['org']}",
+        "timezone": r["timezone"], "postal": r["postal"],
+    }
+
+
+def _ipwhois(ip, query):
+    r = _record_for(ip)
+    return {"success": True, "ip": ip, "org": r["org"], "isp": r["org"], "asn": r["asn"],
+            "asn_org": r["org"].upper(), "type": "IPv6" if ":" in ip else "IPv4"}
+
+
+def _openweather(ip, query):
+    return {
+        "main": {"temp": 21.5, "feels_like": 21.0, "humidity": 60},
+        "weather": [{"description": "few clouds"}],
+    }
+
+
+def _ipify(ip, query):
+    return {"ip": "203.0.113.10"}
+
+
+class MockProviderServer:
+    """Serve all stand-in providers on one local port
+
+    Use as a context manager, or call start()/stop(). ``base_url(name)``
+    gives the URL prefix for a provider; ``counts()`` the calls received.
+    """
+
+    def __init__(self, profiles=None, host="127.0.0.1", port=0, seed=None):
+        self.profiles = {name: ProviderProfile() for name in PROVIDERS}
+        self.profiles.update(profiles or {})
+        self._counts = {name: {"ok": 0, "error": 0, "throttled": 0} for name in PROVIDERS}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def base_url(self, provider):
+        return f"{self.url}/{provider}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def counts(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+    def reset_counts(self):
+        with self._lock:
+            for counts in self._counts.values():
+                for outcome in counts:
+                    counts[outcome] = 0
+
+    def _outcome(self, provider):
+        profile = self.profiles[provider]
+        with self._lock:
+            roll = self._random.random()
+            delay = max(0.0, self._random.gauss(profile.latency, profile.jitter))
+        if roll < profile.throttle_rate:
+            outcome = "throttled"
+        elif roll < profile.throttle_rate + profile.error_rate:
+            outcome = "error"
+        else:
+            outcome = "ok"
+        with self._lock:
+            self._counts[provider][outcome] += 1
+        return outcome, delay
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body, headers=()):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, body=None):
+                parts = urlsplit(self.path)
+                segments = [s for s in parts.path.split("/") if s]
+                provider = segments[0] if segments else ""
+                if provider not in server.profiles:
+                    return self._reply(404, {"error": "unknown provider"})
+
+                outcome, delay = server._outcome(provider)
+                time.sleep(delay)
+                if outcome == "throttled":
+                    return self._reply(429, {"error": "rate limited"}, [("Retry-After", "1")])
+                if outcome == "error":
+                    return self._reply(500, {"error": "simulated failure"})
+
+                query = parse_qs(parts.query)
+                if provider == "ip-api" and segments[1:2] == ["batch"]:
+                    items = [item.get("query", "") if isinstance(item, dict) else item for item in body or []]
+                    return self._reply(200, [_ip_api(ip, query) for ip in items])
+
+                handler = {
+                    "ipapi": _ipapi, "ip-api": _ip_api, "ipinfo": _ipinfo,
+                    "ipwhois": _ipwhois, "openweather": _openweather, "ipify": _ipify,
+                }[provider]
+                ip = next((s for s in segments[1:] if s not in ("json", "batch")), "")
+                self._reply(200, handler(ip, query))
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null")
+                self._handle(body)
+
+        return Handler
@@ -0,0 +1,250 @@
+"""Drive the app against local mock providers and report latency.
+
+    python -m bench.run --scenario default --rps 50 --duration 10
+    python -m bench.run --save-baseline default      # record bench/baselines/default.json
+    python -m bench.run --compare default            # exit 1 on a regression
+
+Requests are issued open-loop at a fixed rate and latency is measured from
+the scheduled send time, so a slow app shows up as queueing rather than as
+a lower request rate. No real upstream is contacted.
+"""
+import argparse
+import ipaddress
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.mock_providers import PROVIDERS, MockProviderServer, ProviderProfile
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+SCENARIOS = {
+    "default": {},
+    "slow-primary": {"ipapi": ProviderProfile(latency=0.8, jitter=0.2)},
+    "flaky": {
+        "ipapi": ProviderProfile(error_rate=0.2, throttle_rate=0.1),
+        "ipwhois": ProviderProfile(error_rate=0.1),
+    },
+    "throttled": {"ipapi": ProviderProfile(throttle_rate=0.5), "ip-api": ProviderProfile(throttle_rate=0.2)},
+}
+
+# Metrics compared against a baseline and the direction that is worse
+COMPARED = {"p50_ms": "higher", "p95_ms": "higher", "p99_ms": "higher",
+            "throughput_rps": "lower", "upstream_calls": "higher"}
+
+
+def prepare_environment():
+    """Settings that must be in place before app is imported"""
+    for provider in PROVIDERS:
+        os.environ.setdefault(f"RATE_LIMIT_{provider.upper().replace('-', '_')}", "0")
+    os.environ.setdefault("OPENWEATHER_API_KEY", "bench")
+    os.environ.setdefault("CACHE_BACKEND", "memory")
+
+
+URL_SETTINGS = ("WHOIS_URL", "IPAPI_URL", "IP_API_URL", "IP_API_BATCH_URL", "IPINFO_URL",
+                "WEATHER_URL", "IPIFY_V4_URL", "IPIFY_V6_URL")
+
+
+def point_app_at(app, server):
+    """Rewrite the app's upstream URL templates to the mock server
+
+    Returns the previous values so they can be restored afterwards.
+    """
+    original = {name: getattr(app, name) for name in URL_SETTINGS}
+    base = server.base_url
+    app.WHOIS_URL = base("ipwhois") + "/json/{ip}"
+    app.IPAPI_URL = base("ipapi") + "/{ip}/json/"
+    app.IP_API_URL = base("ip-api") + "/json/{ip}?fields={fields}"
+    app.IP_API_BATCH_URL = base("ip-api") + "/batch?fields={fields}"
+    app.IPINFO_URL = base("ipinfo") + "/{ip}/json"
+    app.WEATHER_URL = base("openweather") + "/data/2.5/weather?lat={lat:.4f}&lon={lon:.4f}&appid={key}&units=metric"
+    app.IPIFY_V4_URL = base("ipify") + "?format=json"
+    app.IPIFY_V6_URL = base("ipify") + "?format=json"
+    return original
+
+
+def ip_pool(count, seed):
+    rng = random.Random(seed)
+    pool = []
+    while len(pool) < count:
+        ip = ipaddress.IPv4Address(rng.getrandbits(32))
+        if ip.is_global:
+            pool.append(str(ip))
+    return pool
+
+
+def skewed_choice(rng, pool):
+    """Pick popular IPs more often, like real traffic"""
+    return pool[int(len(pool) * rng.random() ** 2)]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def make_target(app, target):
+    if target == "lookup":
+        return app.lookup_ip_info
+
+    def call_api(ip):
+        response = app.app.test_client().post("/api/lookup", json={"ip": ip})
+        return response.get_json()
+    return call_api
+
+
+def run(scenario="default", target="lookup", rps=50, duration=10, unique_ips=200,
+        concurrency=64, seed=1):
+    """Run one benchmark and return its report as a dict"""
+    prepare_environment()
+    import app
+
+    with MockProviderServer(SCENARIOS[scenario], seed=seed) as server:
+        original = point_app_at(app, server)
+        app._cache.clear()
+        try:
+            report = _drive(app, server, make_target(app, target), rps, duration, unique_ips, concurrency, seed)
+        finally:
+            for name, value in original.items():
+                setattr(app, name, value)
+            app._cache.clear()
+
+    report.update(scenario=scenario, target=target, target_rps=rps, duration_s=duration)
+    return report
+
+
+def _drive(app, server, call, rps, duration, unique_ips, concurrency, seed):
+    rng = random.Random(seed)
+    pool = ip_pool(unique_ips, seed)
+    total = int(rps * duration)
+    latencies, errors, partial = [], [0], [0]
+    lock = threading.Lock()
+
+    def send(ip, scheduled):
+        try:
+            result = call(ip)
+            failed = not isinstance(result, dict) or "error" in result
+            was_partial = isinstance(result, dict) and result.get("partial")
+        except Exception:
+            failed, was_partial = True, False
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.append(elapsed)
+            errors[0] += failed
+            partial[0] += bool(was_partial)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool_executor:
+        for i in range(total):
+            scheduled = started + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool_executor.submit(send, skewed_choice(rng, pool), scheduled)
+    elapsed = time.perf_counter() - started
+    upstream = server.counts()
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "partial": partial[0],
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "upstream_calls": sum(sum(counts.values()) for counts in upstream.values()),
+        "upstream": upstream,
+        "cache_hit_ratio": app._cache.stats()["hit_ratio"],
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Return a list of human-readable regressions against baseline"""
+    regressions = []
+    for key, worse in COMPARED.items():
+        old, new = baseline.get(key), report.get(key)
+        if old is None or new is None:
+            continue
+        if worse == "higher" and new > old * (1 + tolerance):
+            regressions.append(f"{key}: {new} > {old} (+{tolerance:.0%} allowed)")
+        elif worse == "lower" and new < old * (1 - tolerance):
+            regressions.append(f"{key}: {new} < {old} (-{tolerance:.0%} allowed)")
+    return regressions
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def format_report(report):
+    lines = [
+        f"scenario={report['scenario']} target={report['target']} "
+        f"rps={report['target_rps']} duration={report['duration_s']}s",
+        f"requests={report['requests']} errors={report['errors']} partial={report['partial']} "
+        f"throughput={report['throughput_rps']} req/s",
+        f"latency p50={report['p50_ms']}ms p95={report['p95_ms']}ms "
+        f"p99={report['p99_ms']}ms max={report['max_ms']}ms",
+        f"upstream calls={report['upstream_calls']} cache hit ratio={report['cache_hit_ratio']}",
+    ]
+    for provider, counts in report["upstream"].items():
+        lines.append(f"  {provider:<12} " + " ".join(f"{k}={v}" for k, v in counts.items()))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the lookup pipeline against mock providers")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="default")
+    parser.add_argument("--target", choices=("lookup", "api"), default="lookup",
+                        help="call lookup_ip_info directly or POST /api/lookup")
+    parser.add_argument("--rps", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--ips", type=int, default=200, help="number of distinct IPs")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args(argv)
+    if args.compare and not os.path.exists(baseline_path(args.compare)):
+        parser.error(f"no baseline {baseline_path(args.compare)}; "
+                     f"record one with --save-baseline {args.compare}")
+
+    report = run(args.scenario, args.target, args.rps, args.duration, args.ips, args.concurrency, args.seed)
+    text = format_report(report)
+
+    status = 0
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            text += "\nREGRESSIONS vs " + args.compare + ":\n" + "\n".join("  " + r for r in regressions)
+            status = 1
+        else:
+            text += f"\nno regressions vs {args.compare}"
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save_baseline), "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        text += f"\nsaved baseline {baseline_path(args.save_baseline)}"
+
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+import heapq
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import records
+
+
+def estimate_size(value):
+    """Roughly estimate the memory footprint of a cached value in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, records.Record):
+        for name in value.fields:
+            size += estimate_size(getattr(value, name))
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k) + estimate_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+class CacheBackend:
+    """Base class for cache_result backends
+
+    Backends implement get(key, namespace=None, record=True) -> (found, value),
+    set(key, value, ttl), delete(key) and clear(). Hit/miss counters are kept
+    per process.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._namespaces = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __contains__(self, key):
+        return self.get(key, record=False)[0]
+
+    def _record(self, found, namespace):
+        counter = "hits" if found else "misses"
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            if namespace is not None:
+                stats = self._namespaces.get(namespace)
+                if stats is None:
+                    stats = self._namespaces[namespace] = {"hits": 0, "misses": 0}
+                stats[counter] += 1
+
+    def get(self, key, namespace=None, record=True):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "functions": {name: dict(stats) for name, stats in self._namespaces.items()},
+            }
+
+
+class TTLCache(CacheBackend):
+    """Thread-safe LRU cache with per-entry expiry and entry/byte limits
+
+    With ``compact`` (the default) dicts are stored as slotted records (see
+    records.py) and rebuilt on every hit, so callers get a private copy.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries=10000, max_bytes=None, compact=True):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compact = compact
+        self._data = OrderedDict()  # key -> (expires_at, value, size)
+        self._expiry = []  # heap of (expires_at, key), may hold stale pairs
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _purge_expired(self, now):
+        """Pop expired entries off the expiry heap, amortized O(log n) each"""
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == expires_at:
+                self._remove(key)
+                self.expirations += 1
+
+        # Overwritten keys leave stale heap pairs behind; rebuild occasionally
+        if len(heap) > 2 * len(self._data) + 64:
+            self._expiry = [(entry[0], key) for key, entry in self._data.items()]
+            heapq.heapify(self._expiry)
+
+    def _evict_to_fit(self):
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def get(self, key, namespace=None, record=True):
+        """Return (found, value) for key, refreshing its LRU position on a hit"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            found = entry is not None and entry[0] > now
+            if entry is not None and not found:
+                self._remove(key)
+                self.expirations += 1
+            if found:
+                self._data.move_to_end(key)
+        if record:
+            self._record(found, namespace)
+        if not found:
+            return False, None
+        return True, records.unpack(entry[1]) if self.compact else entry[1]
+
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds, evicting LRU entries if full"""
+        now = time.time()
+        expires_at = now + ttl
+        if self.compact:
+            value = records.pack(value)
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            heapq.heappush(self._expiry, (expires_at, key))
+            self._purge_expired(now)
+            self._evict_to_fit()
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._expiry = []
+            self._bytes = 0
+
+    def stats(self):
+        """Return a snapshot of cache size and hit/miss/eviction counters"""
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            })
+        return stats
+
+
+class SQLiteCache(CacheBackend):
+    """On-disk cache shared by every process that opens the same file
+
+    Values are stored as JSON. Expired rows are purged every PURGE_EVERY
+    writes, and the rows closest to expiry are dropped once the table grows
+    past max_entries.
+    """
+
+    name = "sqlite"
+    PURGE_EVERY = 256
+
+    def __init__(self, path, max_entries=100000):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, namespace=None, record=True):
+        row = self._connect().execute(
+            "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        found = row is not None and row[0] > time.time()
+        if row is not None and not found:
+            self.delete(key)
+            with self._stats_lock:
+                self.expirations += 1
+        if record:
+            self._record(found, namespace)
+        return (True, json.loads(row[1])) if found else (False, None)
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+            (key, now + ttl, json.dumps(value)),
+        )
+        with self._stats_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self._purge(conn, now)
+
+    def _purge(self, conn, now):
+        expired = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY expires_at LIMIT ?)", (overflow,)
+            ).rowcount
+        with self._stats_lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def stats(self):
+        stats = super().stats()
+        stats["entries"] = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        stats["max_entries"] = self.max_entries
+        stats["path"] = self.path
+        return stats
+
+
+class RedisCache(CacheBackend):
+    """Cache stored in a Redis-protocol key-value server
+
+    Works with Redis, Valkey, KeyDB or Dragonfly through the optional
+    ``redis`` package. Keys are namespaced with ``prefix`` so clear() only
+    removes entries written by this app.
+    """
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="ipinfo:", client=None):
+        super().__init__()
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key, namespace=None, record=True):
+        raw = self.client.get(self.prefix + key)
+        found = raw is not None
+        if record:
+            self._record(found, namespace)
+        return (True, json.loads(raw)) if found else (False, None)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), px=max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*", count=500))
+        for start in range(0, len(keys), 500):
+            self.client.delete(*keys[start:start + 500])
+
+    def stats(self):
+        stats = super().stats()
+        stats["prefix"] = self.prefix
+        return stats
+
+
+def create_cache(backend="memory", **options):
+    """Build a cache backend by name (memory, sqlite or redis)"""
+    if backend == "sqlite":
+        return SQLiteCache(options.get("path", "cache.sqlite3"), max_entries=options.get("max_entries", 100000))
+    if backend == "redis":
+        return RedisCache(options.get("url", "redis://localhost:6379/0"), prefix=options.get("prefix", "ipinfo:"))
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return TTLCache(
+        max_entries=options.get("max_entries", 10000),
+        max_bytes=options.get("max_bytes"),
+        compact=options.get("compact", True),
+    )
+
+
+class CachedFailure(Exception):
+    """Raised instead of calling upstream while a recent failure is cached"""
+
+
+def make_entry(value, ttl, error=None):
+    """Wrap a cache_result value with the time it goes stale
+
+    ``error`` marks a negative entry recording a failed call.
+    """
+    return {"value": value, "fresh_until": time.time() + ttl, "error": error}
+
+
+def entry_state(entry):
+    """Return "fresh", "stale", or None if entry is not a make_entry envelope"""
+    if not isinstance(entry, dict) or "fresh_until" not in entry:
+        return None
+    return "fresh" if entry["fresh_until"] > time.time() else "stale"
+
+
+def entry_value(entry):
+    """Unwrap an entry, raising CachedFailure for a negative one"""
+    if entry.get("error") is not None:
+        raise CachedFailure(entry["error"])
+    return entry["value"]
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._namespaces = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _count(self, namespace, counter):
+        setattr(self, counter, getattr(self, counter) + 1)
+        if namespace is not None:
+            stats = self._namespaces.get(namespace)
+            if stats is None:
+                stats = self._namespaces[namespace] = {"executions": 0, "coalesced": 0}
+            stats[counter] += 1
+
+    def do(self, key, func, namespace=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._count(namespace, "executions")
+            else:
+                flight.waiters += 1
+                self._count(namespace, "coalesced")
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+                "functions": {name: dict(stats) for name, stats in self._namespaces.items()},
+            }
@@ -0,0 +1,216 @@
+"""Batch classification of IP addresses and organisation names.
+
+IP arrays are packed into NumPy integer arrays (uint32 for IPv4, a pair of
+uint64 halves for IPv6) and tested against precompiled CIDR tables in one
+vectorized pass. Organisation keywords are matched with a single combined
+regex instead of looping over keyword lists.
+
+The keyword matchers only need the standard library; the IP functions need
+NumPy.
+"""
+import ipaddress
+import re
+import socket
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ---- Organisation keyword matching ----
+
+PRIVATE_INDICATORS = (
+    'internal', 'private', 'corp', 'intranet', 'lan', 'vpn',
+    'employee', 'staff', 'admin', 'secure'
+)
+RESTRICTED_ORG_WORDS = ('government', 'military', 'defense')
+
+PRIVATE_INDICATORS_RE = re.compile("|".join(map(re.escape, PRIVATE_INDICATORS)), re.IGNORECASE)
+RESTRICTED_ORG_RE = re.compile("|".join(map(re.escape, RESTRICTED_ORG_WORDS)), re.IGNORECASE)
+
+
+def is_private_org(name):
+    """True if an org/owner name looks like an internal network"""
+    return bool(name) and PRIVATE_INDICATORS_RE.search(name) is not None
+
+
+def is_restricted_org(name):
+    """True if an org name looks like a government/military network"""
+    return bool(name) and RESTRICTED_ORG_RE.search(name) is not None
+
+
+def private_org_mask(names):
+    """is_private_org over a sequence of names, as a list of bools"""
+    search = PRIVATE_INDICATORS_RE.search
+    return [bool(name) and search(name) is not None for name in names]
+
+
+# ---- CIDR tables ----
+
+# Mirrors ipaddress' is_private ranges (RFC 6890 special-purpose blocks)
+PRIVATE_CIDRS = (
+    "0.0.0.0/8", "10.0.0.0/8", "127.0.0.0/8", "169.254.0.0/16",
+    "172.16.0.0/12", "192.0.0.0/29", "192.0.0.170/31", "192.0.2.0/24",
+    "192.168.0.0/16", "198.18.0.0/15", "198.51.100.0/24", "203.0.113.0/24",
+    "240.0.0.0/4", "255.255.255.255/32",
+    "::1/128", "::/128", "::ffff:0:0/96", "100::/64", "2001::/23",
+    "2001:2::/48", "2001:db8::/32", "2001:10::/28", "fc00::/7", "fe80::/10",
+)
+
+# Not globally routable for other reasons: CGNAT, multicast, future use
+RESERVED_CIDRS = (
+    "0.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8", "169.254.0.0/16",
+    "224.0.0.0/4", "240.0.0.0/4",
+    "::/128", "::1/128", "fe80::/10", "fec0::/10", "ff00::/8",
+)
+
+# Addresses that should never appear as a public source address
+BOGON_CIDRS = (
+    "0.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8",
+    "169.254.0.0/16", "172.16.0.0/12", "192.0.0.0/24", "192.0.2.0/24",
+    "192.168.0.0/16", "198.18.0.0/15", "198.51.100.0/24", "203.0.113.0/24",
+    "224.0.0.0/4", "240.0.0.0/4",
+    "::/8", "100::/64", "2001:2::/48", "2001:10::/28", "2001:db8::/32",
+    "3ffe::/16", "fc00::/7", "fe80::/10", "fec0::/10", "ff00::/8",
+)
+
+_MASK64 = (1 << 64) - 1
+
+# Rows compared against the whole table at once; bounds the temporary
+# (rows x ranges) boolean matrix.
+CHUNK_SIZE = 65536
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for batch IP classification (pip install numpy)")
+
+
+class CIDRTable:
+    """A precompiled set of IPv4 and IPv6 networks"""
+
+    def __init__(self, cidrs):
+        _require_numpy()
+        v4, v6 = [], []
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr, strict=False)
+            start, end = int(network.network_address), int(network.broadcast_address)
+            if network.version == 4:
+                v4.append((start, end))
+            else:
+                v6.append((start >> 64, start & _MASK64, end >> 64, end & _MASK64))
+
+        v4 = np.array(v4, dtype=np.uint32).reshape(-1, 2)
+        v6 = np.array(v6, dtype=np.uint64).reshape(-1, 4)
+        self.v4_start, self.v4_end = v4[:, 0], v4[:, 1]
+        self.v6_start_hi, self.v6_start_lo = v6[:, 0], v6[:, 1]
+        self.v6_end_hi, self.v6_end_lo = v6[:, 2], v6[:, 3]
+
+    def _contains_v4(self, values):
+        out = np.zeros(len(values), dtype=bool)
+        if not len(self.v4_start):
+            return out
+        for i in range(0, len(values), CHUNK_SIZE):
+            x = values[i:i + CHUNK_SIZE, None]
+            out[i:i + CHUNK_SIZE] = ((x >= self.v4_start) & (x <= self.v4_end)).any(axis=1)
+        return out
+
+    def _contains_v6(self, hi, lo):
+        out = np.zeros(len(hi), dtype=bool)
+        if not len(self.v6_start_hi):
+            return out
+        for i in range(0, len(hi), CHUNK_SIZE):
+            h = hi[i:i + CHUNK_SIZE, None]
+            l = lo[i:i + CHUNK_SIZE, None]
+            above = (h > self.v6_start_hi) | ((h == self.v6_start_hi) & (l >= self.v6_start_lo))
+            below = (h < self.v6_end_hi) | ((h == self.v6_end_hi) & (l <= self.v6_end_lo))
+            out[i:i + CHUNK_SIZE] = (above & below).any(axis=1)
+        return out
+
+    def contains(self, packed):
+        """Boolean array: which addresses in a PackedIPs fall inside the table"""
+        out = np.zeros(len(packed), dtype=bool)
+        out[packed.v4_index] = self._contains_v4(packed.v4)
+        out[packed.v6_index] = self._contains_v6(packed.v6_hi, packed.v6_lo)
+        return out
+
+
+class PackedIPs:
+    """IP strings parsed into packed integer arrays
+
+    ``v4`` holds uint32 values for the IPv4 rows listed in ``v4_index``;
+    ``v6_hi``/``v6_lo`` hold the two uint64 halves for ``v6_index``.
+    Rows that failed to parse have ``valid`` False.
+    """
+
+    def __init__(self, ips):
+        _require_numpy()
+        v4_bytes, v4_index = [], []
+        v6_bytes, v6_index = [], []
+        inet_pton = socket.inet_pton
+
+        for i, ip in enumerate(ips):
+            try:
+                v4_bytes.append(inet_pton(socket.AF_INET, ip))
+                v4_index.append(i)
+                continue
+            except (OSError, TypeError):
+                pass
+            try:
+                v6_bytes.append(inet_pton(socket.AF_INET6, ip))
+                v6_index.append(i)
+            except (OSError, TypeError):
+                pass
+
+        self.size = len(ips)
+        self.v4_index = np.array(v4_index, dtype=np.intp)
+        self.v6_index = np.array(v6_index, dtype=np.intp)
+        self.v4 = np.frombuffer(b"".join(v4_bytes), dtype=">u4").astype(np.uint32)
+        v6 = np.frombuffer(b"".join(v6_bytes), dtype=">u8").astype(np.uint64).reshape(-1, 2)
+        self.v6_hi, self.v6_lo = v6[:, 0], v6[:, 1]
+
+        self.version = np.zeros(self.size, dtype=np.uint8)
+        self.version[self.v4_index] = 4
+        self.version[self.v6_index] = 6
+        self.valid = self.version != 0
+
+    def __len__(self):
+        return self.size
+
+
+_tables = {}
+
+
+def _table(name, cidrs):
+    table = _tables.get(name)
+    if table is None:
+        table = _tables[name] = CIDRTable(cidrs)
+    return table
+
+
+def classify(ips, custom=None):
+    """Classify a sequence of IP strings in one vectorized pass
+
+    Returns a dict of equal-length boolean arrays: valid, ipv4, private,
+    reserved, bogon and (when ``custom`` CIDRs or a CIDRTable are given)
+    custom.
+    """
+    packed = ips if isinstance(ips, PackedIPs) else PackedIPs(list(ips))
+    result = {
+        "valid": packed.valid,
+        "ipv4": packed.version == 4,
+        "private": _table("private", PRIVATE_CIDRS).contains(packed),
+        "reserved": _table("reserved", RESERVED_CIDRS).contains(packed),
+        "bogon": _table("bogon", BOGON_CIDRS).contains(packed),
+    }
+    if custom is not None:
+        table = custom if isinstance(custom, CIDRTable) else CIDRTable(custom)
+        result["custom"] = table.contains(packed)
+    return result
+
+
+def routable_mask(ips):
+    """Boolean array of addresses that are valid and worth an upstream lookup"""
+    flags = classify(ips)
+    return flags["valid"] & ~flags["private"] & ~flags["bogon"] & ~flags["reserved"]
@@ -0,0 +1,120 @@
+"""Resolve the visitor's address from a request.
+
+Forwarding headers are only believed when they were added by a trusted
+proxy: the chain of hops is walked from the nearest one (the socket peer)
+outwards and the first address that is not a trusted proxy is the client.
+Configure the proxies in front of the app with TRUSTED_PROXIES, a comma
+separated list of addresses or CIDRs (default: loopback only).
+"""
+import ipaddress
+import os
+import re
+
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.0/8,::1")
+
+
+def parse_networks(value):
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+
+_trusted = parse_networks(TRUSTED_PROXIES)
+
+
+def normalize(value):
+    """Strip quotes, brackets and ports from a forwarded address; None if not an IP"""
+    value = value.strip().strip('"')
+    if value.startswith("["):
+        value = value[1:value.find("]")] if "]" in value else value[1:]
+    elif value.count(":") == 1:
+        value = value.split(":", 1)[0]  # IPv4 with a port
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return str(address)
+
+
+def parse_x_forwarded_for(value):
+    """Hops listed in X-Forwarded-For, client first"""
+    return [normalize(hop) for hop in value.split(",") if hop.strip()]
+
+
+def parse_forwarded(value):
+    """Hops from the ``for=`` parameters of an RFC 7239 Forwarded header"""
+    hops = []
+    for element in value.split(","):
+        for pair in element.split(";"):
+            name, _, param = pair.partition("=")
+            if name.strip().lower() == "for":
+                hops.append(normalize(param))
+    return hops
+
+
+# Runs of characters that can make up an address, with an optional port
+_CANDIDATE = re.compile(rb"[0-9A-Fa-f:.\[\]]{3,}")
+
+
+def find_ip(line, field=None):
+    """The first address in a log line (bytes), or None
+
+    With ``field`` only that whitespace-separated field is considered.
+    """
+    if field is not None:
+        parts = line.split()
+        candidates = [parts[field]] if -len(parts) <= field < len(parts) else []
+    else:
+        candidates = _CANDIDATE.findall(line)
+    for candidate in candidates:
+        ip = normalize(candidate.decode("ascii", "replace"))
+        if ip is not None:
+            return ip
+    return None
+
+
+def is_trusted(ip, trusted=None):
+    address = ipaddress.ip_address(ip)
+    return any(address in net for net in (_trusted if trusted is None else trusted))
+
+
+def client_ip(remote_addr, forwarded=None, x_forwarded_for=None, trusted=None):
+    """Return the client address for a request
+
+    ``forwarded`` and ``x_forwarded_for`` are the raw header values (all
+    occurrences joined with commas). Forwarded wins when both are present.
+    Headers are ignored unless ``remote_addr`` is a trusted proxy.
+    """
+    client = normalize(remote_addr or "")
+    if client is None:
+        return None
+
+    if forwarded:
+        hops = parse_forwarded(forwarded)
+    elif x_forwarded_for:
+        hops = parse_x_forwarded_for(x_forwarded_for)
+    else:
+        hops = []
+
+    for hop in reversed(hops):
+        if not is_trusted(client, trusted):
+            break
+        if hop is None:
+            # Obfuscated, "unknown" or malformed hop: stop at the last
+            # address we could verify
+            break
+        client = hop
+    return client
+
+
+def is_public(ip):
+    """True for globally routable addresses worth a geo lookup"""
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
@@ -0,0 +1,218 @@
+"""Consistent-hash routing of cache misses between app instances.
+
+Every node lists the same CLUSTER_NODES. Cache keys are placed on a hash
+ring with ``vnodes`` points per node. The first ``replicas`` distinct nodes
+clockwise from a key own it. A node that misses its local cache asks the
+key's owner over POST /internal/cache. The owner answers from its own cache
+or fetches upstream once, coalescing concurrent callers. If the owner is
+down, the next replica is asked. If none answers, the node fetches the key
+itself. Adding or removing a node moves only about 1/N of the keys.
+
+Calls received from another node always run locally, so a request is
+forwarded at most once.
+"""
+import bisect
+import contextlib
+import contextvars
+import hashlib
+import hmac
+import logging
+import threading
+
+import http_client
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+PATH = "/internal/cache"
+TOKEN_HEADER = "X-Cluster-Token"
+
+_serving = contextvars.ContextVar("cluster_serving", default=False)
+
+
+class RemoteError(Exception):
+    """A forwarded call failed on the owning node"""
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def normalize_node(url):
+    return url.strip().rstrip("/")
+
+
+class HashRing:
+    """Nodes placed at ``vnodes`` points each on a 64-bit hash ring"""
+
+    def __init__(self, nodes, vnodes=64):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owners(self, key, count=1):
+        """The first ``count`` distinct nodes clockwise from key"""
+        if not self._nodes:
+            return []
+        count = min(count, len(self.nodes))
+        start = bisect.bisect(self._hashes, _hash(key))
+        owners = []
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in owners:
+                owners.append(node)
+                if len(owners) == count:
+                    break
+        return owners
+
+
+class Cluster:
+    """This node's view of the cluster: the ring, peer health and counters"""
+
+    def __init__(self, self_url, nodes, replicas=2, vnodes=64, timeout=12, secret=None,
+                 failures=2, cooldown=10):
+        self.self_url = normalize_node(self_url)
+        self.ring = HashRing([normalize_node(node) for node in nodes] + [self.self_url], vnodes)
+        self.replicas = max(1, replicas)
+        self.timeout = timeout
+        self.secret = secret
+        self._breakers = {
+            node: ratelimit.CircuitBreaker(failures, cooldown)
+            for node in self.ring.nodes if node != self.self_url
+        }
+        self._counts = {"local": 0, "forwarded": 0, "replica": 0, "fallback": 0,
+                        "peer_errors": 0, "served": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+
+    def owners(self, key):
+        return self.ring.owners(key, self.replicas)
+
+    def is_local(self, key):
+        return self.self_url in self.owners(key)
+
+    def _targets(self, key):
+        """Peers to ask for key, in order, or None when this node should fetch it"""
+        if _serving.get():
+            return None
+        targets = []
+        for node in self.owners(key):
+            if node == self.self_url:
+                break
+            targets.append(node)
+        return targets or None
+
+    def _headers(self):
+        return {TOKEN_HEADER: self.secret} if self.secret else {}
+
+    def _result(self, index, node, data):
+        self._breakers[node].record_success()
+        self._count("forwarded" if index == 0 else "replica")
+        if "error" in data:
+            if data.get("unavailable"):
+                raise ratelimit.ProviderUnavailable(data["error"])
+            raise RemoteError(data["error"])
+        return data["value"]
+
+    def _failed(self, node, error):
+        self._breakers[node].record_failure()
+        self._count("peer_errors")
+        logger.warning(f"Cluster node {node} failed: {error}")
+
+    def call(self, key, name, args, local):
+        """Run the cached call ``name(*args)`` on the node that owns key
+
+        ``local`` fetches it here. It is used when this node owns the key,
+        when the call was itself forwarded, or when no owner can be reached.
+        """
+        targets = self._targets(key)
+        if targets is not None:
+            payload = {"function": name, "args": list(args)}
+            session = http_client.get_session("cluster")
+            for index, node in enumerate(targets):
+                if not self._breakers[node].allow():
+                    continue
+                try:
+                    response = session.post(node + PATH, json=payload, headers=self._headers(),
+                                            timeout=self.timeout)
+                    response.raise_for_status()
+                    data = response.json()
+                except Exception as e:
+                    self._failed(node, e)
+                    continue
+                return self._result(index, node, data)
+            self._count("fallback")
+        else:
+            self._count("local")
+        return local()
+
+    async def call_async(self, key, name, args, local):
+        """Async version of call(); ``local`` is a coroutine function"""
+        targets = self._targets(key)
+        if targets is not None:
+            payload = {"function": name, "args": list(args)}
+            client = http_client.get_async_client("cluster")
+            for index, node in enumerate(targets):
+                if not self._breakers[node].allow():
+                    continue
+                try:
+                    response = await client.post(node + PATH, json=payload, headers=self._headers(),
+                                                 timeout=self.timeout)
+                    response.raise_for_status()
+                    data = response.json()
+                except Exception as e:
+                    self._failed(node, e)
+                    continue
+                return self._result(index, node, data)
+            self._count("fallback")
+        else:
+            self._count("local")
+        return await local()
+
+    def authorized(self, token):
+        """Whether token matches the shared secret; without a secret nothing is"""
+        return bool(self.secret) and hmac.compare_digest(token or "", self.secret)
+
+    @contextlib.contextmanager
+    def serving(self):
+        """Run a call forwarded by another node, without forwarding it again"""
+        self._count("served")
+        token = _serving.set(True)
+        try:
+            yield
+        finally:
+            _serving.reset(token)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+        stats["self"] = self.self_url
+        stats["replicas"] = self.replicas
+        stats["nodes"] = {
+            node: "self" if node == self.self_url else self._breakers[node].current_state()
+            for node in self.ring.nodes
+        }
+        return stats
+
+
+def reply(func, args):
+    """Run a forwarded call; returns the JSON body for the calling node"""
+    try:
+        return {"value": func(*args)}
+    except ratelimit.ProviderUnavailable as e:
+        return {"error": http_client.describe_error(e), "unavailable": True}
+    except Exception as e:
+        return {"error": http_client.describe_error(e)}
+
+
+async def reply_async(func, args):
+    try:
+        return {"value": await func(*args)}
+    except ratelimit.ProviderUnavailable as e:
+        return {"error": http_client.describe_error(e), "unavailable": True}
+    except Exception as e:
+        return {"error": http_client.describe_error(e)}
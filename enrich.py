@@ -0,0 +1,304 @@
+"""Enrich access logs with IP data from the command line.
+
+    python enrich.py access.log -o enriched.ndjson
+    python enrich.py access.log -o enriched.csv --format csv --workers 8
+
+The log is memory-mapped and read twice. The first pass collects the unique
+addresses in order of first appearance. They are then resolved in chunks
+over a process pool with lookup_ip_info. Each chunk is prefetched through
+the ip-api.com batch endpoint, like /api/lookup/batch. The second pass
+writes one output row per input line, in input order.
+
+Resolved addresses are appended to a checkpoint file as chunks finish, so
+an interrupted run picks up where it stopped; addresses that failed are
+tried again. Worker processes share results through the cache backend:
+point CACHE_BACKEND at sqlite or redis to reuse them across workers and
+runs. Workers read the same .env and environment settings as the app
+(GEOIP_DB, rate limits, ...), and each gets an equal share of every rate
+limit, so the run as a whole stays within them.
+"""
+import argparse
+import csv
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import app
+import batch
+import clientip
+import ratelimit
+import records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = ("city", "region", "country", "org", "isp", "asn", "latitude", "longitude", "timezone")
+
+def extract_ip(line, field=None):
+    """The first valid IP in a log line (bytes), or None"""
+    return clientip.find_ip(line, field)
+
+
+def iter_lines(mm):
+    """Lines of a memory-mapped file without their line endings"""
+    for line in iter(mm.readline, b""):
+        yield line.rstrip(b"\r\n")
+
+
+def unique_ips(mm, field=None):
+    """Unique addresses in order of first appearance, and the line count"""
+    seen = {}
+    count = 0
+    for count, line in enumerate(iter_lines(mm), 1):
+        ip = extract_ip(line, field)
+        if ip is not None and ip not in seen:
+            seen[ip] = None
+    mm.seek(0)
+    return list(seen), count
+
+
+def load_checkpoint(path):
+    """{ip: row} of the successful rows in a checkpoint file
+
+    Failed rows are left out so they are retried; a torn last line is ignored.
+    """
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry["row"].get("error"):
+                done.pop(entry["ip"], None)
+            else:
+                done[entry["ip"]] = records.pack(entry["row"])
+    return done
+
+
+def to_row(result, fields):
+    """The output columns of a lookup result"""
+    if "error" in result:
+        return dict({name: None for name in fields}, error=result["error"])
+    row = {name: result.get(name) for name in fields}
+    row["error"] = None
+    return row
+
+
+def resolve_chunk(ips, fields, concurrency):
+    """Worker entry point: look up one chunk of IPs, returning [(ip, row)]"""
+    def prefetch(chunk):
+        try:
+            return app.get_ip_api_batch(chunk)
+        except Exception as e:
+            logger.warning(f"Batch prefetch failed: {e}")
+            return {}
+
+    lookups = batch.stream_lookups(
+        ips,
+        lambda ip, geo_data: app.lookup_ip_info(ip, geo_data=geo_data),
+        prefetch=prefetch,
+        concurrency=concurrency,
+        chunk_size=len(ips),
+    )
+    return [(ip, to_row(result, fields)) for ip, result in lookups]
+
+
+class Progress:
+    """Periodic progress lines on stderr"""
+
+    def __init__(self, total, interval=5.0, stream=None):
+        self.total = total
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.done = 0
+        self.started = time.monotonic()
+        self._last = self.started
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed else 0.0
+
+    def update(self, count, force=False):
+        self.done += count
+        now = time.monotonic()
+        if self.interval is None or (not force and now - self._last < self.interval):
+            return
+        self._last = now
+        rate = self.rate()
+        eta = (self.total - self.done) / rate if rate else float("inf")
+        self.stream.write(f"resolved {self.done}/{self.total} unique IPs ({rate:.1f}/s, ETA {eta:.0f}s)\n")
+        self.stream.flush()
+
+
+def resolve(ips, fields, workers=4, chunk_size=100, concurrency=8, checkpoint=None, progress=None):
+    """Resolve ips to rows, appending each finished chunk to the checkpoint"""
+    rows = {}
+    chunks = [ips[i:i + chunk_size] for i in range(0, len(ips), chunk_size)]
+    out = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+
+    def finish(chunk_rows):
+        for ip, row in chunk_rows:
+            rows[ip] = records.pack(row)
+            if out is not None:
+                out.write(json.dumps({"ip": ip, "row": row}) + "\n")
+        if out is not None:
+            out.flush()
+            os.fsync(out.fileno())
+        if progress is not None:
+            progress.update(len(chunk_rows))
+
+    try:
+        if workers <= 0:
+            for chunk in chunks:
+                finish(resolve_chunk(chunk, fields, concurrency))
+            return rows
+
+        # Workers start from a fresh interpreter: a forked child would
+        # inherit the parent's thread pools and pooled sockets in whatever
+        # state they were in
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=ratelimit.share_quotas, initargs=(workers,)) as pool:
+            pending = set()
+            chunks = iter(chunks)
+            while True:
+                # Keep every worker busy without queuing the whole job
+                for chunk in chunks:
+                    pending.add(pool.submit(resolve_chunk, chunk, fields, concurrency))
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future.result())
+        return rows
+    finally:
+        if out is not None:
+            out.close()
+
+
+def write_output(lines, rows, out, fmt, fields, field=None, include_log=False):
+    """Write one enriched row per input line; returns the line count"""
+    columns = ["line", "ip"] + list(fields) + ["error"] + (["log"] if include_log else [])
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+
+    blank = dict.fromkeys(list(fields) + ["error"])
+    count = 0
+    for count, line in enumerate(lines, 1):
+        ip = extract_ip(line, field)
+        row = {"line": count, "ip": ip}
+        packed = rows.get(ip) if ip is not None else None
+        row.update(records.unpack(packed) if packed is not None else blank)
+        if include_log:
+            row["log"] = line.decode("utf-8", "replace")
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row) + "\n")
+    return count
+
+
+def enrich(input_path, output_path=None, fmt="ndjson", fields=DEFAULT_FIELDS, field=None,
+           workers=4, chunk_size=100, concurrency=8, checkpoint=None, keep_checkpoint=False,
+           include_log=False, progress_interval=5.0, stream=None):
+    """Enrich input_path into output_path (stdout when None); returns a summary dict"""
+    stream = stream or sys.stderr
+    started = time.monotonic()
+    with open(input_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            mm = None
+            ips, lines = [], 0
+        else:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            ips, lines = unique_ips(mm, field)
+
+        rows = load_checkpoint(checkpoint)
+        resumed = sum(1 for ip in ips if ip in rows)
+        todo = [ip for ip in ips if ip not in rows]
+        progress = Progress(len(ips), progress_interval, stream)
+        progress.done = resumed
+        rows.update(resolve(todo, fields, workers, chunk_size, concurrency, checkpoint, progress))
+        progress.update(0, force=True)
+
+        if output_path is None:
+            out = sys.stdout
+        else:
+            # Write next to the target and rename, so a crash never leaves
+            # a half-written output behind
+            out = open(output_path + ".tmp", "w", encoding="utf-8", newline="")
+        try:
+            write_output(iter_lines(mm) if mm is not None else (), rows, out, fmt, fields, field, include_log)
+        finally:
+            if mm is not None:
+                mm.close()
+            if out is not sys.stdout:
+                out.close()
+        if output_path is not None:
+            os.replace(output_path + ".tmp", output_path)
+
+    if checkpoint and not keep_checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "lines": lines,
+        "unique_ips": len(ips),
+        "resumed": resumed,
+        "resolved": len(todo),
+        "errors": sum(1 for ip in ips if records.unpack(rows[ip]).get("error")),
+        "seconds": round(elapsed, 2),
+        "lines_per_second": round(lines / elapsed, 1) if elapsed else 0.0,
+        "lookups_per_second": round(len(todo) / elapsed, 1) if elapsed else 0.0,
+    }
+    stream.write(
+        f"{summary['lines']} lines, {summary['unique_ips']} unique IPs "
+        f"({summary['resumed']} from checkpoint, {summary['errors']} errors) in {summary['seconds']}s: "
+        f"{summary['lines_per_second']} lines/s, {summary['lookups_per_second']} lookups/s\n"
+    )
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enrich a log file with IP geolocation and network data")
+    parser.add_argument("input", help="log file with one entry per line")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--format", choices=("ndjson", "csv"), help="default: from the output extension, else ndjson")
+    parser.add_argument("--fields", default=",".join(DEFAULT_FIELDS), help="comma-separated result fields to add")
+    parser.add_argument("--field", type=int, help="whitespace-separated field holding the IP (default: first IP found)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="processes; 0 resolves in-process")
+    parser.add_argument("--chunk-size", type=int, default=100, help="IPs per task and per batch prefetch")
+    parser.add_argument("--concurrency", type=int, default=8, help="lookups in flight per worker")
+    parser.add_argument("--checkpoint", help="resume file (default: <output>.checkpoint)")
+    parser.add_argument("--keep-checkpoint", action="store_true")
+    parser.add_argument("--include-log", action="store_true", help="copy the original line into the output")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show per-lookup logging")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    fmt = args.format or ("csv" if (args.output or "").endswith(".csv") else "ndjson")
+    checkpoint = args.checkpoint or (args.output + ".checkpoint" if args.output else None)
+    fields = tuple(name.strip() for name in args.fields.split(",") if name.strip())
+
+    enrich(
+        args.input, args.output, fmt, fields, args.field, args.workers, args.chunk_size,
+        args.concurrency, checkpoint, args.keep_checkpoint, args.include_log, args.progress,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
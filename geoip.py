@@ -0,0 +1,266 @@
+"""Offline IP-range -> geo/ASN lookups from a local dataset.
+
+A CSV of ranges is compiled once into a flat binary index:
+
+    header | IPv4 ranges | IPv6 ranges | record offsets | record JSON blob
+
+Ranges are sorted fixed-width rows, so a lookup is a binary search over the
+memory-mapped file. Every worker process that opens the same index shares
+its pages through the OS page cache.
+
+CSV input needs either a ``network`` column (CIDR) or ``start_ip`` and
+``end_ip`` columns; any of the RECORD_FIELDS columns are stored with the
+range. Ranges must not overlap; overlapping rows are dropped with a warning.
+"""
+import argparse
+import csv
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"IPGEOIX1"
+HEADER = struct.Struct("<8sIII")  # magic, v4 ranges, v6 ranges, records
+V4_ROW = struct.Struct("<III")  # start, end, record index
+V6_ROW = struct.Struct("<QQQQI")  # start hi/lo, end hi/lo, record index
+OFFSET = struct.Struct("<I")
+
+RECORD_FIELDS = (
+    "city", "region", "country_name", "org", "isp", "asn", "asn_org",
+    "owner", "ip_type", "latitude", "longitude", "timezone", "postal",
+    "connection_type",
+)
+FLOAT_FIELDS = ("latitude", "longitude")
+
+
+def _split128(value):
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def _parse_range(row):
+    if row.get("network"):
+        network = ipaddress.ip_network(row["network"].strip(), strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    start = ipaddress.ip_address(row["start_ip"].strip())
+    end = ipaddress.ip_address(row["end_ip"].strip())
+    if start.version != end.version or int(end) < int(start):
+        raise ValueError(f"Bad range {start}-{end}")
+    return start.version, int(start), int(end)
+
+
+def _parse_record(row):
+    record = {}
+    for field in RECORD_FIELDS:
+        value = row.get(field)
+        if field == "country_name" and not value:
+            value = row.get("country")
+        if value in (None, ""):
+            continue
+        record[field] = float(value) if field in FLOAT_FIELDS else value
+    return record
+
+
+def _drop_overlaps(rows):
+    kept = []
+    for row in sorted(rows):
+        if kept and row[0] <= kept[-1][1]:
+            logger.warning(f"Dropping overlapping range starting at {row[0]}")
+            continue
+        kept.append(row)
+    return kept
+
+
+def compile_csv(csv_path, index_path):
+    """Compile a CSV of IP ranges into a binary index file"""
+    records = []
+    record_ids = {}
+    v4_rows, v6_rows = [], []
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                version, start, end = _parse_range(row)
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Skipping line {line_no} of {csv_path}: {e}")
+                continue
+
+            # Many ranges share the same location/ASN; store each record once
+            blob = json.dumps(_parse_record(row), sort_keys=True, separators=(",", ":")).encode()
+            record_id = record_ids.get(blob)
+            if record_id is None:
+                record_id = record_ids[blob] = len(records)
+                records.append(blob)
+
+            (v4_rows if version == 4 else v6_rows).append((start, end, record_id))
+
+    v4_rows = _drop_overlaps(v4_rows)
+    v6_rows = _drop_overlaps(v6_rows)
+
+    # A temp file of our own: processes starting together may all compile
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(index_path) + ".",
+                                    suffix=".tmp", dir=os.path.dirname(index_path) or ".")
+    try:
+        os.chmod(tmp_path, 0o644)  # mkstemp makes it private to this user
+        with os.fdopen(fd, "wb") as out:
+            out.write(HEADER.pack(MAGIC, len(v4_rows), len(v6_rows), len(records)))
+            for start, end, record_id in v4_rows:
+                out.write(V4_ROW.pack(start, end, record_id))
+            for start, end, record_id in v6_rows:
+                out.write(V6_ROW.pack(*_split128(start), *_split128(end), record_id))
+            offset = 0
+            for blob in records:
+                out.write(OFFSET.pack(offset))
+                offset += len(blob)
+            out.write(OFFSET.pack(offset))
+            for blob in records:
+                out.write(blob)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    logger.info(
+        f"Compiled {len(v4_rows)} IPv4 and {len(v6_rows)} IPv6 ranges "
+        f"({len(records)} unique records) into {index_path}"
+    )
+    return index_path
+
+
+class GeoIPIndex:
+    """Read-only, memory-mapped view over a compiled range index"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.v4_count, self.v6_count, self.record_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled GeoIP index")
+
+        self._v4_base = HEADER.size
+        self._v6_base = self._v4_base + self.v4_count * V4_ROW.size
+        self._offsets_base = self._v6_base + self.v6_count * V6_ROW.size
+        self._blob_base = self._offsets_base + (self.record_count + 1) * OFFSET.size
+        self._record = lru_cache(maxsize=4096)(self._read_record)
+
+    def _read_record(self, record_id):
+        start = OFFSET.unpack_from(self._mm, self._offsets_base + record_id * OFFSET.size)[0]
+        end = OFFSET.unpack_from(self._mm, self._offsets_base + (record_id + 1) * OFFSET.size)[0]
+        return json.loads(self._mm[self._blob_base + start:self._blob_base + end])
+
+    def _search(self, value, base, count, row, key):
+        # Find the last row whose start <= value, then check its end
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(row.unpack_from(self._mm, base + mid * row.size))[0] <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        start, end, record_id = key(row.unpack_from(self._mm, base + (lo - 1) * row.size))
+        return record_id if end >= value else None
+
+    def lookup(self, ip):
+        """Return a copy of the record for ip, or None if no range covers it"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        if address.version == 4:
+            record_id = self._search(int(address), self._v4_base, self.v4_count, V4_ROW, lambda r: r)
+        else:
+            record_id = self._search(
+                _split128(int(address)), self._v6_base, self.v6_count, V6_ROW,
+                lambda r: ((r[0], r[1]), (r[2], r[3]), r[4])
+            )
+        if record_id is None:
+            return None
+        return dict(self._record(record_id))
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class MMDBIndex:
+    """Adapter for MaxMind .mmdb files (requires the optional maxminddb package)"""
+
+    def __init__(self, path):
+        import maxminddb
+        self.path = path
+        self._reader = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+
+    def lookup(self, ip):
+        try:
+            data = self._reader.get(ip)
+        except ValueError:
+            return None
+        if not data:
+            return None
+
+        def name(section):
+            return (data.get(section) or {}).get("names", {}).get("en")
+
+        location = data.get("location") or {}
+        subdivisions = data.get("subdivisions") or [{}]
+        record = {
+            "city": name("city"),
+            "region": subdivisions[0].get("names", {}).get("en"),
+            "country_name": name("country"),
+            "org": data.get("autonomous_system_organization"),
+            "asn": data.get("autonomous_system_number"),
+            "latitude": location.get("latitude"),
+            "longitude": location.get("longitude"),
+            "timezone": location.get("time_zone"),
+            "postal": (data.get("postal") or {}).get("code"),
+        }
+        if record["asn"]:
+            record["asn"] = f"AS{record['asn']}"
+        return {k: v for k, v in record.items() if v is not None}
+
+    def close(self):
+        self._reader.close()
+
+
+def open_database(path):
+    """Open a GeoIP dataset, compiling CSV input to ``<path>.idx`` when stale"""
+    if path.endswith(".mmdb"):
+        return MMDBIndex(path)
+
+    if path.endswith(".csv"):
+        index_path = f"{path}.idx"
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+            compile_csv(path, index_path)
+        path = index_path
+
+    return GeoIPIndex(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile or query a local GeoIP index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_cmd = sub.add_parser("compile", help="compile a CSV of ranges into an index")
+    compile_cmd.add_argument("csv_path")
+    compile_cmd.add_argument("index_path")
+    lookup_cmd = sub.add_parser("lookup", help="look up IPs in a compiled index")
+    lookup_cmd.add_argument("index_path")
+    lookup_cmd.add_argument("ips", nargs="+")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "compile":
+        compile_csv(args.csv_path, args.index_path)
+    else:
+        db = open_database(args.index_path)
+        for ip in args.ips:
+            print(ip, json.dumps(db.lookup(ip)))
@@ -0,0 +1,109 @@
+"""Bounded tracking of the most frequently requested keys.
+
+A count-min sketch estimates how often every key was seen in fixed memory
+(it may overcount, never undercount). Alongside it a table of at most
+``capacity`` candidates keeps the current top keys with a payload each,
+e.g. the arguments needed to refresh a cache entry. Counts are halved every
+``decay_interval`` seconds so yesterday's hot keys cool off.
+"""
+import random
+import threading
+import time
+from array import array
+
+
+def _tuples(value):
+    """JSON turns tuples into lists; turn them back so payloads stay hashable"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+class HotKeys:
+    """Thread-safe count-min sketch with a top-k table"""
+
+    def __init__(self, capacity=200, width=4096, depth=4, decay_interval=600):
+        self.capacity = capacity
+        self.width = width
+        self.decay_interval = decay_interval
+        self._seeds = [random.getrandbits(32) for _ in range(depth)]
+        self._rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+        self._top = {}  # key -> [estimate, payload]
+        self._floor = 0  # smallest estimate in a full top table
+        self._decayed = time.monotonic()
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def _estimate(self, key):
+        return min(row[hash((seed, key)) % self.width] for seed, row in zip(self._seeds, self._rows))
+
+    def _decay(self):
+        for row in self._rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> 1
+        for key in list(self._top):
+            self._top[key][0] >>= 1
+            if not self._top[key][0]:
+                del self._top[key]
+        self._floor = min((entry[0] for entry in self._top.values()), default=0)
+        self._decayed = time.monotonic()
+
+    def record(self, key, payload=None, count=1):
+        """Count an access to key; returns its estimated count"""
+        with self._lock:
+            if self.decay_interval and time.monotonic() - self._decayed > self.decay_interval:
+                self._decay()
+            self.recorded += count
+            estimate = None
+            for seed, row in zip(self._seeds, self._rows):
+                index = hash((seed, key)) % self.width
+                row[index] += count
+                estimate = row[index] if estimate is None else min(estimate, row[index])
+
+            entry = self._top.get(key)
+            if entry is not None:
+                entry[0] = estimate
+                if payload is not None:
+                    entry[1] = payload
+            elif len(self._top) < self.capacity:
+                self._top[key] = [estimate, payload]
+                if len(self._top) == self.capacity:
+                    self._floor = min(entry[0] for entry in self._top.values())
+            elif estimate > self._floor:
+                coldest = min(self._top, key=lambda k: self._top[k][0])
+                del self._top[coldest]
+                self._top[key] = [estimate, payload]
+                self._floor = min(entry[0] for entry in self._top.values())
+            return estimate
+
+    def estimate(self, key):
+        with self._lock:
+            return self._estimate(key)
+
+    def top(self, n=None):
+        """[(key, count, payload)] for the hottest keys, hottest first"""
+        with self._lock:
+            items = sorted(self._top.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, payload) for key, (count, payload) in items[:n]]
+
+    def clear(self):
+        with self._lock:
+            for row in self._rows:
+                for i in range(len(row)):
+                    row[i] = 0
+            self._top.clear()
+            self._floor = 0
+            self.recorded = 0
+
+    def snapshot(self):
+        """JSON-serializable top keys, for load() after a restart"""
+        return [{"key": key, "count": count, "payload": payload} for key, count, payload in self.top()]
+
+    def load(self, snapshot):
+        for item in snapshot:
+            self.record(item["key"], _tuples(item.get("payload")), item["count"])
+
+    def stats(self):
+        with self._lock:
+            return {"tracked": len(self._top), "capacity": self.capacity, "recorded": self.recorded}
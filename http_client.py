@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import providers
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+# Default per-provider settings; each value can be overridden from the
+# environment, e.g. HTTP_TIMEOUT_IPAPI=5 or HTTP_POOL_SIZE_OPENWEATHER=20.
+PROVIDERS = {
+    "ipapi": {"timeout": 10.0},
+    "ip-api": {"timeout": 10.0},
+    "ipinfo": {"timeout": 10.0},
+    "ipwhois": {"timeout": 8.0},
+    "openweather": {"timeout": 5.0},
+    "ipify": {"timeout": 10.0},
+}
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+DEFAULT_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 1))
+DEFAULT_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.3))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Query strings can carry API keys (OpenWeather's appid), and requests puts
+# the full URL into its exception messages
+_QUERY_STRING = re.compile(r"\?[^\s'\")]*")
+
+
+def describe_error(error):
+    """An exception's message, safe to log, cache or send to other nodes"""
+    return _QUERY_STRING.sub("?<redacted>", str(error)) or type(error).__name__
+
+
+def _env_name(provider):
+    return provider.upper().replace("-", "_")
+
+
+def provider_setting(provider, name, default):
+    """Return a provider setting from the environment, PROVIDERS or default"""
+    value = os.getenv(f"HTTP_{name.upper()}_{_env_name(provider)}")
+    if value is not None:
+        return type(default)(value)
+    return PROVIDERS.get(provider, {}).get(name, default)
+
+
+def _build_session(provider):
+    pool_size = provider_setting(provider, "pool_size", DEFAULT_POOL_SIZE)
+    retries = Retry(
+        total=provider_setting(provider, "max_retries", DEFAULT_MAX_RETRIES),
+        backoff_factor=provider_setting(provider, "backoff_factor", DEFAULT_BACKOFF_FACTOR),
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session(provider):
+    """Return the shared keep-alive session for an upstream provider"""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                session = _sessions[provider] = _build_session(provider)
+    return session
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def request(method, provider, url, timeout=None, **kwargs):
+    """Send a request through the provider's pooled session
+
+    The call is gated by the provider's rate limiter and circuit breaker
+    (raising ratelimit.ProviderUnavailable when it is paused) and its
+    outcome is reported back to them.
+    """
+    if timeout is None:
+        timeout = provider_setting(provider, "timeout", DEFAULT_TIMEOUT)
+
+    ratelimit.acquire(provider)
+    started = time.monotonic()
+    try:
+        response = get_session(provider).request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.Timeout:
+        ratelimit.record(provider, "timeout")
+        raise
+    except Exception:
+        ratelimit.record(provider, "error")
+        raise
+
+    _record_response(provider, response, time.monotonic() - started)
+    return response
+
+
+def _record_response(provider, response, elapsed):
+    if response.status_code < 400:
+        # Only real upstream round trips feed the hedge delay
+        providers.histogram(provider).observe(elapsed)
+    if response.status_code == 429:
+        ratelimit.record(provider, "throttled", retry_after=_retry_after(response))
+    elif response.status_code >= 500:
+        ratelimit.record(provider, "error")
+    else:
+        ratelimit.record(provider, "ok")
+
+
+def get(provider, url, timeout=None, **kwargs):
+    """GET url through the provider's pooled session"""
+    return request("GET", provider, url, timeout=timeout, **kwargs)
+
+
+def post(provider, url, timeout=None, **kwargs):
+    """POST to url through the provider's pooled session"""
+    return request("POST", provider, url, timeout=timeout, **kwargs)
+
+
+# Async clients for the ASGI server (asgi.py). They need the optional httpx
+# package and are created lazily inside the running event loop.
+ASYNC_POOL_SIZE = int(os.getenv("HTTP_ASYNC_POOL_SIZE", 100))
+_async_clients = {}
+
+
+def get_async_client(provider):
+    """Return the shared httpx.AsyncClient for an upstream provider"""
+    client = _async_clients.get(provider)
+    if client is None:
+        import httpx
+        pool_size = provider_setting(provider, "async_pool_size", ASYNC_POOL_SIZE)
+        client = _async_clients[provider] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(
+                retries=provider_setting(provider, "max_retries", DEFAULT_MAX_RETRIES)
+            ),
+        )
+    return client
+
+
+async def request_async(method, provider, url, timeout=None, **kwargs):
+    """Non-blocking version of request() used by the ASGI server"""
+    import httpx
+    if timeout is None:
+        timeout = provider_setting(provider, "timeout", DEFAULT_TIMEOUT)
+
+    ratelimit.acquire(provider)
+    started = time.monotonic()
+    try:
+        response = await get_async_client(provider).request(method, url, timeout=timeout, **kwargs)
+    except asyncio.CancelledError:
+        ratelimit.record(provider, "cancelled")
+        raise
+    except httpx.TimeoutException:
+        ratelimit.record(provider, "timeout")
+        raise
+    except Exception:
+        ratelimit.record(provider, "error")
+        raise
+
+    _record_response(provider, response, time.monotonic() - started)
+    return response
+
+
+async def close_async_clients():
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
+
+
+def connection_stats():
+    """Report requests made and connections opened per provider
+
+    reused = requests - connections, so a value close to requests means
+    keep-alive is doing its job.
+    """
+    stats = {}
+    for provider, session in list(_sessions.items()):
+        adapters = {id(a): a for a in session.adapters.values()}.values()
+        requests_made = connections = 0
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_made += pool.num_requests
+                connections += pool.num_connections
+        stats[provider] = {
+            "requests": requests_made,
+            "connections": connections,
+            "reused": max(requests_made - connections, 0),
+        }
+    return stats
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
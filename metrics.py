@@ -0,0 +1,110 @@
+"""Lookup stage timers and Prometheus text exposition.
+
+Stage durations go into process-wide histograms. When a request has called
+start_request(), they are also collected for its Server-Timing header.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from providers import LATENCY_BUCKETS, LatencyHistogram
+
+# Validation and sanitization take microseconds, so start well below the
+# provider buckets
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005) + LATENCY_BUCKETS
+
+_stages = {}
+_stages_lock = threading.Lock()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def stage_histogram(stage):
+    hist = _stages.get(stage)
+    if hist is None:
+        with _stages_lock:
+            hist = _stages.setdefault(stage, LatencyHistogram(STAGE_BUCKETS))
+    return hist
+
+
+def stage_histograms():
+    return dict(_stages)
+
+
+def observe(stage, seconds):
+    stage_histogram(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def start_request():
+    """Collect stage timings for the current request; returns a reset token"""
+    return _request_timings.set([])
+
+
+def finish_request(token):
+    """Stop collecting and return the (stage, seconds) pairs recorded"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing(timings):
+    """Format timings as a Server-Timing header value"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+# ---- Prometheus text format ----
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def family(name, kind, help_text, samples):
+    """Format a counter or gauge from (labels, value) pairs"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines)
+
+
+def histogram_family(name, help_text, label, histograms):
+    """Format LatencyHistograms keyed by the value of ``label``"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, hist in sorted(histograms.items()):
+        with hist._lock:
+            counts, count, total = list(hist.counts), hist.count, hist.total
+        cumulative = 0
+        for bound, bucket_count in zip(hist.buckets, counts):
+            cumulative += bucket_count
+            labels = _labels({label: key, "le": _number(bound)})
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        lines.append(f"{name}_sum{_labels({label: key})} {total!r}")
+        lines.append(f"{name}_count{_labels({label: key})} {count}")
+    return "\n".join(lines)
+
+
+def render(families):
+    return "\n".join(families) + "\n"
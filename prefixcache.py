@@ -0,0 +1,154 @@
+"""Share cached provider results between neighbouring addresses.
+
+Results are stored against a network range (by default the /24 or /48
+around the address, or the narrower range the provider announced) and
+later lookups inside it are answered from a longest-prefix-match index.
+
+Accuracy safeguards:
+
+* only globally routable addresses are aggregated;
+* a range is never wider than the configured prefix length, even if the
+  provider announced a larger block;
+* every ``verify_every``-th hit is treated as a miss so a real lookup is
+  made; if its ASN disagrees with the cached range, the range is dropped
+  and the block is cached per address from then on.
+"""
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """Thread-safe longest-prefix-match cache with TTL and LRU limits"""
+
+    def __init__(self, v4_prefix=24, v6_prefix=48, ttl=3600, max_entries=50000, verify_every=0):
+        self.prefixes = {4: v4_prefix, 6: v6_prefix}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.verify_every = verify_every
+        self._entries = OrderedDict()  # (version, prefixlen, network) -> (expires_at, value)
+        self._lengths = {4: set(), 6: set()}  # prefix lengths present, per version
+        self._split = set()  # (version, prefixlen, network) blocks found to be mixed
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+        self.conflicts = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(address, prefixlen):
+        return address.version, prefixlen, int(address) >> (address.max_prefixlen - prefixlen)
+
+    def _find(self, address, now):
+        for prefixlen in sorted(self._lengths[address.version], reverse=True):
+            key = self._key(address, prefixlen)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self._entries[key]
+                continue
+            return key, entry[1]
+        return None, None
+
+    def get(self, ip):
+        """Return (found, value) from the most specific range covering ip"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False, None
+
+        with self._lock:
+            key, value = self._find(address, time.time())
+            if key is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            if self.verify_every and self.hits % self.verify_every == 0:
+                self.verifications += 1
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def contains(self, ip):
+        """Whether a live entry covers ip, without counting a hit or miss"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        with self._lock:
+            return self._find(address, time.time())[0] is not None
+
+    def put(self, ip, value, network=None):
+        """Cache value for the range around ip; returns the CIDR used or None
+
+        ``network`` is the block the provider reported for ip, if any. It is
+        only used when it contains ip and is narrower than the configured
+        prefix length.
+        """
+        if value is None:
+            return None
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if not address.is_global:
+            return None
+
+        prefixlen = self.prefixes[address.version]
+        if network:
+            try:
+                announced = ipaddress.ip_network(network, strict=False)
+            except ValueError:
+                announced = None
+            if announced is not None and address in announced:
+                prefixlen = max(prefixlen, announced.prefixlen)
+
+        now = time.time()
+        with self._lock:
+            covering, cached = self._find(address, now)
+            if covering is not None and _asn(cached) != _asn(value):
+                # The range is not homogeneous: stop aggregating it
+                del self._entries[covering]
+                self._split.add(covering)
+                self.conflicts += 1
+            if any(self._key(address, length) in self._split for length in range(prefixlen + 1)):
+                prefixlen = address.max_prefixlen
+
+            key = self._key(address, prefixlen)
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._lengths[address.version].add(prefixlen)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return str(ipaddress.ip_interface(f"{address}/{prefixlen}").network)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._split.clear()
+            for lengths in self._lengths.values():
+                lengths.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "verifications": self.verifications,
+                "conflicts": self.conflicts,
+                "split_blocks": len(self._split),
+                "prefixes": {f"v{version}": length for version, length in self.prefixes.items()},
+            }
+
+
+def _asn(value):
+    return str(value.get("asn") or "").upper().removeprefix("AS") if isinstance(value, dict) else None
@@ -0,0 +1,241 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("sequential", "hedged", "race")
+
+# Hedge delay = this percentile of the provider's upstream latency (recorded
+# by http_client, so cache hits never count), clamped
+# to [HEDGE_MIN_DELAY, HEDGE_MAX_DELAY]. Until HEDGE_MIN_SAMPLES successes
+# are recorded HEDGE_DEFAULT_DELAY is used instead.
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.1))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", 5))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 1))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (
+    0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+    1, 1.5, 2, 3, 5, 7.5, 10, float("inf"),
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PROVIDER_WORKERS", 16)),
+    thread_name_prefix="provider",
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with approximate percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, p):
+        """Return the upper bound of the bucket holding the p-th percentile"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = self.count * p / 100.0
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": round(self.total, 6),
+                "buckets": {
+                    "+Inf" if bound == float("inf") else str(bound): count
+                    for bound, count in zip(self.buckets, self.counts)
+                },
+            }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name):
+    """Return the latency histogram of a provider's successful upstream calls"""
+    hist = _histograms.get(name)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(name, LatencyHistogram())
+    return hist
+
+
+def hedge_delay(name):
+    """Seconds to wait on a provider before hedging to the next one"""
+    hist = histogram(name)
+    if hist.count < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    delay = hist.percentile(HEDGE_PERCENTILE)
+    return min(max(delay, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+
+def _first_good(futures, names):
+    """Pop finished futures, returning the first usable answer if any"""
+    done = [f for f in futures if f.done()]
+    for future in done:
+        futures.remove(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Provider {names[future]} failed: {e}")
+            continue
+        if result:
+            return result
+        logger.info(f"Provider {names[future]} returned no data")
+    return None
+
+
+def _cancel(futures):
+    # Already-running calls can't be interrupted; they finish in the
+    # background and their result is dropped.
+    for future in futures:
+        future.cancel()
+
+
+def run_sequential(providers, *args):
+    for name, func in providers:
+        try:
+            result = func(*args)
+            if result:
+                return result
+            logger.info(f"Provider {name} returned no data")
+        except Exception as e:
+            logger.warning(f"Provider {name} failed: {e}")
+    return None
+
+
+def run_hedged(providers, *args):
+    """Start the next provider early if the current one is slow or fails"""
+    pending = list(providers)
+    running = set()
+    names = {}
+
+    while pending or running:
+        delay = None
+        if pending:
+            name, func = pending.pop(0)
+            future = _executor.submit(func, *args)
+            running.add(future)
+            names[future] = name
+            delay = hedge_delay(name)
+
+        wait(running, timeout=delay, return_when=FIRST_COMPLETED)
+        result = _first_good(running, names)
+        if result:
+            _cancel(running)
+            return result
+
+        # Nothing usable yet: wait for whatever is running if there is
+        # nothing left to hedge with, otherwise loop and start the next one.
+        while not pending and running:
+            wait(running, return_when=FIRST_COMPLETED)
+            result = _first_good(running, names)
+            if result:
+                _cancel(running)
+                return result
+    return None
+
+
+def run_race(providers, *args):
+    """Query every provider at once; the first usable answer wins"""
+    running = set()
+    names = {}
+    for name, func in providers:
+        future = _executor.submit(func, *args)
+        running.add(future)
+        names[future] = name
+
+    while running:
+        wait(running, return_when=FIRST_COMPLETED)
+        result = _first_good(running, names)
+        if result:
+            _cancel(running)
+            return result
+    return None
+
+
+def run_strategy(providers, *args, strategy="sequential"):
+    """Resolve args against a list of (name, func) providers"""
+    if strategy == "hedged":
+        return run_hedged(providers, *args)
+    if strategy == "race":
+        return run_race(providers, *args)
+    return run_sequential(providers, *args)
+
+
+async def run_strategy_async(providers, *args, strategy="sequential"):
+    """Async counterpart of run_strategy for (name, coroutine function) providers
+
+    Unlike the threaded version, losing calls are actually cancelled.
+    """
+    if strategy not in ("hedged", "race"):
+        for name, func in providers:
+            try:
+                result = await func(*args)
+                if result:
+                    return result
+                logger.info(f"Provider {name} returned no data")
+            except Exception as e:
+                logger.warning(f"Provider {name} failed: {e}")
+        return None
+
+    pending = list(providers)
+    running = {}
+    try:
+        while pending or running:
+            delay = None
+            if pending:
+                started = pending if strategy == "race" else pending[:1]
+                pending = pending[len(started):]
+                for name, func in started:
+                    task = asyncio.ensure_future(func(*args))
+                    running[task] = name
+                if pending:
+                    delay = hedge_delay(started[-1][0])
+
+            done, _ = await asyncio.wait(running, timeout=delay, return_when=FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                if task.exception() is not None:
+                    logger.warning(f"Provider {name} failed: {task.exception()}")
+                elif task.result():
+                    return task.result()
+                else:
+                    logger.info(f"Provider {name} returned no data")
+    finally:
+        for task in running:
+            task.cancel()
+    return None
+
+
+def latency_stats():
+    return {
+        name: dict(hist.snapshot(), hedge_delay=hedge_delay(name))
+        for name, hist in list(_histograms.items())
+    }
@@ -0,0 +1,239 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Requests per minute and burst size per upstream. Override with
+# RATE_LIMIT_<PROVIDER>="<per_minute>[:<burst>]", e.g. RATE_LIMIT_IP_API=40:10,
+# or RATE_LIMIT_<PROVIDER>=0 to disable limiting for that provider.
+QUOTAS = {
+    "ipapi": (30, 10),
+    "ip-api": (45, 15),
+    "ipinfo": (30, 10),
+    "ipwhois": (30, 10),
+    "openweather": (60, 20),
+    "ipify": None,
+}
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling a provider that is throttled or tripped"""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """Skip a provider for a cool-down after repeated failures or a 429
+
+    closed -> open after ``failures`` consecutive timeouts/errors, or at once
+    on a 429. Once the cool-down passes one trial call is let through
+    (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failures=None, cooldown=None):
+        self.failures = BREAKER_FAILURES if failures is None else failures
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def current_state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self.state == "open" and now >= self.opened_until:
+            return "half-open"
+        return self.state
+
+    def is_open(self):
+        """True while calls are blocked, including while a trial is in flight"""
+        with self._lock:
+            return self.state == "half-open" or self._current_state(time.monotonic()) == "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == "half-open" and self.state == "open":
+                # Let exactly one trial call through until it reports back
+                self.state = "half-open"
+                return True
+            return state == "closed"
+
+    def _open(self, duration):
+        self.state = "open"
+        self.opened_until = time.monotonic() + duration
+        self.trips += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def release_trial(self):
+        """Give back a half-open trial whose call was abandoned without a result"""
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+                self.opened_until = time.monotonic()
+
+    def record_failure(self, throttled=False, retry_after=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            if throttled or self.state == "half-open" or self.consecutive_failures >= self.failures:
+                self._open(max(self.cooldown, retry_after or 0))
+
+
+class ProviderLimiter:
+    def __init__(self, name, quota):
+        self.name = name
+        self.bucket = TokenBucket(quota[0] / 60.0, quota[1]) if quota else None
+        self.breaker = CircuitBreaker()
+        self.counts = {"ok": 0, "throttled": 0, "timeout": 0, "error": 0, "rejected": 0, "cancelled": 0}
+        self._lock = threading.Lock()
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+
+def _quota(provider):
+    value = os.getenv(f"RATE_LIMIT_{provider.upper().replace('-', '_')}")
+    if value is None:
+        quota = QUOTAS.get(provider)
+    else:
+        per_minute, _, burst = value.partition(":")
+        per_minute = float(per_minute)
+        if per_minute <= 0:
+            return None
+        quota = per_minute, float(burst) if burst else max(per_minute / 4, 1)
+    if quota is None or _share == 1:
+        return quota
+    return quota[0] / _share, max(quota[1] / _share, 1)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_share = 1  # processes splitting each quota, see share_quotas()
+
+
+def share_quotas(processes):
+    """Limit this process to 1/processes of every quota
+
+    For one of several processes calling the same upstreams with the same
+    API keys (enrich.py workers), so together they stay within the quotas.
+    """
+    global _share
+    with _limiters_lock:
+        _share = max(1, processes)
+        _limiters.clear()
+
+
+def limiter(provider):
+    lim = _limiters.get(provider)
+    if lim is None:
+        with _limiters_lock:
+            lim = _limiters.get(provider)
+            if lim is None:
+                lim = _limiters[provider] = ProviderLimiter(provider, _quota(provider))
+    return lim
+
+
+def has_budget(provider, reserve=0):
+    """True if a call to provider would currently be allowed (no token taken)
+
+    ``reserve`` tokens must remain after the call, for background callers
+    that should not compete with live requests.
+    """
+    lim = limiter(provider)
+    if lim.breaker.is_open():
+        return False
+    return lim.bucket is None or lim.bucket.available() >= 1 + reserve
+
+
+def acquire(provider):
+    """Take a token for a call to provider or raise ProviderUnavailable"""
+    lim = limiter(provider)
+    if lim.bucket is not None and not lim.bucket.try_acquire():
+        lim.count("rejected")
+        raise ProviderUnavailable(f"{provider} local rate limit reached")
+    if not lim.breaker.allow():
+        lim.count("rejected")
+        raise ProviderUnavailable(f"{provider} circuit open after recent failures")
+
+
+def record(provider, outcome, retry_after=None):
+    """Report a call outcome (ok, throttled, timeout, error or cancelled)
+
+    A cancelled call (e.g. the losing half of a hedge) says nothing about
+    the provider's health; it only frees a half-open trial for the next call.
+    """
+    lim = limiter(provider)
+    lim.count(outcome)
+    if outcome == "ok":
+        lim.breaker.record_success()
+    elif outcome == "cancelled":
+        lim.breaker.release_trial()
+    else:
+        if outcome == "throttled":
+            logger.warning(f"{provider} returned 429, pausing it for at least {lim.breaker.cooldown}s")
+        lim.breaker.record_failure(throttled=outcome == "throttled", retry_after=retry_after)
+
+
+def schedule(providers, exempt=()):
+    """Order (name, func) providers so those with budget left come first
+
+    Providers without budget are kept at the end rather than dropped, so a
+    lookup can still fall through to them once their breaker half-opens.
+    Providers named in ``exempt`` (e.g. because the answer is already
+    cached) keep their place whatever their budget.
+    """
+    ready = [p for p in providers if p[0] in exempt or has_budget(p[0])]
+    if len(ready) == len(providers):
+        return list(providers)
+    return ready + [p for p in providers if p not in ready]
+
+
+def stats():
+    result = {}
+    for name, lim in list(_limiters.items()):
+        result[name] = dict(
+            lim.counts,
+            breaker=lim.breaker.current_state(),
+            trips=lim.breaker.trips,
+            tokens=round(lim.bucket.available(), 2) if lim.bucket else None,
+        )
+    return result
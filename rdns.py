@@ -0,0 +1,333 @@
+"""Reverse DNS (PTR) lookups without blocking the lookup pipeline.
+
+Queries are sent straight to a nameserver over UDP from an asyncio event
+loop, so many lookups can be in flight at once and each is bounded by its
+own timeout. Answers are cached for the record's TTL; "no PTR record"
+answers are cached too, for the zone's negative TTL (RFC 2308). Timeouts
+and server failures are not cached.
+
+Sync callers (the Flask app, batch jobs) share one background event loop:
+``submit(ip)`` returns a concurrent.futures.Future, ``lookup(ip)`` waits
+for the answer. Async callers await ``resolve(ip)`` on their own loop.
+"""
+import asyncio
+import ipaddress
+import logging
+import random
+import struct
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TYPE_SOA = 6
+TYPE_PTR = 12
+CLASS_IN = 1
+RCODE_NXDOMAIN = 3
+
+
+class DNSError(Exception):
+    pass
+
+
+def system_nameserver(path="/etc/resolv.conf"):
+    """First nameserver from resolv.conf, or None"""
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    return parts[1]
+    except OSError:
+        pass
+    return None
+
+
+def parse_nameserver(value, default_port=53):
+    """Split "host", "host:port" or "[v6]:port" into (host, port)"""
+    value = value.strip()
+    if value.startswith("["):
+        host, _, rest = value[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else default_port
+    if value.count(":") == 1:
+        host, port = value.split(":")
+        return host, int(port)
+    return value, default_port
+
+
+def reverse_name(ip):
+    """The in-addr.arpa / ip6.arpa name for an address"""
+    return ipaddress.ip_address(ip).reverse_pointer
+
+
+# ---- Wire format ----
+
+def build_query(query_id, name, qtype=TYPE_PTR):
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)  # RD set
+    labels = b"".join(
+        bytes([len(label)]) + label for label in (part.encode("ascii") for part in name.rstrip(".").split("."))
+    )
+    return header + labels + b"\x00" + struct.pack("!HH", qtype, CLASS_IN)
+
+
+def _read_name(data, offset):
+    """Decode a (possibly compressed) name; returns (name, offset after it)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(data):
+            raise DNSError("truncated name")
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= len(data):
+                raise DNSError("truncated pointer")
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            jumps += 1
+            if jumps > 32:
+                raise DNSError("compression loop")
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    return ".".join(labels), end if end is not None else offset
+
+
+def parse_response(data, query_id):
+    """Parse a PTR response
+
+    Returns (rcode, hostnames_with_ttls, negative_ttl), where negative_ttl
+    comes from the SOA in the authority section (None when absent).
+    """
+    if len(data) < 12:
+        raise DNSError("short response")
+    rid, flags, qdcount, ancount, nscount, _ = struct.unpack("!HHHHHH", data[:12])
+    if rid != query_id or not flags & 0x8000:
+        raise DNSError("unexpected message")
+
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = _read_name(data, offset)
+        offset += 4
+
+    answers, negative_ttl = [], None
+    for index in range(ancount + nscount):
+        _, offset = _read_name(data, offset)
+        if offset + 10 > len(data):
+            raise DNSError("truncated record")
+        rtype, _, ttl, length = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata = offset
+        offset += length
+        if index < ancount and rtype == TYPE_PTR:
+            answers.append((_read_name(data, rdata)[0].lower(), ttl))
+        elif index >= ancount and rtype == TYPE_SOA:
+            _, after = _read_name(data, rdata)
+            _, after = _read_name(data, after)
+            minimum = struct.unpack("!I", data[after + 16:after + 20])[0]
+            negative_ttl = min(ttl, minimum)
+    return flags & 0x000F, answers, negative_ttl
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id, future):
+        self.query_id = query_id
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 2 and struct.unpack("!H", data[:2])[0] == self.query_id and not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class _LoopState:
+    def __init__(self, concurrency):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.flights = {}
+
+
+class Resolver:
+    """Bounded, cached PTR resolver
+
+    ``nameserver`` is "host" or "host:port" (default: the system resolver
+    from /etc/resolv.conf). ``negative_ttl`` caps how long a missing PTR is
+    remembered and is used as is when the server sends no SOA; ``max_ttl``
+    caps positive answers.
+    """
+
+    def __init__(self, nameserver=None, timeout=1.0, concurrency=64,
+                 negative_ttl=300, max_ttl=86400, max_entries=10000):
+        self.nameserver = parse_nameserver(nameserver or system_nameserver() or "127.0.0.1")
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # ip -> (expires_at, hostname or None)
+        self._lock = threading.Lock()
+        self._loops = weakref.WeakKeyDictionary()
+        self._background = None
+        self._background_lock = threading.Lock()
+        self._random = random.SystemRandom()
+        self.counts = {"hits": 0, "negative_hits": 0, "misses": 0, "found": 0,
+                       "not_found": 0, "timeouts": 0, "errors": 0, "coalesced": 0}
+
+    # ---- cache ----
+
+    def cached(self, ip):
+        """(True, hostname or None) for a live cache entry, else (False, None)"""
+        with self._lock:
+            entry = self._cache.get(ip)
+            if entry is None:
+                self.counts["misses"] += 1
+                return False, None
+            if entry[0] <= time.time():
+                del self._cache[ip]
+                self.counts["misses"] += 1
+                return False, None
+            self._cache.move_to_end(ip)
+            self.counts["hits" if entry[1] is not None else "negative_hits"] += 1
+            return True, entry[1]
+
+    def _store(self, ip, hostname, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._cache[ip] = (time.time() + ttl, hostname)
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, entries=len(self._cache),
+                        nameserver="%s:%d" % self.nameserver)
+
+    # ---- async API ----
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState(self.concurrency)
+        return state
+
+    async def resolve(self, ip):
+        """Hostname for ip, or None when there is no PTR or the lookup failed"""
+        try:
+            name = reverse_name(ip)
+        except ValueError:
+            return None
+
+        found, hostname = self.cached(ip)
+        if found:
+            return hostname
+
+        state = self._state()
+        flight = state.flights.get(ip)
+        if flight is not None:
+            self._count("coalesced")
+            return await asyncio.shield(flight)
+
+        flight = state.flights[ip] = asyncio.get_running_loop().create_future()
+        hostname = None
+        try:
+            async with state.semaphore:
+                hostname = await self._query(ip, name)
+        finally:
+            del state.flights[ip]
+            flight.set_result(hostname)
+        return hostname
+
+    async def resolve_many(self, ips):
+        """{ip: hostname or None} for every address, resolved concurrently"""
+        ips = list(dict.fromkeys(ips))
+        hostnames = await asyncio.gather(*(self.resolve(ip) for ip in ips))
+        return dict(zip(ips, hostnames))
+
+    async def _query(self, ip, name):
+        loop = asyncio.get_running_loop()
+        query_id = self._random.randrange(65536)
+        future = loop.create_future()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _QueryProtocol(query_id, future), remote_addr=self.nameserver
+            )
+        except OSError as e:
+            logger.warning(f"PTR lookup for {ip} could not reach {self.nameserver[0]}: {e}")
+            self._count("errors")
+            return None
+
+        try:
+            transport.sendto(build_query(query_id, name))
+            data = await asyncio.wait_for(future, timeout=self.timeout)
+            rcode, answers, negative_ttl = parse_response(data, query_id)
+        except asyncio.TimeoutError:
+            logger.warning(f"PTR lookup for {ip} timed out")
+            self._count("timeouts")
+            return None
+        except (OSError, DNSError, struct.error) as e:
+            logger.warning(f"PTR lookup for {ip} failed: {e}")
+            self._count("errors")
+            return None
+        finally:
+            transport.close()
+
+        if answers:
+            hostname, ttl = answers[0]
+            self._count("found")
+            self._store(ip, hostname.rstrip("."), min(ttl, self.max_ttl))
+            return hostname.rstrip(".")
+        if rcode in (0, RCODE_NXDOMAIN):
+            self._count("not_found")
+            ttl = self.negative_ttl if negative_ttl is None else min(negative_ttl, self.negative_ttl)
+            self._store(ip, None, ttl)
+        else:
+            logger.warning(f"PTR lookup for {ip} failed with rcode {rcode}")
+            self._count("errors")
+        return None
+
+    # ---- sync API ----
+
+    def _background_loop(self):
+        with self._background_lock:
+            if self._background is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="rdns", daemon=True).start()
+                self._background = loop
+            return self._background
+
+    def submit(self, ip):
+        """Start resolving ip in the background; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(self.resolve(ip), self._background_loop())
+
+    def submit_many(self, ips):
+        """Start resolving many addresses; the Future gives {ip: hostname}"""
+        return asyncio.run_coroutine_threadsafe(self.resolve_many(ips), self._background_loop())
+
+    def lookup(self, ip):
+        """Blocking resolve, bounded by the resolver timeout"""
+        found, hostname = self.cached(ip)
+        if found:
+            return hostname
+        return self.submit(ip).result()
+
+    def lookup_many(self, ips):
+        return self.submit_many(ips).result()
@@ -0,0 +1,78 @@
+"""Compact storage for cached provider payloads.
+
+Provider parsers return small dicts with a fixed set of keys. Kept as dicts,
+each cached copy carries its own hash table, roughly five times the memory
+of the values themselves. ``pack`` turns such a dict into a ``__slots__``
+record whose class is shared by every dict with the same keys, and interns
+short strings so repeated cities, orgs and timezones are stored once.
+``unpack`` rebuilds the original dict. Values of any other type pass
+through unchanged.
+"""
+import sys
+import threading
+
+MAX_FIELDS = 32
+MAX_SCHEMAS = 256
+MAX_INTERNED_LENGTH = 64
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+class Record:
+    """Base class for packed dicts; ``fields`` keeps the original key order"""
+
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.fields, values):
+            setattr(self, name, value)
+
+    def to_dict(self):
+        return {name: unpack(getattr(self, name)) for name in self.fields}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.fields
+        )
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def schema(keys):
+    """The Record class for a tuple of keys, or None if it cannot have one"""
+    cls = _schemas.get(keys)
+    if cls is not None:
+        return cls
+    if len(keys) > MAX_FIELDS or not all(
+        isinstance(key, str) and key.isidentifier() and not key.startswith("__") for key in keys
+    ):
+        return None
+    with _schemas_lock:
+        cls = _schemas.get(keys)
+        if cls is None:
+            if len(_schemas) >= MAX_SCHEMAS:
+                return None
+            cls = _schemas[keys] = type(f"Record{len(_schemas)}", (Record,), {"__slots__": keys, "fields": keys})
+    return cls
+
+
+def pack(value):
+    """Compact a value for long-term storage"""
+    if type(value) is dict:
+        cls = schema(tuple(value))
+        if cls is not None:
+            return cls(*(pack(item) for item in value.values()))
+    elif type(value) is str and len(value) <= MAX_INTERNED_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def unpack(value):
+    """Rebuild a value stored with pack"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    return value
+
@@ -4,20 +4,99 @@ let isRefreshing = false;
 let currentMap = null;
 let isSearchMode = false;
 let originalIpInfo = {};
+let currentMapKey = null;
 
 // Initialize the application
 function initializeApp(ipData) {
     ipInfo = ipData;
     originalIpInfo = { ...ipData }; // Save original IP data
 
+    setupEventListeners();
+    addPageAnimations();
+
+    // Page was served as a shell: the lookup arrives stage by stage
+    if (ipData.streaming) {
+        streamIPInfo();
+        return;
+    }
+
     if (ipInfo && ipInfo.latitude && ipInfo.longitude && !ipInfo.error) {
         initializeMap();
     } else {
         showMapUnavailable();
     }
+}
 
-    setupEventListeners();
-    addPageAnimations();
+// Fill the page in as each lookup stage completes on the server
+function streamIPInfo() {
+    if (!window.EventSource) {
+        fetch('/api/ip-info')
+            .then(response => response.json())
+            .then(applyStreamedData)
+            .catch(error => showError(error.message));
+        return;
+    }
+
+    const source = new EventSource('/api/ip-info/stream');
+    let finished = false;
+
+    source.addEventListener('ip', event => {
+        const data = JSON.parse(event.data);
+        originalIpInfo = { ...originalIpInfo, ...data };
+        if (!isSearchMode) {
+            ipInfo = { ...ipInfo, ...data };
+            updateInfoValue('IPv4 Address', data.ipv4 || 'Not available');
+            updateInfoValue('IPv6 Address', data.ipv6 || 'Not available');
+        }
+    });
+
+    ['geo', 'whois', 'weather'].forEach(stage => {
+        source.addEventListener(stage, event => applyStreamedData(JSON.parse(event.data)));
+    });
+
+    source.addEventListener('done', event => {
+        finished = true;
+        source.close();
+        applyStreamedData(JSON.parse(event.data));
+    });
+
+    // EventSource would reconnect and restart the lookup; fall back to
+    // the one-shot endpoint instead
+    source.onerror = () => {
+        source.close();
+        if (!finished) {
+            fetch('/api/ip-info')
+                .then(response => response.json())
+                .then(applyStreamedData)
+                .catch(error => showError(error.message));
+        }
+    };
+}
+
+function applyStreamedData(data) {
+    if (!data.error) {
+        originalIpInfo = { ...data };
+    }
+    // Keep a search result on screen; "Back to My IP" shows the latest data
+    if (isSearchMode) {
+        return;
+    }
+
+    updateUIWithIPData(data);
+    if (!data.error) {
+        updatePrivacyNotice(data);
+    }
+}
+
+function updatePrivacyNotice(data) {
+    const notice = document.getElementById('privacy-notice-text');
+    if (notice && data.privacy_notice) {
+        notice.textContent = data.privacy_notice;
+    }
+    const privateNote = document.getElementById('private-ip-note');
+    if (privateNote) {
+        privateNote.style.display = data.is_private_ip ? '' : 'none';
+    }
 }
 
 // Initialize map with IP location
@@ -30,6 +109,8 @@ function initializeMap() {
     const owner = ipInfo.owner || ipInfo.org || 'Unknown';
     const isp = ipInfo.isp || 'Unknown';
 
+    currentMapKey = `${latitude},${longitude},${owner}`;
+
     // Clear existing map if any
     if (currentMap) {
         currentMap.remove();
@@ -108,6 +189,9 @@ function updateUIWithIPData(data) {
     updateInfoValue('IP Owner', data.owner || data.org || 'Unknown');
     updateInfoValue('ISP Provider', data.isp || 'Unknown');
     updateInfoValue('ASN', data.asn || 'Unknown');
+    if ('hostname' in data) {
+        updateInfoValue('Hostname', data.hostname || 'Unknown');
+    }
     updateInfoValue('Connection Type', data.connection_type || 'Unknown');
     updateInfoValue('Postal Code (Partial)', data.postal || 'Unknown');
     updateInfoValue('City', data.city || 'Unknown');
@@ -120,9 +204,11 @@ function updateUIWithIPData(data) {
         updateInfoValue('Coordinates', 'Unknown');
     }
 
-    // Reinitialize map
+    // Reinitialize map, unless a later stage left the location unchanged
     if (data.latitude && data.longitude) {
-        initializeMap();
+        if (!currentMap || currentMapKey !== `${data.latitude},${data.longitude},${data.owner || data.org || 'Unknown'}`) {
+            initializeMap();
+        }
     } else {
         showMapUnavailable();
     }
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import admission
+
+
+def _waiter(gate, priority, client=None, order=None, results=None):
+    """Start a thread that acquires a slot, records the outcome and releases"""
+    def run():
+        try:
+            ticket = gate.acquire(priority, client)
+        except admission.Rejected as e:
+            results.append((priority, e.reason))
+            return
+        if order is not None:
+            order.append(priority)
+        gate.release(ticket)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+# ------------------------------
+# 1. Scheduling
+# ------------------------------
+def test_interactive_requests_go_first():
+    gate = admission.Admission(slots=1)
+    held = gate.acquire("api")
+    order, results = [], []
+    threads = []
+    for priority in ("bulk", "api", "interactive"):
+        threads.append(_waiter(gate, priority, order=order, results=results))
+        _wait_until(lambda: sum(s["waiting"] for s in gate.stats().values()) == len(threads))
+    gate.release(held)
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive", "api", "bulk"]
+    assert results == []
+
+def test_bulk_jobs_cannot_take_every_slot():
+    gate = admission.Admission(slots=2, class_slots={"bulk": 1})
+    bulk = gate.acquire("bulk")
+    results = []
+    thread = _waiter(gate, "bulk", results=results)
+    _wait_until(lambda: gate.stats()["bulk"]["waiting"] == 1)
+    api = gate.acquire("api")  # the second slot is still free for others
+    gate.release(api)
+    gate.release(bulk)
+    thread.join()
+    assert results == []
+
+
+# ------------------------------
+# 2. Load shedding
+# ------------------------------
+def test_client_limit_returns_429():
+    gate = admission.Admission(slots=4, client_limit=2)
+    tickets = [gate.acquire("api", "203.0.113.5") for _ in range(2)]
+    try:
+        gate.acquire("api", "203.0.113.5")
+        assert False, "expected Rejected"
+    except admission.Rejected as e:
+        assert (e.reason, e.status) == ("client_limit", 429)
+    gate.acquire("api", "203.0.113.6")
+    gate.release(tickets[0])
+    gate.acquire("api", "203.0.113.5")
+
+def test_no_client_limit_by_default():
+    gate = admission.Admission(slots=8)
+    tickets = [gate.acquire("api", "203.0.113.5") for _ in range(8)]
+    assert gate.stats()["api"]["client_limit"] == 0
+    for ticket in tickets:
+        gate.release(ticket)
+
+def test_sheds_at_once_when_the_deadline_cannot_be_met():
+    gate = admission.Admission(slots=1, max_wait={"api": 1.0})
+    gate._hold["api"] = 3.0  # each request holds its slot for ~3s
+    held = gate.acquire("api")
+    started = time.monotonic()
+    try:
+        gate.acquire("api")
+        assert False, "expected Rejected"
+    except admission.Rejected as e:
+        assert (e.reason, e.status, e.retry_after) == ("deadline", 503, 3)
+    assert time.monotonic() - started < 0.1
+    gate.release(held)
+
+def test_queued_request_times_out():
+    gate = admission.Admission(slots=1, max_wait={"interactive": 0.05})
+    held = gate.acquire("api")
+    try:
+        gate.acquire("interactive")
+        assert False, "expected Rejected"
+    except admission.Rejected as e:
+        assert e.reason == "timeout"
+    gate.release(held)
+    assert gate.stats()["interactive"]["timeout"] == 1
+
+def test_full_queue_displaces_lower_priority():
+    gate = admission.Admission(slots=1, queue_size=1)
+    held = gate.acquire("api")
+    results = []
+    thread = _waiter(gate, "bulk", results=results)
+    _wait_until(lambda: gate.stats()["bulk"]["waiting"] == 1)
+    waiter = _waiter(gate, "interactive", results=results)
+    thread.join()
+    assert results == [("bulk", "displaced")]
+    try:
+        gate.acquire("bulk")
+        assert False, "expected Rejected"
+    except admission.Rejected as e:
+        assert e.reason == "queue_full"
+    gate.release(held)
+    waiter.join()
+    assert gate.stats()["interactive"]["admitted"] == 1
@@ -1,4 +1,5 @@
 import app
+import json
 import time
 
 # ------------------------------
@@ -85,7 +86,7 @@ def test_lookup_valid_ip_but_no_api_call():
 # 6. cache_result decorator tests
 # ------------------------------
 def test_cache_result_works():
-    @app.cache_result(timeout=2)
+    @app.cache_result(timeout=2, hard_timeout=2)
     def sample(x):
         return time.time()
 
@@ -97,6 +98,103 @@ def test_cache_result_works():
     t3 = sample(1)
     assert t1 != t3  # cache expired, new result generated
 
+def test_cache_result_serves_stale_and_refreshes():
+    calls = []
+
+    @app.cache_result(timeout=0.1, hard_timeout=60)
+    def sample_stale(x):
+        calls.append(x)
+        time.sleep(0.1)
+        return len(calls)
+
+    assert sample_stale(1) == 1
+    time.sleep(0.15)
+
+    started = time.monotonic()
+    assert sample_stale(1) == 1  # stale value, no upstream wait
+    assert time.monotonic() - started < 0.05
+
+    time.sleep(0.3)
+    assert sample_stale(1) == 2  # refreshed in the background
+    assert calls == [1, 1]
+
+class _FakeWhoisResponse:
+    status_code = 200
+
+    def json(self):
+        return {"org": "Example", "isp": "Example", "asn": "AS64500"}
+
+def test_cache_result_negative_caching():
+    calls = []
+
+    @app.cache_result(timeout=60, negative_timeout=60)
+    def sample_failing(x):
+        calls.append(x)
+        if x == "boom":
+            raise ValueError("upstream down")
+        return None
+
+    assert sample_failing("none") is None
+    assert sample_failing("none") is None
+    for _ in range(2):
+        try:
+            sample_failing("boom")
+        except Exception as e:
+            assert "upstream down" in str(e)
+        else:
+            raise AssertionError("expected a failure")
+
+    assert calls == ["none", "boom"]
+
+def test_negative_cache_entries_hide_api_keys():
+    @app.cache_result(timeout=60, negative_timeout=60)
+    def sample_leaky(x):
+        raise ValueError("Max retries exceeded with url: /data/2.5/weather?lat=1&appid=secret-key (timeout)")
+
+    errors = []
+    for _ in range(2):
+        try:
+            sample_leaky(1)
+        except Exception as e:
+            errors.append(str(e))
+    cached = errors[1]  # served from the negative cache entry
+    assert "secret-key" not in cached and "?<redacted>" in cached
+
+def test_throttled_whois_lookup_is_not_cached(monkeypatch):
+    responses = [app.ratelimit.ProviderUnavailable("ipwhois is throttled"), _FakeWhoisResponse()]
+
+    def fake_get(provider, url, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(app.http_client, "get", fake_get)
+    app._cache.clear()
+    try:
+        app.get_whois_info("198.51.100.7")
+    except app.ratelimit.ProviderUnavailable:
+        pass
+    else:
+        raise AssertionError("expected ProviderUnavailable")
+    assert app.get_whois_info("198.51.100.7")["asn"] == "AS64500"
+
+def test_prefix_cache_shares_results_within_a_block(monkeypatch):
+    calls = []
+
+    @app.prefix_cached
+    def get_prefix_test(ip):
+        calls.append(ip)
+        return {"asn": "AS15169", "network": "8.8.8.0/24"}
+
+    monkeypatch.setattr(app, "PREFIX_CACHE", True)
+    monkeypatch.setattr(app, "_prefix_caches", {})
+
+    get_prefix_test("8.8.8.8")
+    get_prefix_test("8.8.8.4")
+    get_prefix_test("8.8.4.4")
+    assert calls == ["8.8.8.8", "8.8.4.4"]
+
 def test_get_weather_and_time_missing_key():
     """
     If API key exists → temperature will be a float.
@@ -133,3 +231,427 @@ def test_get_ip_info_structure():
     assert "ipv4" in result
     assert "ipv6" in result
     assert "privacy_notice" in result
+
+
+# ------------------------------
+# 7. concurrent lookup pipeline
+# ------------------------------
+FAKE_GEO = {
+    "city": "Mountain View", "region": "California", "country_name": "United States",
+    "org": "Google LLC", "isp": "Google LLC", "asn": "AS15169",
+    "latitude": 37.4, "longitude": -122.1, "timezone": "America/Los_Angeles",
+    "postal": "94043"
+}
+
+def _fake_weather(lat, lon, tz):
+    return {"local_time": "2024-01-01 00:00:00", "weather": app.unknown_weather()}
+
+def test_lookup_overlaps_geo_and_whois(monkeypatch):
+    def slow_geo(ip):
+        time.sleep(0.3)
+        return dict(FAKE_GEO)
+
+    def slow_whois(ip):
+        time.sleep(0.3)
+        return {"owner": "Google LLC", "asn_org": "GOOGLE", "type": "business"}
+
+    monkeypatch.setattr(app, "LOOKUP_MODE", "concurrent")
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", slow_geo)])
+    monkeypatch.setattr(app, "get_whois_info", slow_whois)
+    monkeypatch.setattr(app, "get_weather_and_time", _fake_weather)
+
+    started = time.monotonic()
+    result = app.lookup_ip_info("8.8.8.8")
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.55
+    assert result["city"] == "Mountain View"
+    assert result["ip_type"] == "business"
+    assert "partial" not in result
+
+def test_lookup_returns_partial_result_on_deadline(monkeypatch):
+    def slow_whois(ip):
+        time.sleep(1)
+        return {"owner": "Google LLC", "asn_org": "GOOGLE", "type": "business"}
+
+    monkeypatch.setattr(app, "LOOKUP_MODE", "concurrent")
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", lambda ip: dict(FAKE_GEO))])
+    monkeypatch.setattr(app, "get_whois_info", slow_whois)
+    monkeypatch.setattr(app, "get_weather_and_time", _fake_weather)
+
+    result = app.lookup_ip_info("8.8.8.8", deadline=0.2)
+
+    assert result["city"] == "Mountain View"
+    assert result["ip_type"] == "Unknown"
+    assert result["partial"] is True
+    assert "whois" in result["timed_out_stages"]
+
+def test_lookup_adds_hostname_alongside_whois(monkeypatch):
+    class FakeResolver:
+        def submit(self, ip):
+            return app._lookup_executor.submit(lambda: time.sleep(0.2) or "dns.google")
+
+    monkeypatch.setattr(app, "LOOKUP_MODE", "concurrent")
+    monkeypatch.setattr(app, "RDNS", True)
+    monkeypatch.setattr(app, "_resolver", FakeResolver())
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", lambda ip: dict(FAKE_GEO))])
+    monkeypatch.setattr(app, "get_whois_info", lambda ip: time.sleep(0.2) or {"type": "business"})
+    monkeypatch.setattr(app, "get_weather_and_time", _fake_weather)
+
+    started = time.monotonic()
+    result = app.lookup_ip_info("8.8.8.8")
+    assert time.monotonic() - started < 0.35
+    assert result["hostname"] == "dns.google"
+    assert app.lookup_ip_info("10.0.0.1")["hostname"] == "Unknown"
+
+def test_lookup_skips_intermediate_snapshots(monkeypatch):
+    def no_snapshot(result):
+        raise AssertionError("snapshot built")
+
+    monkeypatch.setattr(app, "_snapshot", no_snapshot)
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", lambda ip: dict(FAKE_GEO))])
+    monkeypatch.setattr(app, "get_whois_info", lambda ip: {"type": "business"})
+    monkeypatch.setattr(app, "get_weather_and_time", _fake_weather)
+
+    result = app.lookup_ip_info("8.8.8.8")
+    assert result["city"] == "Mountain View"
+    assert result["postal"] == "940XXX"
+
+def test_geo_fallback_order(monkeypatch):
+    calls = []
+
+    def failing(ip):
+        calls.append("first")
+        raise Exception("boom")
+
+    def empty(ip):
+        calls.append("second")
+        return None
+
+    def working(ip):
+        calls.append("third")
+        return dict(FAKE_GEO)
+
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("a", failing), ("b", empty), ("c", working)])
+    assert app.fetch_geo_data("8.8.8.8")["city"] == "Mountain View"
+    assert calls == ["first", "second", "third"]
+
+def test_cached_geo_provider_keeps_its_place_without_budget(monkeypatch):
+    calls = []
+
+    @app.cache_result(timeout=60)
+    def cached_geo(ip):
+        calls.append("cached")
+        return dict(FAKE_GEO)
+
+    def fallback(ip):
+        calls.append("fallback")
+        return dict(FAKE_GEO)
+
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("test-drained", cached_geo), ("test-fallback", fallback)])
+    monkeypatch.setattr(app.ratelimit, "has_budget", lambda provider, reserve=0: provider != "test-drained")
+    app._cache.clear()
+    app.fetch_geo_data("8.8.8.8")  # a miss: the drained provider goes last
+    assert calls == ["fallback"]
+
+    cached_geo("8.8.8.8")
+    calls.clear()
+    assert app.cached_geo_providers("8.8.8.8") == ["test-drained"]
+    assert app.fetch_geo_data("8.8.8.8")["city"] == "Mountain View"
+    assert calls == []  # answered from the cache, no fallback call
+
+def test_cache_result_coalesces_concurrent_misses():
+    import threading
+    calls = []
+
+    @app.cache_result(timeout=60)
+    def slow_lookup(ip):
+        calls.append(ip)
+        time.sleep(0.1)
+        return {"ip": ip}
+
+    threads = [threading.Thread(target=slow_lookup, args=("9.9.9.9",)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["9.9.9.9"]
+    assert app._flights.stats()["functions"]["slow_lookup"]["coalesced"] == 5
+
+
+# ------------------------------
+# 8. weather caching
+# ------------------------------
+class _FakeWeatherResponse:
+    def json(self):
+        return {"main": {"temp": 30, "feels_like": 35, "humidity": 70}, "weather": [{"description": "clear sky"}]}
+
+def test_weather_shared_by_nearby_coordinates(monkeypatch):
+    calls = []
+
+    def fake_get(provider, url, **kwargs):
+        calls.append(url)
+        return _FakeWeatherResponse()
+
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test-key")
+    monkeypatch.setattr(app.http_client, "get", fake_get)
+    app._cache.clear()
+
+    first = app.get_weather_and_time(14.5995, 120.9842, "Asia/Manila")
+    second = app.get_weather_and_time(14.6001, 120.9850, "Asia/Manila")
+    far = app.get_weather_and_time(35.68, 139.69, "Asia/Tokyo")
+
+    assert first["weather"]["condition"] == "clear sky"
+    assert second["weather"] == first["weather"]
+    assert far["local_time"] != "Unknown"
+    assert len(calls) == 2
+
+def test_api_lookup_fetches_weather_once(monkeypatch):
+    calls = []
+
+    def fake_weather(lat, lon, tz):
+        calls.append((lat, lon))
+        return {"local_time": "2024-01-01 00:00:00", "weather": app.unknown_weather()}
+
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", lambda ip: dict(FAKE_GEO))])
+    monkeypatch.setattr(app, "get_whois_info", lambda ip: None)
+    monkeypatch.setattr(app, "get_weather_and_time", fake_weather)
+
+    response = app.app.test_client().post("/api/lookup", json={"ip": "8.8.4.4"})
+    assert response.get_json()["local_time"] == "2024-01-01 00:00:00"
+    assert len(calls) == 1
+
+
+# ------------------------------
+# 9. client address resolution
+# ------------------------------
+def test_index_uses_forwarded_client_ip(monkeypatch):
+    looked_up = []
+    monkeypatch.setattr(app, "lookup_ip_info", lambda ip: looked_up.append(ip) or app.new_result(ip))
+    monkeypatch.setattr(app, "get_public_ipv4", lambda: (_ for _ in ()).throw(AssertionError("ipify called")))
+
+    client = app.app.test_client()
+    response = client.get("/api/ip-info", headers={"X-Forwarded-For": "8.8.8.8"})
+
+    assert response.get_json()["ipv4"] == "8.8.8.8"
+    assert looked_up == ["8.8.8.8"]
+
+def test_private_client_falls_back_to_ipify(monkeypatch):
+    monkeypatch.setattr(app, "lookup_ip_info", app.new_result)
+    monkeypatch.setattr(app, "get_public_ipv4", lambda: "1.1.1.1")
+    monkeypatch.setattr(app, "get_public_ipv6", lambda: "")
+
+    result = app.app.test_client().get("/api/ip-info").get_json()
+    assert result["ipv4"] == "1.1.1.1"
+    assert result["ipv6"] == "Not available"
+
+
+# ------------------------------
+# 10. progressive index page
+# ------------------------------
+def test_index_serves_shell_without_lookup(monkeypatch):
+    monkeypatch.setattr(app, "INDEX_MODE", "stream")
+    monkeypatch.setattr(app, "lookup_ip_info", lambda ip: (_ for _ in ()).throw(AssertionError("lookup ran")))
+
+    response = app.app.test_client().get("/", headers={"X-Forwarded-For": "8.8.8.8"})
+    html = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert "streaming: true" in html
+    assert "8.8.8.8" in html
+
+def test_ip_info_stream_emits_each_stage(monkeypatch):
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", lambda ip: dict(FAKE_GEO))])
+    monkeypatch.setattr(app, "get_whois_info", lambda ip: {"owner": "Google LLC", "type": "business"})
+    monkeypatch.setattr(app, "get_weather_and_time", _fake_weather)
+
+    response = app.app.test_client().get("/api/ip-info/stream", headers={"X-Forwarded-For": "8.8.8.8"})
+    assert response.mimetype == "text/event-stream"
+
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.get_data(as_text=True).strip().split("\n\n")
+    ]
+    assert [name for name, _ in events] == ["ip", "geo", "whois", "weather", "done"]
+    assert events[1][1]["city"] == "Mountain View"
+    assert events[1][1]["postal"] == "940XXX"
+    assert events[2][1]["ip_type"] == "business"
+    assert events[-1][1]["local_time"] == "2024-01-01 00:00:00"
+
+
+# ------------------------------
+# 11. metrics
+# ------------------------------
+def test_metrics_endpoint_and_server_timing(monkeypatch):
+    monkeypatch.setattr(app, "SERVER_TIMING", True)
+    monkeypatch.setattr(app, "GEO_PROVIDERS", [("fake", lambda ip: dict(FAKE_GEO))])
+    monkeypatch.setattr(app, "get_whois_info", lambda ip: None)
+    monkeypatch.setattr(app, "get_weather_and_time", _fake_weather)
+    client = app.app.test_client()
+
+    response = client.post("/api/lookup", json={"ip": "8.8.8.8"})
+    timing = response.headers["Server-Timing"]
+    for stage in ("validation", "geo", "whois", "sanitize", "weather", "render"):
+        assert f"{stage};dur=" in timing
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE ipinfo_stage_duration_seconds histogram" in text
+    assert 'ipinfo_stage_duration_seconds_count{stage="geo"}' in text
+    assert "ipinfo_cache_hit_ratio" in text
+
+
+# ------------------------------
+# 12. cache warming
+# ------------------------------
+def _hot_function(monkeypatch, calls):
+    monkeypatch.setattr(app, "_hot_keys", app.hotkeys.HotKeys())
+    monkeypatch.setattr(app, "_warmed", {})
+    monkeypatch.setattr(app, "_warming", dict.fromkeys(app._warming, 0))
+    app._cache.clear()
+
+    @app.cache_result(timeout=1, providers=("test-warm",))
+    def hot_lookup(ip):
+        calls.append(ip)
+        return {"ip": ip, "call": len(calls)}
+
+    return hot_lookup
+
+def test_warmer_refreshes_hot_keys_before_they_expire(monkeypatch):
+    calls = []
+    hot_lookup = _hot_function(monkeypatch, calls)
+    for _ in range(3):
+        hot_lookup("9.9.9.9")
+    hot_lookup("1.1.1.1")  # below CACHE_WARM_MIN_HITS
+    assert calls == ["9.9.9.9", "1.1.1.1"]
+
+    time.sleep(0.6)
+    assert app.warm_hot_keys() == 1
+    assert calls == ["9.9.9.9", "1.1.1.1", "9.9.9.9"]
+    stats = app.app.test_client().get("/api/cache-stats").get_json()
+    assert stats["warming"]["warmed"] == 1
+
+    time.sleep(0.5)  # past the original entry's freshness
+    assert hot_lookup("9.9.9.9")["call"] == 3
+    assert app._warming["prevented_misses"] == 1
+
+def test_warmer_leaves_fresh_keys_alone(monkeypatch):
+    calls = []
+    hot_lookup = _hot_function(monkeypatch, calls)
+    monkeypatch.setattr(app, "CACHE_WARM_LEAD", 0.1)
+    for _ in range(3):
+        hot_lookup("9.9.9.9")
+    assert app.warm_hot_keys() == 0
+    assert calls == ["9.9.9.9"]
+
+def test_warmer_respects_provider_budget(monkeypatch):
+    calls = []
+    hot_lookup = _hot_function(monkeypatch, calls)
+    for _ in range(3):
+        hot_lookup("9.9.9.9")
+    monkeypatch.setattr(app.ratelimit, "has_budget", lambda provider, reserve=0: provider != "test-warm")
+    assert app.warm_hot_keys(now=time.time() + 0.5) == 0
+    assert calls == ["9.9.9.9"]
+    assert app._warming["skipped_budget"] == 1
+
+def test_hot_keys_snapshot_and_access_log(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "_hot_keys", app.hotkeys.HotKeys())
+    monkeypatch.setattr(app, "_hot_ips", app.hotkeys.HotKeys())
+    log = tmp_path / "access.log"
+    log.write_text("8.8.8.8 GET /\n1.1.1.1 GET /\n8.8.8.8 GET /about\nnot a request\n")
+    assert app.hot_ips_from_log(str(log)) == ["8.8.8.8", "1.1.1.1"]
+
+    app._hot_keys.record("get_whois_info_('8.8.8.8',)_{}", ("get_whois_info", ("8.8.8.8",)))
+    snapshot = str(tmp_path / "hot.json")
+    app.save_hot_keys(snapshot)
+    monkeypatch.setattr(app, "_hot_keys", app.hotkeys.HotKeys())
+    monkeypatch.setattr(app, "_hot_ips", app.hotkeys.HotKeys())
+    assert app.load_hot_keys(snapshot) == ["8.8.8.8", "1.1.1.1"]
+    assert app._hot_keys.top()[0][2] == ("get_whois_info", ("8.8.8.8",))
+
+
+# ------------------------------
+# 13. cluster mode
+# ------------------------------
+def test_internal_cache_endpoint_serves_cached_functions(monkeypatch):
+    calls = []
+
+    @app.cache_result(timeout=60)
+    def cluster_lookup(ip):
+        calls.append(ip)
+        return {"ip": ip}
+
+    client = app.app.test_client()
+    body = {"function": "cluster_lookup", "args": ["8.8.8.8"]}
+    assert client.post("/internal/cache", json=body).status_code == 404
+
+    monkeypatch.setattr(app, "_cluster", app.cluster.Cluster("http://localhost", []))
+    assert client.post("/internal/cache", json=body).status_code == 403  # no secret, no access
+
+    monkeypatch.setattr(app, "_cluster", app.cluster.Cluster("http://localhost", [], secret="s3cret"))
+    monkeypatch.setitem(app.CLUSTER_ARG_CHECKS, "cluster_lookup", app.validate_ip_address)
+    headers = {"X-Cluster-Token": "s3cret"}
+    for _ in range(2):
+        response = client.post("/internal/cache", json=body, headers=headers)
+        assert response.get_json() == {"value": {"ip": "8.8.8.8"}}
+    assert calls == ["8.8.8.8"]
+    for bad in ({"function": "get_public_ipv4", "args": []},
+                {"function": "cluster_lookup", "args": ["not-an-ip"]},
+                {"function": "get_cell_weather", "args": ["9q9h!"]},
+                {"function": "get_whois_info", "args": [["8.8.8.8"]]}):
+        assert client.post("/internal/cache", json=bad, headers=headers).status_code == 400
+    assert calls == ["8.8.8.8"]
+
+def test_forwarded_results_are_cached_locally(monkeypatch):
+    node = app.cluster.Cluster("http://localhost", ["http://peer"], replicas=1)
+    forwarded = []
+    monkeypatch.setattr(node, "call", lambda key, name, args, local: forwarded.append(name) or {"remote": True})
+    monkeypatch.setattr(app, "_cluster", node)
+
+    @app.cache_result(timeout=60)
+    def routed_lookup(ip):
+        return {"remote": False}
+
+    assert routed_lookup("8.8.4.4") == {"remote": True}
+    assert routed_lookup("8.8.4.4") == {"remote": True}
+    assert forwarded == ["routed_lookup"]
+
+
+# ------------------------------
+# 14. admission control
+# ------------------------------
+def test_busy_server_sheds_with_retry_after(monkeypatch):
+    gate = app.admission.Admission(slots=1, max_wait={"api": 0.05})
+    monkeypatch.setattr(app, "_admission", gate)
+    monkeypatch.setattr(app, "lookup_ip_info", app.new_result)
+    client = app.app.test_client()
+
+    held = gate.acquire("bulk")
+    response = client.post("/api/lookup", json={"ip": "8.8.8.8"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    gate.release(held)
+
+    assert client.post("/api/lookup", json={"ip": "8.8.8.8"}).status_code == 200
+    assert client.get("/api/admission-stats").get_json()["api"]["timeout"] == 1
+
+def test_streamed_responses_hold_their_slot_until_done(monkeypatch):
+    gate = app.admission.Admission(slots=2)
+    monkeypatch.setattr(app, "_admission", gate)
+    running = []
+    monkeypatch.setattr(
+        app, "lookup_ip_info",
+        lambda ip, geo_data=None, executor=None: running.append(gate.stats()["bulk"]["running"]) or app.new_result(ip)
+    )
+    monkeypatch.setattr(app, "get_ip_api_batch", lambda ips: {})
+    client = app.app.test_client()
+
+    response = client.post("/api/lookup/batch", json={"ips": ["8.8.8.8", "1.1.1.1"]})
+    assert len(response.get_data(as_text=True).splitlines()) == 2
+    assert running == [1, 1]
+    stats = gate.stats()["bulk"]
+    assert stats["admitted"] == 1 and stats["running"] == 0
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'ipinfo_admission_queue_depth{class="interactive"} 0' in text
+    assert 'ipinfo_admission_wait_seconds_count{class="bulk"} 1' in text
@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import app
+import asgi
+
+FAKE_GEO = {
+    "city": "Mountain View", "region": "California", "country_name": "United States",
+    "org": "Google LLC", "isp": "Google LLC", "asn": "AS15169",
+    "latitude": 37.4, "longitude": -122.1, "timezone": "America/Los_Angeles",
+    "postal": "94043"
+}
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _request(method, path, **kwargs):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.request(method, path, **kwargs)
+
+
+@pytest.fixture
+def fake_providers(monkeypatch):
+    async def geo(ip):
+        await asyncio.sleep(0.2)
+        return dict(FAKE_GEO)
+
+    async def whois(ip):
+        return {"owner": "Google LLC", "asn_org": "GOOGLE", "type": "business"}
+
+    async def weather(lat, lon, tz):
+        return {"local_time": "2024-01-01 00:00:00", "weather": app.unknown_weather()}
+
+    monkeypatch.setattr(asgi, "GEO_PROVIDERS", [("fake-async", geo)])
+    monkeypatch.setattr(asgi, "get_whois_info", whois)
+    monkeypatch.setattr(asgi, "get_weather_and_time", weather)
+
+
+# ------------------------------
+# 1. Routes
+# ------------------------------
+def test_lookup_route(fake_providers):
+    response = _run(_request("POST", "/api/lookup", json={"ip": "8.8.8.8"}))
+    data = response.json()
+    assert response.status_code == 200
+    assert data["city"] == "Mountain View"
+    assert data["ip_type"] == "business"
+    assert data["postal"] == "940XXX"
+
+def test_lookup_route_validation():
+    assert _run(_request("POST", "/api/lookup", json={})).status_code == 400
+    assert "error" in _run(_request("POST", "/api/lookup", json={"ip": "abc123"})).json()
+    assert _run(_request("GET", "/api/lookup")).status_code == 405
+    assert _run(_request("GET", "/nope")).status_code == 404
+
+def test_clear_cache_and_static():
+    assert _run(_request("POST", "/api/clear-cache")).json()["status"] == "success"
+
+    response = _run(_request("GET", "/static/css/app.css"))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/css")
+    assert _run(_request("GET", "/static/../app.py")).status_code == 404
+
+def test_ip_info_uses_forwarded_client_ip(fake_providers):
+    response = _run(_request("GET", "/api/ip-info", headers={"X-Forwarded-For": "8.8.8.8"}))
+    assert response.json()["ipv4"] == "8.8.8.8"
+    assert response.json()["city"] == "Mountain View"
+
+def test_ip_info_stream(fake_providers):
+    response = _run(_request("GET", "/api/ip-info/stream", headers={"X-Forwarded-For": "8.8.8.8"}))
+    names = [line[len("event: "):] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert response.headers["content-type"] == "text/event-stream"
+    assert names == ["ip", "geo", "whois", "weather", "done"]
+
+
+# ------------------------------
+# 2. Concurrency
+# ------------------------------
+def test_many_lookups_in_flight(fake_providers):
+    async def many():
+        return await asyncio.gather(*[asgi.lookup_ip_info(f"8.8.{i // 256}.{i % 256}") for i in range(500)])
+
+    started = time.monotonic()
+    results = _run(many())
+    assert all(r["city"] == "Mountain View" for r in results)
+    assert time.monotonic() - started < 2
+
+@app.cache_result(timeout=60)
+def async_test(ip):
+    """Only supplies the cache policy for asgi.cached"""
+
+
+def test_cached_coalesces_concurrent_misses():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"asn": "AS15169"}
+
+    async def many():
+        app._cache.clear()
+        return await asyncio.gather(*[asgi.cached(async_test, ("1.1.1.1",), fetch) for _ in range(20)])
+
+    assert _run(many()) == [{"asn": "AS15169"}] * 20
+    assert len(calls) == 1
+
+def test_cached_remembers_failures():
+    calls = []
+
+    @app.cache_result(timeout=60, negative_timeout=60)
+    def async_policy(ip):
+        """Only supplies the cache policy for asgi.cached"""
+
+    async def fetch():
+        calls.append(1)
+        return None if len(calls) == 1 else {"asn": "AS15169"}
+
+    async def scenario():
+        app._cache.clear()
+        first = await asgi.cached(async_policy, ("9.9.9.9",), fetch)
+        again = await asgi.cached(async_policy, ("9.9.9.9",), fetch)  # negative hit
+        await asyncio.sleep(0)
+        return first, again
+
+    assert _run(scenario()) == (None, None)
+    assert len(calls) == 1
+
+def test_disk_cache_calls_run_off_the_event_loop(monkeypatch, tmp_path):
+    disk = app.create_cache("sqlite", path=str(tmp_path / "cache.db"))
+    threads = []
+    for name in ("get", "set"):
+        method = getattr(disk, name)
+        monkeypatch.setattr(disk, name, lambda *a, _m=method, **k: threads.append(threading.get_ident()) or _m(*a, **k))
+    monkeypatch.setattr(app, "_cache", disk)
+
+    async def fetch():
+        return {"asn": "AS64500"}
+
+    async def scenario():
+        first = await asgi.cached(async_test, ("192.0.2.1",), fetch)
+        return first, await asgi.cached(async_test, ("192.0.2.1",), fetch)
+
+    assert _run(scenario()) == ({"asn": "AS64500"}, {"asn": "AS64500"})
+    assert len(threads) == 3 and threading.get_ident() not in threads
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"asn": "AS13335"}
+
+    async def scenario():
+        app._cache.clear()
+        leader = asyncio.ensure_future(asgi.cached(async_test, ("1.0.0.1",), fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(asgi.cached(async_test, ("1.0.0.1",), fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter
+
+    assert _run(scenario()) == {"asn": "AS13335"}
+    assert len(calls) == 1
+
+def test_cancelled_stage_is_reported_as_timed_out():
+    async def scenario():
+        task = asyncio.ensure_future(asyncio.sleep(1))
+        asyncio.get_running_loop().call_later(0.01, task.cancel)
+        timed_out = []
+        deadline_at = asyncio.get_running_loop().time() + 1
+        return await asgi._await_stage(task, deadline_at, "whois", timed_out), timed_out
+
+    assert _run(scenario()) == (None, ["whois"])
+
+
+# ------------------------------
+# 3. Cluster endpoint
+# ------------------------------
+def test_internal_cache_route(monkeypatch):
+    async def weather(cell):
+        return {"cell": cell}
+
+    assert _run(_request("POST", "/internal/cache", json={})).status_code == 404
+    node = app.cluster.Cluster("http://test", ["http://test"], secret="s3cret")
+    monkeypatch.setattr(app, "_cluster", node)
+    monkeypatch.setitem(asgi.CLUSTER_FUNCTIONS, "get_cell_weather", weather)
+    body = {"function": "get_cell_weather", "args": ["9q9hv"]}
+
+    assert _run(_request("POST", "/internal/cache", json=body)).status_code == 403
+    response = _run(_request("POST", "/internal/cache", json=body, headers={"X-Cluster-Token": "s3cret"}))
+    assert response.json() == {"value": {"cell": "9q9hv"}}
+    assert node.stats()["served"] == 1
+    bad = {"function": "get_cell_weather", "args": ["../x"]}
+    response = _run(_request("POST", "/internal/cache", json=bad, headers={"X-Cluster-Token": "s3cret"}))
+    assert response.status_code == 400
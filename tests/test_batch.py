@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+
+import app
+import batch
+
+
+# ------------------------------
+# 1. Input parsing
+# ------------------------------
+def test_iter_unique_ips_dedupes_and_skips_blanks():
+    lines = [b"8.8.8.8\n", "  1.1.1.1 ", "", "# comment", "8.8.8.8"]
+    assert list(batch.iter_unique_ips(lines)) == ["8.8.8.8", "1.1.1.1"]
+
+def test_iter_unique_ips_limit():
+    ips = batch.iter_unique_ips([f"10.0.0.{i}" for i in range(5)], max_ips=3)
+    assert next(ips) == "10.0.0.0"
+    try:
+        list(ips)
+        assert False, "expected BatchTooLarge"
+    except batch.BatchTooLarge:
+        pass
+
+
+# ------------------------------
+# 2. Streaming with bounded concurrency
+# ------------------------------
+def test_stream_lookups_bounded_and_prefetched():
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+    prefetch_calls = []
+
+    def prefetch(chunk):
+        prefetch_calls.append(list(chunk))
+        return {ip: {"city": "Prefetched"} for ip in chunk}
+
+    def lookup(ip, geo_data):
+        with lock:
+            in_flight.append(ip)
+            peak[0] = max(peak[0], len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(ip)
+        return {"ipv4": ip, "city": geo_data["city"]}
+
+    ips = [f"10.0.0.{i}" for i in range(25)]
+    results = dict(batch.stream_lookups(ips, lookup, prefetch=prefetch, concurrency=4, chunk_size=10))
+
+    assert set(results) == set(ips)
+    assert all(r["city"] == "Prefetched" for r in results.values())
+    assert peak[0] <= 4
+    assert [len(c) for c in prefetch_calls] == [10, 10, 5]
+
+
+# ------------------------------
+# 3. /api/lookup/batch endpoint
+# ------------------------------
+def _patch_lookups(monkeypatch):
+    monkeypatch.setattr(app, "get_ip_api_batch", lambda ips: {})
+    monkeypatch.setattr(
+        app, "lookup_ip_info",
+        lambda ip, geo_data=None, executor=None: {"ipv4": ip} if app.validate_ip_address(ip) else {"error": "Invalid IP address format"}
+    )
+
+def test_batch_endpoint_json(monkeypatch):
+    _patch_lookups(monkeypatch)
+    client = app.app.test_client()
+    response = client.post("/api/lookup/batch", json={"ips": ["8.8.8.8", "8.8.8.8", "bad-ip"]})
+
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    by_ip = {line["ip"]: line for line in lines}
+    assert len(lines) == 2
+    assert by_ip["8.8.8.8"]["ipv4"] == "8.8.8.8"
+    assert "error" in by_ip["bad-ip"]
+
+def test_batch_endpoint_plain_text(monkeypatch):
+    _patch_lookups(monkeypatch)
+    client = app.app.test_client()
+    response = client.post("/api/lookup/batch", data="1.1.1.1\n8.8.8.8\n", content_type="text/plain")
+
+    ips = sorted(json.loads(line)["ip"] for line in response.data.decode().splitlines())
+    assert ips == ["1.1.1.1", "8.8.8.8"]
+
+def test_batch_lookups_run_on_their_own_pool(monkeypatch):
+    executors = []
+
+    def fake_lookup(ip, geo_data=None, executor=None):
+        executors.append(executor)
+        return {"ipv4": ip}
+
+    monkeypatch.setattr(app, "get_ip_api_batch", lambda ips: {})
+    monkeypatch.setattr(app, "lookup_ip_info", fake_lookup)
+    client = app.app.test_client()
+    client.post("/api/lookup/batch", json={"ips": ["8.8.8.8", "1.1.1.1"]}).get_data()
+    assert executors == [app._bulk_executor] * 2
+    assert app._bulk_executor is not app._lookup_executor
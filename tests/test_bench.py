@@ -0,0 +1,61 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+from bench import run as bench_run
+from bench.mock_providers import MockProviderServer, ProviderProfile
+
+
+# ------------------------------
+# 1. Mock providers
+# ------------------------------
+def test_mock_provider_answers_and_counts():
+    profiles = {"ipapi": ProviderProfile(latency=0, jitter=0)}
+    with MockProviderServer(profiles) as server:
+        with urllib.request.urlopen(server.base_url("ipapi") + "/8.8.8.8/json/") as response:
+            data = json.load(response)
+        assert data["ip"] == "8.8.8.8"
+        assert data["network"] == "8.8.8.0/24"
+        assert server.counts()["ipapi"] == {"ok": 1, "error": 0, "throttled": 0}
+
+def test_mock_provider_throttles():
+    profiles = {"ipinfo": ProviderProfile(latency=0, jitter=0, throttle_rate=1.0)}
+    with MockProviderServer(profiles) as server:
+        try:
+            urllib.request.urlopen(server.base_url("ipinfo") + "/8.8.8.8/json")
+            assert False, "expected a 429"
+        except urllib.error.HTTPError as e:
+            assert e.code == 429
+            assert e.headers["Retry-After"] == "1"
+        assert server.counts()["ipinfo"]["throttled"] == 1
+
+
+# ------------------------------
+# 2. Runner
+# ------------------------------
+def test_short_run_reports_percentiles(monkeypatch):
+    for provider in ("IPAPI", "IP_API", "IPINFO", "IPWHOIS", "OPENWEATHER", "IPIFY"):
+        monkeypatch.setenv(f"RATE_LIMIT_{provider}", "0")
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "bench")
+    report = bench_run.run(rps=20, duration=0.5, unique_ips=5)
+    assert report["requests"] == 10
+    assert report["errors"] == 0
+    assert report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"] <= report["max_ms"]
+    assert report["upstream"]["ipapi"]["ok"] >= 1
+
+def test_compare_flags_regressions_only_beyond_tolerance():
+    baseline = {"p95_ms": 100, "p99_ms": 200, "throughput_rps": 50, "upstream_calls": 100}
+    assert bench_run.compare(dict(baseline, p95_ms=115), baseline, tolerance=0.2) == []
+    regressions = bench_run.compare(dict(baseline, p95_ms=130, throughput_rps=30), baseline, tolerance=0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("p95_ms")
+
+def test_missing_baseline_is_reported_before_running(capsys):
+    assert os.path.exists(bench_run.baseline_path("default"))
+    try:
+        bench_run.main(["--compare", "no-such-baseline"])
+        assert False, "expected SystemExit"
+    except SystemExit as e:
+        assert e.code == 2
+    assert "--save-baseline no-such-baseline" in capsys.readouterr().err
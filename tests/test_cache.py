@@ -0,0 +1,191 @@
+import threading
+import time
+
+from cache import RedisCache, SingleFlight, SQLiteCache, TTLCache, create_cache
+
+
+# ------------------------------
+# 1. TTLCache basics
+# ------------------------------
+def test_set_and_get():
+    cache = TTLCache(max_entries=10)
+    cache.set("a", {"city": "Manila"}, ttl=60)
+    assert cache.get("a") == (True, {"city": "Manila"})
+    assert cache.get("missing") == (False, None)
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_hits_return_private_copies():
+    cache = TTLCache(max_entries=10)
+    cache.set("a", {"city": "Manila", "weather": {"condition": "rain"}}, ttl=60)
+    first = cache.get("a")[1]
+    first["city"] = "Changed"
+    first["weather"]["condition"] = "sun"
+    assert cache.get("a")[1] == {"city": "Manila", "weather": {"condition": "rain"}}
+
+def test_compact_entries_are_smaller():
+    value = {"city": "Manila", "region": "Metro Manila", "country_name": "Philippines",
+             "org": "PLDT", "asn": "AS9299", "latitude": 14.6, "longitude": 121.0}
+    compact, plain = TTLCache(max_entries=10), TTLCache(max_entries=10, compact=False)
+    compact.set("a", dict(value), ttl=60)
+    plain.set("a", dict(value), ttl=60)
+    assert compact.stats()["bytes"] < plain.stats()["bytes"]
+    assert compact.get("a")[1] == plain.get("a")[1] == value
+
+def test_entry_expires():
+    cache = TTLCache(max_entries=10)
+    cache.set("a", 1, ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+
+# ------------------------------
+# 2. Eviction
+# ------------------------------
+def test_lru_eviction_by_entries():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", 3, ttl=60)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+def test_eviction_by_bytes():
+    cache = TTLCache(max_entries=100, max_bytes=2000)
+    for i in range(50):
+        cache.set(i, "x" * 100, ttl=60)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 2000
+    assert stats["evictions"] > 0
+    assert 49 in cache
+
+def test_expired_entries_purged_on_set():
+    cache = TTLCache(max_entries=100)
+    for i in range(10):
+        cache.set(i, i, ttl=0.01)
+    time.sleep(0.05)
+    cache.set("fresh", 1, ttl=60)
+
+    assert len(cache) == 1
+    assert cache.stats()["expirations"] == 10
+
+
+# ------------------------------
+# 3. Persistent backends
+# ------------------------------
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None or value[1] <= time.time():
+            return None
+        return value[0]
+
+    def set(self, key, value, px):
+        self.data[key] = (value, time.time() + px / 1000)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match, count):
+        prefix = match.rstrip("*")
+        return [key for key in self.data if key.startswith(prefix)]
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path).set("k", {"city": "Manila"}, ttl=60)
+
+    reopened = SQLiteCache(path)
+    assert reopened.get("k") == (True, {"city": "Manila"})
+    reopened.clear()
+    assert reopened.get("k") == (False, None)
+
+def test_sqlite_cache_expiry_and_eviction(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=5)
+    cache.PURGE_EVERY = 1
+    cache.set("old", 1, ttl=0.01)
+    time.sleep(0.05)
+    assert cache.get("old") == (False, None)
+
+    for i in range(10):
+        cache.set(str(i), i, ttl=60 + i)
+    assert cache.stats()["entries"] == 5
+    assert "9" in cache
+    assert "0" not in cache
+
+def test_redis_cache_with_prefix():
+    client = FakeRedis()
+    client.data["other:key"] = ("1", time.time() + 60)
+    cache = RedisCache(prefix="ipinfo:", client=client)
+
+    cache.set("k", {"asn": "AS15169"}, ttl=60)
+    assert cache.get("k", namespace="get_whois_info") == (True, {"asn": "AS15169"})
+    assert cache.stats()["functions"]["get_whois_info"]["hits"] == 1
+
+    cache.clear()
+    assert cache.get("k") == (False, None)
+    assert "other:key" in client.data
+
+def test_create_cache_backends(tmp_path):
+    assert isinstance(create_cache("memory"), TTLCache)
+    assert isinstance(create_cache("sqlite", path=str(tmp_path / "c.db")), SQLiteCache)
+
+
+# ------------------------------
+# 4. SingleFlight
+# ------------------------------
+def _run_concurrently(func, count):
+    results = [None] * count
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, func())) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"ip": "8.8.8.8"}
+
+    results = _run_concurrently(lambda: flights.do("k", fetch, namespace="fetch"), 8)
+
+    assert len(calls) == 1
+    assert all(r == {"ip": "8.8.8.8"} for r in results)
+    stats = flights.stats()
+    assert stats["executions"] == 1
+    assert stats["coalesced"] == 7
+    assert stats["in_flight"] == 0
+
+def test_single_flight_propagates_errors():
+    flights = SingleFlight()
+    errors = []
+
+    def fetch():
+        time.sleep(0.05)
+        raise ValueError("upstream down")
+
+    def call():
+        try:
+            flights.do("k", fetch)
+        except ValueError as e:
+            errors.append(str(e))
+
+    _run_concurrently(call, 4)
+    assert errors == ["upstream down"] * 4
@@ -0,0 +1,50 @@
+import ipaddress
+
+import pytest
+
+import classify
+
+np = pytest.importorskip("numpy")
+
+
+# ------------------------------
+# 1. Keyword matching
+# ------------------------------
+def test_private_org_matching():
+    assert classify.is_private_org("Internal Corporate LAN")
+    assert classify.is_private_org("ADMIN VPN")
+    assert not classify.is_private_org("Google LLC")
+    assert not classify.is_private_org(None)
+    assert classify.private_org_mask(["Acme Intranet", "Cloudflare", ""]) == [True, False, False]
+
+def test_restricted_org_matching():
+    assert classify.is_restricted_org("Department of Defense")
+    assert not classify.is_restricted_org("Google LLC")
+
+
+# ------------------------------
+# 2. Vectorized CIDR classification
+# ------------------------------
+def test_classify_flags():
+    ips = ["8.8.8.8", "10.1.2.3", "100.64.0.1", "224.0.0.1", "2001:4860::8888", "fe80::1", "bad", ""]
+    flags = classify.classify(ips)
+
+    assert flags["valid"].tolist() == [True] * 6 + [False, False]
+    assert flags["ipv4"].tolist() == [True, True, True, True, False, False, False, False]
+    assert flags["private"].tolist() == [False, True, False, False, False, True, False, False]
+    assert flags["reserved"].tolist() == [False, False, True, True, False, True, False, False]
+    assert flags["bogon"].tolist() == [False, True, True, True, False, True, False, False]
+
+def test_classify_matches_ipaddress_is_private():
+    ips = ["8.8.8.8", "192.168.1.1", "172.16.5.4", "172.32.0.1", "127.0.0.1",
+           "203.0.113.9", "::1", "fd00::1", "2606:4700::1111"]
+    expected = [ipaddress.ip_address(ip).is_private for ip in ips]
+    assert classify.classify(ips)["private"].tolist() == expected
+
+def test_classify_custom_table_and_v6_boundaries():
+    ips = ["2001:db8::", "2001:db8:ffff:ffff:ffff:ffff:ffff:ffff", "2001:db9::", "198.51.100.255"]
+    flags = classify.classify(ips, custom=["2001:db8::/32", "198.51.100.0/24"])
+    assert flags["custom"].tolist() == [True, True, False, True]
+
+def test_routable_mask():
+    assert classify.routable_mask(["8.8.8.8", "192.168.0.1", "nope"]).tolist() == [True, False, False]
@@ -0,0 +1,54 @@
+import clientip
+
+TRUSTED = clientip.parse_networks("127.0.0.1, 10.0.0.0/8, ::1")
+
+
+# ------------------------------
+# 1. Header parsing
+# ------------------------------
+def test_normalize_strips_ports_and_brackets():
+    assert clientip.normalize("203.0.113.7:4711") == "203.0.113.7"
+    assert clientip.normalize('"[2001:db8::1]:443"') == "2001:db8::1"
+    assert clientip.normalize("::ffff:198.51.100.2") == "198.51.100.2"
+    assert clientip.normalize("unknown") is None
+    assert clientip.normalize("_hidden") is None
+
+def test_parse_forwarded():
+    value = 'for=192.0.2.60;proto=http;by=203.0.113.43, For="[2001:db8:cafe::17]:4711"'
+    assert clientip.parse_forwarded(value) == ["192.0.2.60", "2001:db8:cafe::17"]
+
+
+# ------------------------------
+# 2. Trusted proxy chain
+# ------------------------------
+def test_headers_ignored_from_untrusted_peer():
+    assert clientip.client_ip("8.8.4.4", x_forwarded_for="1.2.3.4", trusted=TRUSTED) == "8.8.4.4"
+
+def test_walks_trusted_hops_from_the_right():
+    xff = "6.6.6.6, 8.8.8.8, 10.0.0.2"  # first hop is client-supplied and spoofable
+    assert clientip.client_ip("127.0.0.1", x_forwarded_for=xff, trusted=TRUSTED) == "8.8.8.8"
+
+def test_forwarded_wins_over_x_forwarded_for():
+    ip = clientip.client_ip(
+        "::1", forwarded='for="[2001:4860::1]"', x_forwarded_for="9.9.9.9", trusted=TRUSTED
+    )
+    assert ip == "2001:4860::1"
+
+def test_malformed_hop_stops_the_walk():
+    ip = clientip.client_ip("127.0.0.1", x_forwarded_for="8.8.8.8, garbage", trusted=TRUSTED)
+    assert ip == "127.0.0.1"
+
+def test_is_public():
+    assert clientip.is_public("8.8.8.8")
+    assert not clientip.is_public("192.168.1.1")
+    assert not clientip.is_public("nope")
+
+
+# ------------------------------
+# 3. Addresses in log lines
+# ------------------------------
+def test_find_ip_in_log_lines():
+    line = b'203.0.113.9 - - [10/Oct/2024:13:55:36 +0000] "GET / HTTP/1.1" 200'
+    assert clientip.find_ip(line) == "203.0.113.9"
+    assert clientip.find_ip(b"10.0.0.1 [2001:db8::1]:443 GET", field=1) == "2001:db8::1"
+    assert clientip.find_ip(b"no address 999.1.1.1 here") is None
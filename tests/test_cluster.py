@@ -0,0 +1,75 @@
+from bench import cluster as bench_cluster
+from bench.mock_providers import MockProviderServer
+from bench.run import ip_pool
+
+import cluster
+
+
+NODES = ["http://10.0.0.1:5000", "http://10.0.0.2:5000", "http://10.0.0.3:5000"]
+
+
+# ------------------------------
+# 1. Hash ring
+# ------------------------------
+def test_owners_are_distinct_and_stable():
+    ring = cluster.HashRing(NODES)
+    owners = ring.owners("get_whois_info_('8.8.8.8',)_{}", 2)
+    assert len(set(owners)) == 2
+    assert cluster.HashRing(reversed(NODES)).owners("get_whois_info_('8.8.8.8',)_{}", 2) == owners
+    assert len(ring.owners("key", 5)) == 3
+
+def test_keys_spread_and_move_little_when_a_node_joins():
+    keys = [f"key{i}" for i in range(3000)]
+    ring = cluster.HashRing(NODES)
+    placed = {key: ring.owners(key)[0] for key in keys}
+    for node in NODES:
+        assert 600 < list(placed.values()).count(node) < 1400
+
+    grown = cluster.HashRing(NODES + ["http://10.0.0.4:5000"])
+    moved = [key for key in keys if grown.owners(key)[0] != placed[key]]
+    assert all(grown.owners(key)[0] == "http://10.0.0.4:5000" for key in moved)
+    assert len(moved) < 1200
+
+
+# ------------------------------
+# 2. Routing
+# ------------------------------
+def test_owner_and_forwarded_calls_run_locally():
+    node = cluster.Cluster(NODES[0], NODES, replicas=1)
+    key = next(f"key{i}" for i in range(100) if node.is_local(f"key{i}"))
+    assert node.call(key, "f", (), lambda: "here") == "here"
+    with node.serving():
+        other = next(f"key{i}" for i in range(100) if not node.is_local(f"key{i}"))
+        assert node.call(other, "f", (), lambda: "here") == "here"
+    assert node.stats()["local"] == 2 and node.stats()["served"] == 1
+
+def test_unreachable_owners_fall_back_to_a_local_fetch():
+    dead = ["http://127.0.0.1:9", "http://127.0.0.1:10"]
+    node = cluster.Cluster("http://127.0.0.1:11", dead, replicas=1, timeout=0.5, failures=1)
+    key = next(f"key{i}" for i in range(100) if not node.is_local(f"key{i}"))
+    assert node.call(key, "f", (), lambda: "fetched") == "fetched"
+    stats = node.stats()
+    assert stats["fallback"] == 1 and stats["peer_errors"] == 1
+    assert stats["nodes"][node.owners(key)[0]] == "open"
+
+
+# ------------------------------
+# 3. Local multi-process cluster
+# ------------------------------
+def test_each_ip_is_fetched_upstream_once_cluster_wide():
+    report = bench_cluster.run(nodes=3, requests_count=90, unique_ips=15)
+    assert report["errors"] == 0
+    assert report["upstream"]["ipapi"]["ok"] == 15
+    assert report["upstream"]["ipwhois"]["ok"] == 15
+    assert sum(stats["forwarded"] for stats in report["cluster"]) > 0
+
+def test_replica_serves_keys_of_a_stopped_node():
+    ips = ip_pool(20, 2)
+    with MockProviderServer(seed=2) as server:
+        with bench_cluster.LocalCluster(3, server.url) as local:
+            local.stop(2)
+            survivors = local.urls[:2]
+            assert bench_cluster.drive(survivors, ips, 60, seed=2) == 0
+            stats = [local.stats(i)["cluster"] for i in range(2)]
+        assert server.counts()["ipapi"]["ok"] == 20
+    assert sum(s["replica"] + s["fallback"] for s in stats) > 0
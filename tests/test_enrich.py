@@ -0,0 +1,98 @@
+import csv
+import json
+
+import app
+import enrich
+import geoip
+
+LOG = (
+    b'8.8.8.8 - - [10/Oct/2000:13:55:36 -0700] "GET / HTTP/1.0" 200 2326\n'
+    b'proxy [::ffff:1.1.1.1]:443 "GET /a HTTP/1.1" 200 12\n'
+    b'no address here\n'
+    b'2001:4860:4860::8888 - - "GET / HTTP/1.0" 200 2326\n'
+    b'8.8.8.8 - - "GET /b HTTP/1.0" 404 0\n'
+)
+
+
+def _fake_lookups(monkeypatch, calls):
+    def lookup(ip, geo_data=None):
+        calls.append(ip)
+        return {"city": "City " + ip, "asn": "AS1"}
+
+    monkeypatch.setattr(app, "lookup_ip_info", lookup)
+    monkeypatch.setattr(app, "get_ip_api_batch", lambda ips: {})
+
+
+# ------------------------------
+# 1. Address extraction
+# ------------------------------
+def test_extract_ip():
+    assert enrich.extract_ip(b'8.8.8.8 - - [10/Oct/2000:13:55:36 -0700] "GET /"') == "8.8.8.8"
+    assert enrich.extract_ip(b"client=[2001:db8::1]:8443 ok") == "2001:db8::1"
+    assert enrich.extract_ip(b"at 10:32:01 nothing") is None
+    assert enrich.extract_ip(b"9.9.9.9 via 8.8.4.4", field=2) == "8.8.4.4"
+
+
+# ------------------------------
+# 2. Enrichment
+# ------------------------------
+def test_ndjson_output_keeps_input_order(tmp_path, monkeypatch):
+    calls = []
+    _fake_lookups(monkeypatch, calls)
+    log, out = tmp_path / "access.log", tmp_path / "out.ndjson"
+    log.write_bytes(LOG)
+
+    summary = enrich.enrich(str(log), str(out), fields=("city",), workers=0, progress_interval=None)
+
+    rows = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [row["ip"] for row in rows] == ["8.8.8.8", "1.1.1.1", None, "2001:4860:4860::8888", "8.8.8.8"]
+    assert rows[3]["city"] == "City 2001:4860:4860::8888"
+    assert rows[2] == {"line": 3, "ip": None, "city": None, "error": None}
+    assert sorted(calls) == sorted(["8.8.8.8", "1.1.1.1", "2001:4860:4860::8888"])
+    assert summary["lines"] == 5 and summary["unique_ips"] == 3
+
+def test_resumes_from_checkpoint(tmp_path, monkeypatch):
+    calls = []
+    _fake_lookups(monkeypatch, calls)
+    log, out = tmp_path / "access.log", tmp_path / "out.csv"
+    checkpoint = tmp_path / "out.csv.checkpoint"
+    log.write_bytes(LOG)
+    checkpoint.write_text(
+        json.dumps({"ip": "8.8.8.8", "row": {"city": "Cached", "error": None}}) + "\n"
+        + json.dumps({"ip": "2001:4860:4860::8888", "row": {"city": None, "error": "timed out"}}) + "\n"
+        + '{"ip": "1.1.'
+    )
+
+    summary = enrich.enrich(str(log), str(out), "csv", fields=("city",), workers=0,
+                            checkpoint=str(checkpoint), progress_interval=None)
+
+    rows = list(csv.DictReader(out.open()))
+    assert rows[0]["city"] == "Cached"
+    assert rows[1]["city"] == "City 1.1.1.1"
+    assert rows[3]["city"] == "City 2001:4860:4860::8888"  # the failed row is retried
+    assert "8.8.8.8" not in calls
+    assert summary["resumed"] == 1
+    assert not checkpoint.exists()
+
+def test_process_pool(tmp_path, monkeypatch):
+    # Spawned workers import the app afresh, so configure them through the
+    # environment: an offline GeoIP database answers without the network
+    ranges = tmp_path / "ranges.csv"
+    ranges.write_text(
+        "network,city,country_name,org,asn\n"
+        "8.8.8.0/24,Mountain View,United States,Google LLC,AS15169\n"
+        "1.1.1.0/24,Sydney,Australia,Cloudflare Inc,AS13335\n"
+    )
+    geoip.open_database(str(ranges)).close()  # compile once, not in every worker
+    monkeypatch.setenv("GEOIP_DB", str(ranges))
+    monkeypatch.setenv("GEOIP_MODE", "offline")
+    log, out = tmp_path / "access.log", tmp_path / "out.ndjson"
+    log.write_bytes(LOG * 20)
+
+    enrich.main([str(log), "-o", str(out), "--workers", "2", "--chunk-size", "1", "--progress", "60"])
+
+    rows = [json.loads(line) for line in out.read_text().splitlines()]
+    assert len(rows) == 100
+    assert rows[1]["city"] == "Sydney"
+    assert rows[-1]["city"] == "Mountain View"
+    assert rows[-2]["city"] == "Unknown"
@@ -0,0 +1,21 @@
+import geohash
+
+
+def test_encode_known_value():
+    assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+def test_decode_returns_cell_centre():
+    lat, lon = geohash.decode(geohash.encode(14.5995, 120.9842, 5))
+    assert abs(lat - 14.5995) < 0.03
+    assert abs(lon - 120.9842) < 0.03
+
+def test_nearby_points_share_a_cell():
+    assert geohash.encode(14.5995, 120.9842) == geohash.encode(14.6001, 120.9850)
+    assert geohash.encode(14.5995, 120.9842) != geohash.encode(35.68, 139.69)
+
+def test_is_valid():
+    assert geohash.is_valid("9q9hv")
+    assert not geohash.is_valid("")
+    assert not geohash.is_valid("9q9ha")  # "a" is not in the alphabet
+    assert not geohash.is_valid("9" * 13)
+    assert not geohash.is_valid(["9q9hv"])
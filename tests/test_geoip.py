@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+import geoip
+
+CSV = """network,city,region,country_name,org,asn,latitude,longitude,timezone,postal
+8.8.8.0/24,Mountain View,California,United States,Google LLC,AS15169,37.4,-122.1,America/Los_Angeles,94043
+1.1.1.0/24,Sydney,New South Wales,Australia,Cloudflare Inc,AS13335,-33.9,151.2,Australia/Sydney,2000
+1.1.1.128/25,Overlap,Nowhere,Nowhere,Overlap,AS1,0,0,UTC,0
+2001:4860::/32,Mountain View,California,United States,Google LLC,AS15169,37.4,-122.1,America/Los_Angeles,94043
+not-a-network,Broken,,,,,,,,
+"""
+
+
+def _open(tmp_path):
+    csv_path = tmp_path / "ranges.csv"
+    csv_path.write_text(CSV)
+    return geoip.open_database(str(csv_path))
+
+
+# ------------------------------
+# 1. Compiled index lookups
+# ------------------------------
+def test_lookup_ipv4_and_ipv6(tmp_path):
+    db = _open(tmp_path)
+    try:
+        assert db.v4_count == 2  # overlapping and invalid rows dropped
+        assert db.lookup("8.8.8.8")["city"] == "Mountain View"
+        assert db.lookup("8.8.8.8")["latitude"] == 37.4
+        assert db.lookup("1.1.1.200")["org"] == "Cloudflare Inc"
+        assert db.lookup("2001:4860:4860::8888")["asn"] == "AS15169"
+    finally:
+        db.close()
+
+def test_lookup_misses(tmp_path):
+    db = _open(tmp_path)
+    try:
+        assert db.lookup("9.9.9.9") is None
+        assert db.lookup("0.0.0.1") is None
+        assert db.lookup("2a00::1") is None
+        assert db.lookup("not-an-ip") is None
+    finally:
+        db.close()
+
+def test_records_are_deduplicated(tmp_path):
+    db = _open(tmp_path)
+    try:
+        # The IPv4 and IPv6 Google ranges share one record
+        assert db.record_count == 3
+    finally:
+        db.close()
+
+def test_concurrent_compiles_use_their_own_temp_files(tmp_path, monkeypatch):
+    csv_path = tmp_path / "ranges.csv"
+    csv_path.write_text(CSV)
+    index_path = str(tmp_path / "ranges.idx")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: geoip.compile_csv(str(csv_path), index_path), range(8)))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ranges.csv", "ranges.idx"]
+    db = geoip.GeoIPIndex(index_path)
+    try:
+        assert db.lookup("1.1.1.200")["org"] == "Cloudflare Inc"
+    finally:
+        db.close()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(geoip.os, "replace", fail)
+    try:
+        geoip.compile_csv(str(csv_path), index_path)
+        assert False, "expected OSError"
+    except OSError:
+        pass
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ranges.csv", "ranges.idx"]
+
+
+# ------------------------------
+# 2. lookup_ip_info integration
+# ------------------------------
+def test_lookup_offline_makes_no_remote_calls(tmp_path, monkeypatch):
+    db = _open(tmp_path)
+
+    def remote(*args, **kwargs):
+        raise AssertionError("remote provider called in offline mode")
+
+    monkeypatch.setattr(app, "_geoip_db", db)
+    monkeypatch.setattr(app, "GEOIP_MODE", "offline")
+    monkeypatch.setattr(app, "fetch_geo_data", remote)
+    monkeypatch.setattr(app, "get_whois_info", remote)
+    monkeypatch.setattr(app, "get_weather_and_time", remote)
+
+    try:
+        result = app.lookup_ip_info("8.8.8.8")
+        assert result["city"] == "Mountain View"
+        assert result["owner"] == "Google LLC"
+        assert result["postal"] == "940XXX"
+        assert result["weather"]["condition"] == "Unknown"
+
+        assert app.lookup_ip_info("9.9.9.9")["city"] == "Unknown"
+    finally:
+        db.close()
@@ -0,0 +1,42 @@
+import json
+import time
+
+import hotkeys
+
+
+# ------------------------------
+# 1. Counting
+# ------------------------------
+def test_top_keys_hottest_first():
+    hot = hotkeys.HotKeys(capacity=3)
+    for key, count in (("a", 5), ("b", 9), ("c", 1), ("d", 7)):
+        for _ in range(count):
+            hot.record(key, payload=key.upper())
+    top = hot.top()
+    assert [key for key, _, _ in top] == ["b", "d", "a"]
+    assert top[0] == ("b", 9, "B")
+    assert hot.estimate("c") >= 1
+
+def test_estimates_never_undercount():
+    hot = hotkeys.HotKeys(capacity=10, width=64, depth=3)
+    for i in range(500):
+        hot.record(f"key{i % 100}")
+    assert all(hot.estimate(f"key{i}") >= 5 for i in range(100))
+    assert hot.stats() == {"tracked": 10, "capacity": 10, "recorded": 500}
+
+def test_counts_decay():
+    hot = hotkeys.HotKeys(decay_interval=0.01)
+    hot.record("a", count=8)
+    time.sleep(0.02)
+    assert hot.record("a") == 5
+
+
+# ------------------------------
+# 2. Snapshots
+# ------------------------------
+def test_snapshot_round_trip():
+    hot = hotkeys.HotKeys()
+    hot.record("get_whois_info_('8.8.8.8',)_{}", ("get_whois_info", ("8.8.8.8",)), count=4)
+    restored = hotkeys.HotKeys()
+    restored.load(json.loads(json.dumps(hot.snapshot())))
+    assert restored.top() == [("get_whois_info_('8.8.8.8',)_{}", 4, ("get_whois_info", ("8.8.8.8",)))]
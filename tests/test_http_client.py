@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_client
+import ratelimit
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"ip": "203.0.113.7"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _JSONHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ------------------------------
+# 1. Session pooling
+# ------------------------------
+def test_get_session_is_shared_per_provider():
+    assert http_client.get_session("ipapi") is http_client.get_session("ipapi")
+    assert http_client.get_session("ipapi") is not http_client.get_session("ipwhois")
+
+def test_provider_timeout_env_override(monkeypatch):
+    monkeypatch.setenv("HTTP_TIMEOUT_IP_API", "3")
+    assert http_client.provider_setting("ip-api", "timeout", 10) == 3
+    assert http_client.provider_setting("ipwhois", "timeout", 10) == 8
+
+def test_fractional_timeout_and_backoff_overrides(monkeypatch):
+    monkeypatch.setenv("HTTP_TIMEOUT_IPAPI", "2.5")
+    monkeypatch.setenv("HTTP_BACKOFF_FACTOR_IPAPI", "0.05")
+    assert http_client.provider_setting("ipapi", "timeout", http_client.DEFAULT_TIMEOUT) == 2.5
+    assert http_client.provider_setting("ipapi", "backoff_factor", http_client.DEFAULT_BACKOFF_FACTOR) == 0.05
+
+def test_connections_are_reused():
+    server = _start_server()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/json"
+        for _ in range(5):
+            assert http_client.get("test-local", url).json()["ip"] == "203.0.113.7"
+
+        stats = http_client.connection_stats()["test-local"]
+        assert stats["requests"] == 5
+        assert stats["connections"] == 1
+        assert stats["reused"] == 4
+        assert http_client.providers.histogram("test-local").count == 5
+    finally:
+        server.shutdown()
+        http_client.get_session("test-local").close()
+
+
+# ------------------------------
+# 2. Async requests
+# ------------------------------
+def test_cancelled_trial_call_frees_the_breaker(monkeypatch):
+    class SlowClient:
+        async def request(self, method, url, **kwargs):
+            await asyncio.sleep(10)
+
+    monkeypatch.setattr(http_client, "get_async_client", lambda provider: SlowClient())
+    breaker = ratelimit.limiter("test-cancelled").breaker
+    breaker.record_failure(throttled=True, retry_after=0)
+    breaker.opened_until = 0  # cool-down over: the next call is the trial
+
+    async def cancelled_call():
+        task = asyncio.ensure_future(http_client.request_async("GET", "test-cancelled", "http://test/"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancelled_call())
+    assert ratelimit.stats()["test-cancelled"]["cancelled"] == 1
+    assert breaker.allow()  # a new trial, not stuck half-open
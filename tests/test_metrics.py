@@ -0,0 +1,41 @@
+import metrics
+from providers import LatencyHistogram
+
+
+# ------------------------------
+# 1. Stage timers
+# ------------------------------
+def test_timer_records_request_timings():
+    token = metrics.start_request()
+    with metrics.timer("geo"):
+        pass
+    metrics.observe("weather", 0.0125)
+    timings = metrics.finish_request(token)
+
+    assert [stage for stage, _ in timings] == ["geo", "weather"]
+    assert metrics.server_timing(timings[1:]) == "weather;dur=12.5"
+    assert metrics.stage_histogram("geo").count >= 1
+
+def test_timings_not_collected_outside_a_request():
+    metrics.observe("render", 0.001)
+    token = metrics.start_request()
+    assert metrics.finish_request(token) == []
+
+
+# ------------------------------
+# 2. Prometheus text format
+# ------------------------------
+def test_family_escapes_labels():
+    text = metrics.family("x_total", "counter", "Help.", [({"name": 'a"b'}, 3)])
+    assert text.splitlines() == ["# HELP x_total Help.", "# TYPE x_total counter", 'x_total{name="a\\"b"} 3']
+
+def test_histogram_family_is_cumulative():
+    hist = LatencyHistogram(buckets=(0.1, 1, float("inf")))
+    for seconds in (0.05, 0.5, 2):
+        hist.observe(seconds)
+    lines = metrics.histogram_family("lat_seconds", "Help.", "provider", {"ipapi": hist}).splitlines()
+
+    assert 'lat_seconds_bucket{provider="ipapi",le="0.1"} 1' in lines
+    assert 'lat_seconds_bucket{provider="ipapi",le="1"} 2' in lines
+    assert 'lat_seconds_bucket{provider="ipapi",le="+Inf"} 3' in lines
+    assert 'lat_seconds_count{provider="ipapi"} 3' in lines
@@ -0,0 +1,59 @@
+import time
+
+from prefixcache import PrefixCache
+
+
+# ------------------------------
+# 1. Longest-prefix match
+# ------------------------------
+def test_neighbours_share_a_range():
+    cache = PrefixCache()
+    assert cache.put("8.8.8.8", {"asn": "AS15169"}) == "8.8.8.0/24"
+    assert cache.get("8.8.8.200") == (True, {"asn": "AS15169"})
+    assert cache.get("8.8.9.1") == (False, None)
+
+def test_contains_does_not_count_lookups():
+    cache = PrefixCache()
+    cache.put("8.8.8.8", {"asn": "AS15169"})
+    assert cache.contains("8.8.8.200") and not cache.contains("8.8.9.1")
+    assert not cache.contains("not-an-ip")
+    assert (cache.hits, cache.misses) == (0, 0)
+
+def test_announced_network_only_narrows_the_range():
+    cache = PrefixCache(v4_prefix=24, v6_prefix=48)
+    assert cache.put("1.1.1.1", {"asn": "AS13335"}, network="1.0.0.0/8") == "1.1.1.0/24"
+    assert cache.put("9.9.9.9", {"asn": "AS19281"}, network="9.9.9.0/28") == "9.9.9.0/28"
+    assert cache.get("9.9.9.20") == (False, None)
+    assert cache.put("2001:4860:4860::8888", {"asn": "AS15169"}) == "2001:4860:4860::/48"
+    assert cache.get("2001:4860:4860:1::1")[0]
+
+def test_most_specific_range_wins():
+    cache = PrefixCache(v4_prefix=16)
+    cache.put("203.1.0.1", {"asn": "AS1"})
+    cache.put("203.1.2.3", {"asn": "AS1", "city": "Elsewhere"}, network="203.1.2.0/24")
+    assert cache.get("203.1.2.9")[1]["city"] == "Elsewhere"
+    assert cache.get("203.1.7.9")[1] == {"asn": "AS1"}
+
+
+# ------------------------------
+# 2. Safeguards
+# ------------------------------
+def test_private_addresses_not_aggregated():
+    cache = PrefixCache()
+    assert cache.put("192.168.1.1", {"asn": "AS1"}) is None
+    assert cache.get("192.168.1.2") == (False, None)
+
+def test_verification_splits_mixed_blocks():
+    cache = PrefixCache(verify_every=1)
+    cache.put("8.8.8.8", {"asn": "AS15169"})
+    assert cache.get("8.8.8.9") == (False, None)  # sampled for verification
+
+    assert cache.put("8.8.8.9", {"asn": "AS64500"}) == "8.8.8.9/32"
+    assert cache.stats()["conflicts"] == 1
+    assert cache.put("8.8.8.10", {"asn": "AS15169"}) == "8.8.8.10/32"
+
+def test_entries_expire():
+    cache = PrefixCache(ttl=0.05)
+    cache.put("8.8.8.8", {"asn": "AS15169"})
+    time.sleep(0.1)
+    assert cache.get("8.8.8.8") == (False, None)
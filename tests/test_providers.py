@@ -0,0 +1,90 @@
+import time
+
+import providers
+
+
+def _provider(value, delay=0.0, calls=None, error=None):
+    def func(ip):
+        if calls is not None:
+            calls.append(value)
+        time.sleep(delay)
+        if error:
+            raise Exception(error)
+        return value
+    return func
+
+
+# ------------------------------
+# 1. LatencyHistogram
+# ------------------------------
+def test_histogram_percentile():
+    hist = providers.LatencyHistogram()
+    assert hist.percentile(95) is None
+
+    for _ in range(95):
+        hist.observe(0.04)
+    for _ in range(5):
+        hist.observe(2.5)
+
+    assert hist.percentile(50) == 0.05
+    assert hist.percentile(95) == 0.05
+    assert hist.percentile(99) == 3
+
+def test_hedge_delay_uses_default_until_enough_samples(monkeypatch):
+    monkeypatch.setattr(providers, "HEDGE_MIN_SAMPLES", 3)
+    hist = providers.histogram("hedge-delay-test")
+    assert providers.hedge_delay("hedge-delay-test") == providers.HEDGE_DEFAULT_DELAY
+
+    for _ in range(3):
+        hist.observe(0.2)
+    assert providers.hedge_delay("hedge-delay-test") == 0.2
+
+def test_strategies_do_not_record_cache_hits():
+    chain = [("cached-only", _provider({"city": "Cached"}))]
+    for _ in range(30):
+        providers.run_strategy(chain, "1.1.1.1", strategy="hedged")
+    assert providers.histogram("cached-only").count == 0
+
+
+# ------------------------------
+# 2. Strategies
+# ------------------------------
+def test_sequential_falls_back_in_order():
+    calls = []
+    chain = [
+        ("a", _provider({"city": "A"}, calls=calls, error="boom")),
+        ("b", _provider(None, calls=calls)),
+        ("c", _provider({"city": "C"}, calls=calls)),
+    ]
+    assert providers.run_strategy(chain, "1.1.1.1", strategy="sequential") == {"city": "C"}
+    assert len(calls) == 3
+
+def test_hedged_starts_next_provider_after_delay(monkeypatch):
+    monkeypatch.setattr(providers, "HEDGE_DEFAULT_DELAY", 0.05)
+    chain = [
+        ("slow", _provider({"city": "Slow"}, delay=0.5)),
+        ("fast", _provider({"city": "Fast"}, delay=0.01)),
+    ]
+    started = time.monotonic()
+    result = providers.run_strategy(chain, "1.1.1.1", strategy="hedged")
+
+    assert result == {"city": "Fast"}
+    assert time.monotonic() - started < 0.3
+
+def test_hedged_returns_none_when_all_fail(monkeypatch):
+    monkeypatch.setattr(providers, "HEDGE_DEFAULT_DELAY", 0.05)
+    chain = [
+        ("a", _provider(None, delay=0.1)),
+        ("b", _provider(None, error="boom")),
+    ]
+    assert providers.run_strategy(chain, "1.1.1.1", strategy="hedged") is None
+
+def test_race_returns_first_good_answer():
+    chain = [
+        ("slow", _provider({"city": "Slow"}, delay=0.3)),
+        ("broken", _provider(None, error="boom")),
+        ("fast", _provider({"city": "Fast"}, delay=0.02)),
+    ]
+    started = time.monotonic()
+    assert providers.run_strategy(chain, "1.1.1.1", strategy="race") == {"city": "Fast"}
+    assert time.monotonic() - started < 0.25
@@ -0,0 +1,97 @@
+import time
+
+import ratelimit
+
+
+# ------------------------------
+# 1. TokenBucket
+# ------------------------------
+def test_token_bucket_limits_and_refills():
+    bucket = ratelimit.TokenBucket(rate=20, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+    time.sleep(0.06)
+    assert bucket.try_acquire()
+
+
+# ------------------------------
+# 2. CircuitBreaker
+# ------------------------------
+def test_breaker_opens_after_consecutive_failures():
+    breaker = ratelimit.CircuitBreaker(failures=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.is_open()
+
+def test_breaker_opens_immediately_on_429_and_half_opens():
+    breaker = ratelimit.CircuitBreaker(failures=5, cooldown=0.05)
+    breaker.record_failure(throttled=True)
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # one trial call
+    assert not breaker.allow()  # while the trial is in flight
+    breaker.record_success()
+    assert breaker.allow()
+
+def test_breaker_respects_retry_after():
+    breaker = ratelimit.CircuitBreaker(cooldown=0.01)
+    breaker.record_failure(throttled=True, retry_after=60)
+    time.sleep(0.02)
+    assert breaker.is_open()
+
+
+# ------------------------------
+# 3. Provider registry and scheduling
+# ------------------------------
+def test_acquire_rejects_when_quota_used(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_TEST_QUOTA", "60:2")
+    ratelimit.acquire("test-quota")
+    ratelimit.acquire("test-quota")
+    try:
+        ratelimit.acquire("test-quota")
+        assert False, "expected ProviderUnavailable"
+    except ratelimit.ProviderUnavailable:
+        pass
+    assert ratelimit.stats()["test-quota"]["rejected"] == 1
+
+def test_schedule_moves_tripped_providers_last():
+    ratelimit.record("test-tripped", "throttled")
+    chain = [("test-tripped", None), ("test-healthy", None)]
+    assert [name for name, _ in ratelimit.schedule(chain)] == ["test-healthy", "test-tripped"]
+
+def test_schedule_keeps_exempt_providers_in_place():
+    ratelimit.record("test-exempt", "throttled")
+    chain = [("test-exempt", None), ("test-other", None)]
+    assert [name for name, _ in ratelimit.schedule(chain, exempt=("test-exempt",))] == ["test-exempt", "test-other"]
+
+def test_has_budget_keeps_a_reserve(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_TEST_RESERVE", "60:3")
+    assert ratelimit.has_budget("test-reserve", reserve=2)
+    ratelimit.acquire("test-reserve")
+    assert not ratelimit.has_budget("test-reserve", reserve=2)
+    assert ratelimit.has_budget("test-reserve")
+
+def test_share_quotas_splits_each_limit(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_TEST_SHARED", "120:8")
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    monkeypatch.setattr(ratelimit, "_share", 1)
+    ratelimit.share_quotas(4)
+    bucket = ratelimit.limiter("test-shared").bucket
+    assert (bucket.rate, bucket.capacity) == (0.5, 2)
+    assert ratelimit.limiter("ipapi").bucket.capacity == 2.5
+    assert ratelimit.limiter("ipify").bucket is None
+
+def test_released_trial_lets_the_next_call_try_again():
+    breaker = ratelimit.CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+    assert breaker.trips == 1
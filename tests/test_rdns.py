@@ -0,0 +1,131 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import rdns
+
+
+class StubDNS:
+    """UDP nameserver answering PTR queries from a dict of reverse name -> reply
+
+    A reply is ("ptr", hostname, ttl), ("nx", soa_minimum) or "drop".
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = "127.0.0.1:%d" % self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, peer = self.sock.recvfrom(512)
+            except OSError:
+                return
+            name, end = rdns._read_name(data, 12)
+            self.queries.append(name)
+            reply = self.records.get(name, ("nx", 60))
+            if reply == "drop":
+                continue
+            question = data[12:end + 4]
+            query_id = struct.unpack("!H", data[:2])[0]
+            if reply[0] == "ptr":
+                target = rdns.build_query(0, reply[1])[12:-4]
+                record = b"\xc0\x0c" + struct.pack("!HHIH", 12, 1, reply[2], len(target)) + target
+                header = struct.pack("!HHHHHH", query_id, 0x8180, 1, 1, 0, 0)
+            else:
+                soa = b"\x00\x00" + struct.pack("!IIIII", 1, 3600, 600, 86400, reply[1])
+                record = b"\xc0\x0c" + struct.pack("!HHIH", 6, 1, 3600, len(soa)) + soa
+                header = struct.pack("!HHHHHH", query_id, 0x8183, 1, 0, 1, 0)
+            self.sock.sendto(header + question + record, peer)
+
+    def close(self):
+        self.sock.close()
+
+
+# ------------------------------
+# 1. Wire format
+# ------------------------------
+def test_reverse_names():
+    assert rdns.reverse_name("8.8.4.4") == "4.4.8.8.in-addr.arpa"
+    assert rdns.reverse_name("2001:db8::1").endswith(".8.b.d.0.1.0.0.2.ip6.arpa")
+
+def test_parse_nameserver():
+    assert rdns.parse_nameserver("10.0.0.2") == ("10.0.0.2", 53)
+    assert rdns.parse_nameserver("127.0.0.1:5353") == ("127.0.0.1", 5353)
+    assert rdns.parse_nameserver("[::1]:5353") == ("::1", 5353)
+
+def test_parse_rejects_mismatched_id():
+    query = rdns.build_query(7, "4.4.8.8.in-addr.arpa")
+    response = struct.pack("!H", 8) + struct.pack("!H", 0x8180) + query[4:]
+    try:
+        rdns.parse_response(response, 7)
+        assert False, "expected DNSError"
+    except rdns.DNSError:
+        pass
+
+
+# ------------------------------
+# 2. Resolver
+# ------------------------------
+def test_resolves_and_caches_with_ttl():
+    server = StubDNS({"4.4.8.8.in-addr.arpa": ("ptr", "dns.google", 1)})
+    try:
+        resolver = rdns.Resolver(nameserver=server.address, timeout=1)
+        assert resolver.lookup("8.8.4.4") == "dns.google"
+        assert resolver.lookup("8.8.4.4") == "dns.google"
+        assert len(server.queries) == 1
+        time.sleep(1.1)
+        assert resolver.lookup("8.8.4.4") == "dns.google"
+        assert len(server.queries) == 2
+    finally:
+        server.close()
+
+def test_missing_ptr_is_cached_for_the_soa_minimum():
+    server = StubDNS({})
+    try:
+        resolver = rdns.Resolver(nameserver=server.address, negative_ttl=300)
+        assert resolver.lookup("192.0.2.1") is None
+        assert resolver.lookup("192.0.2.1") is None
+        assert len(server.queries) == 1
+        stats = resolver.stats()
+        assert stats["not_found"] == 1 and stats["negative_hits"] == 1
+        expires_at = resolver._cache["192.0.2.1"][0]
+        assert expires_at - time.time() <= 60
+    finally:
+        server.close()
+
+def test_timeout_is_not_cached():
+    server = StubDNS({"1.1.1.1.in-addr.arpa": "drop"})
+    try:
+        resolver = rdns.Resolver(nameserver=server.address, timeout=0.1)
+        started = time.monotonic()
+        assert resolver.lookup("1.1.1.1") is None
+        assert time.monotonic() - started < 1
+        assert resolver.stats()["timeouts"] == 1
+        assert resolver.cached("1.1.1.1") == (False, None)
+    finally:
+        server.close()
+
+def test_batch_coalesces_and_bounds_concurrency():
+    records = {rdns.reverse_name(f"203.0.113.{i}"): ("ptr", f"host{i}.example", 60) for i in range(20)}
+    server = StubDNS(records)
+    try:
+        resolver = rdns.Resolver(nameserver=server.address, concurrency=4)
+        ips = [f"203.0.113.{i}" for i in range(20)]
+
+        async def run():
+            return await asyncio.gather(resolver.resolve_many(ips), resolver.resolve("203.0.113.3"))
+
+        names, single = asyncio.run(run())
+        assert names["203.0.113.7"] == "host7.example"
+        assert single == "host3.example"
+        assert len(server.queries) == 20
+        assert resolver.stats()["coalesced"] == 1
+    finally:
+        server.close()
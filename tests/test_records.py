@@ -0,0 +1,25 @@
+import records
+
+
+# ------------------------------
+# 1. pack / unpack
+# ------------------------------
+def test_round_trip_keeps_shape_and_order():
+    value = {"value": {"city": "Manila", "asn": "AS9299", "latitude": 14.6, "postal": None},
+             "fresh_until": 123.0, "error": None}
+    packed = records.pack(value)
+    assert isinstance(packed, records.Record)
+    assert not hasattr(packed, "__dict__")
+    unpacked = records.unpack(packed)
+    assert unpacked == value
+    assert list(unpacked["value"]) == ["city", "asn", "latitude", "postal"]
+
+def test_same_keys_share_a_class_and_strings():
+    a = records.pack({"city": "".join(["Fr", "ankfurt"]), "asn": "AS3320"})
+    b = records.pack({"city": "".join(["Frank", "furt"]), "asn": "AS3320"})
+    assert type(a) is type(b)
+    assert a.city is b.city
+
+def test_other_values_pass_through():
+    for value in (1, None, [1, {"a": 1}], {"not an identifier": 1}, {1: "x"}):
+        assert records.pack(value) == value